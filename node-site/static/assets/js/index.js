@@ -231,7 +231,7 @@ async function showPaperDetails(paperId) {
         document.getElementById('viewer-tab').classList.add('active');
 
         // 设置 PDF iframe
-        document.getElementById('pdf-frame').src = `http://localhost:8000/uploads/${encodeURIComponent(paper.filename || paper.original_filename)}`;
+        document.getElementById('pdf-frame').src = `http://localhost:8000/api/papers/${paper.id}/file`;
 
         // --- 更新填充逻辑 ---
         // 核心信息 (合并后的视图)
@@ -306,23 +306,88 @@ document.addEventListener('DOMContentLoaded', () => {
   });
 
 // 加载聊天历史
+const CHAT_HISTORY_PAGE_SIZE = 20;
+
+function chatHistoryUrl(paperId, before = null) {
+    // 不带图表载荷，带图的记录在展开时单独拉取
+    let url = `http://localhost:8000/api/papers/${paperId}/chat/history?user_id=${user_id}`
+        + `&limit=${CHAT_HISTORY_PAGE_SIZE}&include_diagram=false`;
+    if (before !== null) url += `&before=${before}`;
+    return url;
+}
+
+// 把一页记录（接口按时间倒序返回）按正序插入到 anchor 之前；anchor 为空时追加到末尾
+function renderChatPage(page, anchor = null) {
+    const chats = page.items.slice().reverse();
+    chats.forEach(chat => {
+        const questionDiv = addMessage(chat.question, 'user');
+        const answerDiv = addMessage(chat.answer, 'assistant', false, chat.id);
+        if (anchor) {
+            chatMessages.insertBefore(questionDiv, anchor);
+            chatMessages.insertBefore(answerDiv, anchor);
+        }
+    });
+}
+
+// 顶部的“加载更早的记录”按钮
+function renderLoadMore(paperId, nextCursor) {
+    const oldButton = chatMessages.querySelector('.chat-load-more');
+    if (oldButton) oldButton.remove();
+    if (nextCursor === null || nextCursor === undefined) return;
+
+    const button = document.createElement('button');
+    button.className = 'btn-action chat-load-more';
+    button.textContent = '加载更早的记录';
+    button.addEventListener('click', async () => {
+        button.disabled = true;
+        try {
+            const response = await fetch(chatHistoryUrl(paperId, nextCursor));
+            const page = await response.json();
+            // 保持当前可见位置不跳动
+            const previousHeight = chatMessages.scrollHeight;
+            renderChatPage(page, button.nextSibling);
+            renderLoadMore(paperId, page.next_cursor);
+            chatMessages.scrollTop = chatMessages.scrollHeight - previousHeight;
+        } catch (error) {
+            console.error('加载更早的聊天记录失败:', error);
+            button.disabled = false;
+        }
+    });
+    chatMessages.insertBefore(button, chatMessages.firstChild);
+}
+
 async function loadChatHistory(paperId) {
     try {
-        const response = await fetch(`http://localhost:8000/api/papers/${paperId}/chat/history?user_id=${user_id}`);
-        const chats = await response.json();
+        const response = await fetch(chatHistoryUrl(paperId));
+        const page = await response.json();
 
-        if (chats.length > 0) {
+        if (page.items.length > 0) {
             chatMessages.innerHTML = '';
-            chats.forEach(chat => {
-                addMessage(chat.question, 'user');
-                addMessage(chat.answer, 'assistant');
-            });
+            renderChatPage(page);
+            renderLoadMore(paperId, page.next_cursor);
+            chatMessages.scrollTop = chatMessages.scrollHeight;
         }
     } catch (error) {
         console.error('加载聊天历史失败:', error);
     }
 }
 
+// 历史记录中被省略的图表：点击后单独拉取并替换该条消息
+async function loadChatDiagram(paperId, chatId, data, messageDiv) {
+    try {
+        const response = await fetch(
+            `http://localhost:8000/api/papers/${paperId}/chat/${chatId}/diagram?user_id=${user_id}`);
+        const result = await response.json();
+        if (!response.ok || !result.diagram) throw new Error(result.detail || '图表不存在');
+        const fullDiv = addMessage(JSON.stringify({ ...data, diagram: result.diagram, has_diagram: false }),
+            'assistant', false, chatId);
+        messageDiv.replaceWith(fullDiv);
+    } catch (error) {
+        console.error('加载图表失败:', error);
+        showNotification('加载图表失败，请稍后重试', 'error');
+    }
+}
+
 // 发送消息
 async function sendMessage() {
     const chatInput = document.getElementById('chat-input');
@@ -368,7 +433,7 @@ async function sendMessage() {
 }
 
 // // 添加消息到聊天界面
-// function addMessage(content, sender, isLoading = false) {
+// function addMessage(content, sender, isLoading = false, chatId = null) {
 //     const chatMessages = document.getElementById('chat-messages'); //确保每次重新获取
 //     const messageDiv = document.createElement('div');
 //     messageDiv.className = `message ${sender}`;
@@ -388,7 +453,7 @@ async function sendMessage() {
 //修改addmessage函数，解析问答返回的json，并且对有图像和没图像进行处理
 // 添加消息到聊天界面
 // --- 修改：addMessage 函数，增加“放大”按钮和直接的事件绑定 ---
-function addMessage(content, sender, isLoading = false) {
+function addMessage(content, sender, isLoading = false, chatId = null) {
     const chatMessages = document.getElementById('chat-messages');
     const messageDiv = document.createElement('div');
     messageDiv.className = `message ${sender}`;
@@ -450,6 +515,19 @@ function addMessage(content, sender, isLoading = false) {
                 messageContentHTML = `<div class="message-content">${marked.parse(data.answer || content)}</div>`;
                 messageDiv.innerHTML = messageContentHTML;
                 chatMessages.appendChild(messageDiv);
+
+                // 历史记录中省略了图表载荷，提供按需加载
+                if (data.has_diagram && chatId !== null) {
+                    const diagramBtn = document.createElement('button');
+                    diagramBtn.className = 'btn-action btn-load-diagram';
+                    diagramBtn.innerHTML = '<i class="fas fa-project-diagram"></i> 显示图表';
+                    diagramBtn.addEventListener('click', () => {
+                        diagramBtn.disabled = true;
+                        loadChatDiagram(currentPaper, chatId, data, messageDiv)
+                            .finally(() => { diagramBtn.disabled = false; });
+                    });
+                    messageDiv.querySelector('.message-content').appendChild(diagramBtn);
+                }
             }
         } catch (e) {
             messageContentHTML = `<div class="message-content">${marked.parse(content)}</div>`;
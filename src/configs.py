@@ -2,5 +2,91 @@ import os
 
 BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
 
-DATA_DIR = os.path.abspath(os.path.join(BACKEND_DIR, "..", "data"))
+# 数据目录（数据库、上传文件、解析结果、向量索引）；压测等场景可指向临时目录
+DATA_DIR = os.path.abspath(os.getenv("DATA_DIR", os.path.join(BACKEND_DIR, "..", "data")))
 os.makedirs(DATA_DIR, exist_ok=True)
+
+# ======================== 执行器并发配置 ========================
+# 解析（CPU 密集，hi_res 版面分析 + OCR）使用进程池
+PARSE_MAX_WORKERS = int(os.getenv("PARSE_MAX_WORKERS", "2"))
+# 向量化（CPU 密集，但 torch 会释放 GIL）使用线程池
+EMBED_MAX_WORKERS = int(os.getenv("EMBED_MAX_WORKERS", "2"))
+# LLM / HTTP 调用（IO 密集）
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+# LLM 单次调用超时与重试
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+
+# ======================== 调度与配额 ========================
+# 同时运行的分析任务数（全局）
+ANALYSIS_MAX_CONCURRENT_JOBS = int(os.getenv("ANALYSIS_MAX_CONCURRENT_JOBS", "2"))
+# 每个用户同时排队/运行的分析任务上限
+USER_MAX_ACTIVE_JOBS = int(os.getenv("USER_MAX_ACTIVE_JOBS", "5"))
+# 每个用户在滑动窗口内可消耗的 LLM token 数
+USER_TOKEN_QUOTA = int(os.getenv("USER_TOKEN_QUOTA", "500000"))
+USER_TOKEN_WINDOW_SECONDS = int(os.getenv("USER_TOKEN_WINDOW_SECONDS", "3600"))
+
+# ======================== 分析任务队列 ========================
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "120"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+
+# ======================== 图表 / 页面渲染缓存 ========================
+RENDER_MAX_WORKERS = int(os.getenv("RENDER_MAX_WORKERS", "2"))
+FIGURE_CACHE_MAX_BYTES = int(os.getenv("FIGURE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+PAGE_CACHE_MAX_BYTES = int(os.getenv("PAGE_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+# ======================== 启动预热 ========================
+# 启动后在后台线程中导入 LangChain、向量模型等重量级依赖；关闭时首次使用才导入
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1") == "1"
+
+# ======================== 向量模型 ========================
+# 后端：torch（sentence-transformers 原模型）、torch-int8（动态 int8 量化）、onnx（ONNX Runtime，优先使用量化模型）
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+# 单个向量化调用使用的 CPU 线程数；0 表示使用库的默认值
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+EMBEDDING_ONNX_DIR = os.getenv("EMBEDDING_ONNX_DIR", os.path.join(DATA_DIR, "models", "embedding-onnx"))
+
+# ======================== 问答语义缓存 ========================
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+# 问题向量余弦相似度不低于该值时直接返回已有回答
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.93"))
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+# 每篇论文最多缓存的问答数
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "500"))
+
+# ======================== 空闲预生成 ========================
+# worker 没有待领取的分析任务时，为已完成分析的论文预生成常用图表和回答
+PRECOMPUTE_ENABLED = os.getenv("PRECOMPUTE_ENABLED", "1") == "1"
+# 预生成失败后的重试：第 n 次失败后等待 PRECOMPUTE_RETRY_BASE_SECONDS * 2^(n-1)，失败 PRECOMPUTE_MAX_ATTEMPTS 次后不再重试
+PRECOMPUTE_MAX_ATTEMPTS = int(os.getenv("PRECOMPUTE_MAX_ATTEMPTS", "5"))
+PRECOMPUTE_RETRY_BASE_SECONDS = int(os.getenv("PRECOMPUTE_RETRY_BASE_SECONDS", "300"))
+
+# ======================== 向量索引版本 ========================
+# 索引替换后旧版本目录保留的时间（其他进程可能仍在使用），之后由重建命令清理
+INDEX_RETIRE_SECONDS = int(os.getenv("INDEX_RETIRE_SECONDS", "3600"))
+
+# ======================== 存储管理 ========================
+STORAGE_MAX_WORKERS = int(os.getenv("STORAGE_MAX_WORKERS", "2"))
+# 单个用户的磁盘配额（上传文件 + 解析结果 + 向量索引），0 表示不限制
+USER_DISK_QUOTA_BYTES = int(os.getenv("USER_DISK_QUOTA_BYTES", str(2 * 1024 * 1024 * 1024)))
+# 超过该天数未访问的论文，其向量索引压缩归档
+INDEX_ARCHIVE_IDLE_DAYS = int(os.getenv("INDEX_ARCHIVE_IDLE_DAYS", "30"))
+# 最近修改过的文件不视为孤儿（可能是上传中、尚未写入数据库的论文）
+ORPHAN_GRACE_SECONDS = int(os.getenv("ORPHAN_GRACE_SECONDS", "3600"))
+
+# ======================== 大文件流式解析 ========================
+# 页数达到该值的 PDF 按页窗口流式解析，章节和全文边解析边写入 parsed.epk
+STREAM_PARSE_MIN_PAGES = int(os.getenv("STREAM_PARSE_MIN_PAGES", "120"))
+STREAM_WINDOW_PAGES = int(os.getenv("STREAM_WINDOW_PAGES", "20"))
+# 单个任务的内存上限（MB，按任务开始后新增的进程常驻内存计）：解析时超出则缩小页窗口，元素入库和向量化时超出则批次减半，
+# 最小窗口 / 批次仍超出则放弃；0 表示不限制
+PARSE_MEMORY_LIMIT_MB = int(os.getenv("PARSE_MEMORY_LIMIT_MB", "3072"))
+# 构建向量索引时每批写入的分块数
+INDEX_BATCH_SIZE = int(os.getenv("INDEX_BATCH_SIZE", "256"))
+
+# ======================== 外部服务 ========================
+# Semantic Scholar Graph API 地址；压测时指向本地替身服务
+S2_API_BASE = os.getenv("S2_API_BASE", "https://api.semanticscholar.org/graph/v1")
@@ -1,11 +1,13 @@
+import asyncio
 import os
 import warnings
 
-from configs import DATA_DIR
+from configs import DATA_DIR, WARMUP_ON_STARTUP
 
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv, find_dotenv
 from contextlib import asynccontextmanager
@@ -17,17 +19,29 @@ load_dotenv(find_dotenv())
 # 本地模块
 from routes.paper_routes import router as paper_router
 from routes.user_routes import router as user_router
-from models.db import engine, Base
+from routes.storage_routes import router as storage_router
+from models.db import init_db
+from services.executors import embed_executor, executor_stats, shutdown_executors
+from services.llm_gateway import llm_gateway
+from services.scheduler import QuotaExceeded, scheduler_stats
+from services.warmup import warm_up
+from services.answer_cache import answer_cache
+from services.storage import StorageQuotaExceeded
 
 
 # ======================== lifespan 生命周期 ========================
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # startup
-    Base.metadata.create_all(bind=engine)
+    await init_db()
     print("[DB] 数据库初始化完成")
+    if WARMUP_ON_STARTUP:
+        # 重量级依赖在后台线程中导入，服务无需等待即可响应用户、列表等接口
+        app.state.warmup_task = asyncio.create_task(embed_executor.run(warm_up))
     yield
     # shutdown
+    shutdown_executors()
+    llm_gateway.shutdown()
     print("[DB] 数据库应用已关闭")
 
 
@@ -51,6 +65,35 @@ app.add_middleware(
 
 app.include_router(paper_router,prefix="/api")
 app.include_router(user_router,prefix="/api")
+app.include_router(storage_router,prefix="/api")
+
+# 超出用户配额：429 + Retry-After
+@app.exception_handler(QuotaExceeded)
+async def quota_exceeded_handler(request: Request, exc: QuotaExceeded):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": exc.detail},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+# 超出磁盘配额：413
+@app.exception_handler(StorageQuotaExceeded)
+async def storage_quota_exceeded_handler(request: Request, exc: StorageQuotaExceeded):
+    return JSONResponse(status_code=413, content={"detail": exc.detail})
+
+
+# 健康检查：不经过任何执行器，解析/向量化期间也能立即响应
+@app.get("/api/health")
+async def health():
+    return {
+        "status": "ok",
+        "executors": executor_stats(),
+        "llm": llm_gateway.stats(),
+        "scheduler": scheduler_stats(),
+        "answer_cache": answer_cache.stats(),
+    }
+
 
 app.mount("/uploads", StaticFiles(directory=os.path.join(DATA_DIR, "uploads")), name="Uploads")
 
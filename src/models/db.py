@@ -1,7 +1,8 @@
 # src/models/db.py
 
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from configs import DATA_DIR
 from contextlib import contextmanager
@@ -12,11 +13,31 @@ DB_PATH = os.path.join(DATA_DIR, "Esasy.db")
 os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
 
 DATABASE_URL = f"sqlite:///{DB_PATH}"
+ASYNC_DATABASE_URL = f"sqlite+aiosqlite:///{DB_PATH}"
 print("[DB] 正在使用数据库：", DB_PATH)
 
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 异步引擎：路由均为 async def，查询和 commit 不能阻塞事件循环
+async_engine = create_async_engine(ASYNC_DATABASE_URL, connect_args={"timeout": 30})
+# expire_on_commit=False：commit 后仍可直接读取属性，避免异步场景下的隐式懒加载
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+
+def _set_sqlite_pragma(dbapi_connection, connection_record):
+    """WAL 模式下读请求不会被正在提交的写事务阻塞"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+
+event.listen(engine, "connect", _set_sqlite_pragma)
+event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragma)
+
 # 添加 Base 对象
 Base = declarative_base()
 
@@ -26,3 +47,14 @@ def get_db_session():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db_session():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def init_db():
+    """建表（异步引擎）"""
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
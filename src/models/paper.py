@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index, UniqueConstraint, DDL, event
 from datetime import datetime
 from models.db import Base
 
@@ -35,4 +35,108 @@ class ChatSession(Base):
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     question = Column(Text, nullable=False)
     answer = Column(Text, nullable=False)
-    timestamp = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    timestamp = Column(DateTime, default=datetime.utcnow)
+
+    # 聊天历史按 (paper_id, user_id) 过滤、按 id 倒序游标分页
+    __table_args__ = (
+        Index("ix_chat_sessions_paper_user_id", "paper_id", "user_id", "id"),
+    )
+
+
+class PaperArtifact(Base):
+    """空闲时预先生成的常用回答/图表（关键内容思维导图、方法流程图、主要贡献），内容为 {answer, diagram} JSON"""
+    __tablename__ = "paper_artifacts"
+
+    id = Column(Integer, primary_key=True, index=True)
+    paper_id = Column(Integer, ForeignKey('papers.id'), nullable=False)
+    kind = Column(String(50), nullable=False)
+    payload = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("paper_id", "kind", name="uq_paper_artifacts_paper_kind"),
+    )
+
+
+class PrecomputeFailure(Base):
+    """预生成失败记录：按失败次数指数退避重试，超过上限后不再尝试；论文重新分析时清除"""
+    __tablename__ = "precompute_failures"
+
+    paper_id = Column(Integer, ForeignKey('papers.id'), primary_key=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+    retry_after = Column(DateTime, nullable=False)
+
+
+class PaperElement(Base):
+    """解析得到的论文元素（章节段落、表格、公式、参考文献），用于论文内全文检索"""
+    __tablename__ = "paper_elements"
+
+    id = Column(Integer, primary_key=True, index=True)
+    paper_id = Column(Integer, ForeignKey('papers.id'), nullable=False)
+    kind = Column(String(20), nullable=False)  # paragraph / table / formula / reference
+    section = Column(Text)
+    ordinal = Column(Integer, nullable=False)  # 同一论文内按出现顺序编号
+    page = Column(Integer, nullable=True)
+    text = Column(Text, nullable=False)
+
+    __table_args__ = (
+        Index("ix_paper_elements_paper_kind_ordinal", "paper_id", "kind", "ordinal"),
+    )
+
+
+# FTS5 外部内容表：索引 paper_elements.text，由触发器保持同步
+# - trigram 分词：中文没有空格分词，unicode61 会把整段中文当成一个词，trigram 可匹配任意 ≥3 字符的子串
+# - paper 列存 "<p{paper_id}>"（同 library_fts 的 owner 列），在索引内按论文过滤，而不是先匹配全库再过滤；
+#   尖括号作为边界，避免 <p1> 匹配到 <p12>
+# - 外部内容来源为视图，以便 paper 列由 paper_id 计算得出
+_ELEMENT_FTS_SQL = """CREATE VIRTUAL TABLE paper_elements_fts USING fts5(
+    text, paper, content='paper_elements_fts_source', content_rowid='id', tokenize='trigram'
+)"""
+_ELEMENT_FTS_STATEMENTS = [
+    """CREATE VIEW IF NOT EXISTS paper_elements_fts_source AS
+        SELECT id, text, '<p' || paper_id || '>' AS paper FROM paper_elements""",
+    _ELEMENT_FTS_SQL,
+    """CREATE TRIGGER paper_elements_ai AFTER INSERT ON paper_elements BEGIN
+        INSERT INTO paper_elements_fts(rowid, text, paper) VALUES (new.id, new.text, '<p' || new.paper_id || '>');
+    END""",
+    """CREATE TRIGGER paper_elements_ad AFTER DELETE ON paper_elements BEGIN
+        INSERT INTO paper_elements_fts(paper_elements_fts, rowid, text, paper)
+        VALUES ('delete', old.id, old.text, '<p' || old.paper_id || '>');
+    END""",
+    """CREATE TRIGGER paper_elements_au AFTER UPDATE ON paper_elements BEGIN
+        INSERT INTO paper_elements_fts(paper_elements_fts, rowid, text, paper)
+        VALUES ('delete', old.id, old.text, '<p' || old.paper_id || '>');
+        INSERT INTO paper_elements_fts(rowid, text, paper) VALUES (new.id, new.text, '<p' || new.paper_id || '>');
+    END""",
+    # 已有元素（包括从旧版 unicode61 索引迁移时）重新建立索引
+    "INSERT INTO paper_elements_fts(paper_elements_fts) VALUES ('rebuild')",
+]
+
+
+def _ensure_element_fts(target, connection, **kw):
+    """每次 create_all 时检查：索引不存在或仍是旧结构时（重新）创建并重建索引"""
+    existing = connection.exec_driver_sql(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'paper_elements_fts'"
+    ).scalar()
+    if existing is not None and " ".join(existing.split()) == " ".join(_ELEMENT_FTS_SQL.split()):
+        return
+    for name in ("paper_elements_ai", "paper_elements_ad", "paper_elements_au"):
+        connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {name}")
+    connection.exec_driver_sql("DROP TABLE IF EXISTS paper_elements_fts")
+    for statement in _ELEMENT_FTS_STATEMENTS:
+        connection.exec_driver_sql(statement)
+
+
+event.listen(Base.metadata, "after_create", _ensure_element_fts)
+
+
+# 全库检索倒排索引（FTS5），每篇论文一行；owner 列存 "u{user_id}" 以便在索引内按用户过滤
+library_fts_ddl = DDL(
+    """CREATE VIRTUAL TABLE IF NOT EXISTS library_fts USING fts5(
+        title, abstract, summary, body, owner, paper_id UNINDEXED,
+        tokenize='unicode61 remove_diacritics 2'
+    )"""
+)
+# 挂在 metadata 上：每次 create_all 都会执行（IF NOT EXISTS），已有数据库也能补建
+event.listen(Base.metadata, "after_create", library_fts_ddl)
@@ -0,0 +1,20 @@
+from sqlalchemy import BigInteger, Column, DateTime, ForeignKey, Integer
+from datetime import datetime
+from models.db import Base
+
+
+class PaperStorage(Base):
+    """单篇论文各类产物的磁盘占用和最近访问时间，用于磁盘配额、冷归档和用量统计"""
+    __tablename__ = "paper_storage"
+
+    paper_id = Column(Integer, ForeignKey('papers.id'), primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
+
+    upload_bytes = Column(BigInteger, nullable=False, default=0)
+    parsed_bytes = Column(BigInteger, nullable=False, default=0)
+    index_bytes = Column(BigInteger, nullable=False, default=0)
+    archive_bytes = Column(BigInteger, nullable=False, default=0)
+
+    last_accessed_at = Column(DateTime, default=datetime.utcnow)
+    archived_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
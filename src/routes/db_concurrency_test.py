@@ -0,0 +1,83 @@
+# 运行此脚本可以测试：某个请求正在提交写事务时，列表和聊天历史请求不会被阻塞
+# 用法（在 src 目录下）：python -m routes.db_concurrency_test
+
+import asyncio
+import os
+import tempfile
+import time
+
+import httpx
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+from main import app
+from models.db import Base, get_async_db_session, _set_sqlite_pragma
+from models.paper import Paper, ChatSession
+from models.user import User
+
+WRITE_HOLD_SECONDS = 2.0    # 写事务持有时长（模拟慢 commit）
+READ_LATENCY_LIMIT = 0.5    # 读请求允许的最大耗时
+READ_ROUNDS = 5
+
+
+async def main():
+    tmp_dir = tempfile.mkdtemp()
+    engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(tmp_dir, 'test.db')}")
+    event.listen(engine.sync_engine, "connect", _set_sqlite_pragma)
+    session_maker = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def override_session():
+        async with session_maker() as db:
+            yield db
+
+    app.dependency_overrides[get_async_db_session] = override_session
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    async with session_maker() as db:
+        db.add(User(id=1, username="tester", email="tester@example.com"))
+        db.add(Paper(id=1, filename="a.pdf", original_filename="a.pdf", file_path="a.pdf", user_id=1))
+        for i in range(50):
+            db.add(ChatSession(paper_id=1, user_id=1, question=f"q{i}", answer='{"answer": "a", "diagram": null}'))
+        await db.commit()
+
+    async def slow_writer():
+        async with session_maker() as db:
+            db.add(ChatSession(paper_id=1, user_id=1, question="slow", answer='{"answer": "slow"}'))
+            await db.flush()  # 此时已持有写锁
+            await asyncio.sleep(WRITE_HOLD_SECONDS)
+            await db.commit()
+
+    async def timed_get(client: httpx.AsyncClient, url: str) -> float:
+        start = time.perf_counter()
+        response = await client.get(url)
+        response.raise_for_status()
+        return time.perf_counter() - start
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        writer = asyncio.create_task(slow_writer())
+        await asyncio.sleep(0.1)  # 确保写事务已开始
+
+        latencies = []
+        for _ in range(READ_ROUNDS):
+            latencies += await asyncio.gather(
+                timed_get(client, "/api/papers/?user_id=1"),
+                timed_get(client, "/api/papers/1/chat/history?user_id=1"),
+            )
+        writer_done = writer.done()
+        await writer
+
+    app.dependency_overrides.clear()
+    await engine.dispose()
+
+    worst = max(latencies)
+    print(f"[TEST] 读请求 {len(latencies)} 次，最大耗时 {worst * 1000:.1f} ms，期间写事务已完成: {writer_done}")
+    assert not writer_done, "写事务在读请求结束前已完成，无法验证并发"
+    assert worst < READ_LATENCY_LIMIT, f"读请求被阻塞：{worst:.3f}s >= {READ_LATENCY_LIMIT}s"
+    print("[TEST] 通过：提交期间列表和聊天历史请求未被阻塞")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
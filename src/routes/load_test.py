@@ -0,0 +1,537 @@
+# 运行此脚本可以对整个 FastAPI 应用做并发压测，得到各并发级别下的延迟、错误率和事件循环延迟（饱和曲线）
+# 用法（在 src 目录下）：
+#   python -m routes.load_test [--levels 1,2,4,8,16,32] [--duration 30] [--llm-latency 0.8]
+#                              [--mix upload=1,analyze=1,chat=4,history=3,list=3] [--output result.json]
+#                              [--compare baseline.json]
+# - 请求经 httpx.ASGITransport 直接送入 main.app，与应用共用一个事件循环，可测量事件循环延迟
+# - LLM 替换为带可配置延迟的假实现（仍经过 llm_gateway，并发上限和统计照常生效）
+# - Semantic Scholar 替换为本地替身服务（S2_API_BASE 指向本进程内的 HTTP 服务）
+# - 默认使用假解析器（PyMuPDF 逐页取文本），--real-parser 时使用正式解析器
+# - 数据目录默认为临时目录，结束后删除；每个虚拟用户对应一个独立 user_id
+# 结果 JSON 可用 --compare 与上一版本的结果对比
+
+import os
+import tempfile
+
+# 以下环境变量须在导入 configs 之前设置；解析子进程继承同一数据目录
+_CREATED_DATA_DIR = None
+if "DATA_DIR" not in os.environ:
+    _CREATED_DATA_DIR = tempfile.mkdtemp(prefix="essay_load_")
+    os.environ["DATA_DIR"] = _CREATED_DATA_DIR
+os.environ.setdefault("WARMUP_ON_STARTUP", "0")
+os.environ.setdefault("PRECOMPUTE_ENABLED", "0")
+
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import importlib
+import json
+import random
+import shutil
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+import requests
+
+from main import app
+from models.db import AsyncSessionLocal, init_db
+from models.user import User
+from services import analysis_pipeline, warmup
+from services.llm_gateway import llm_gateway
+
+ENDPOINTS = ["upload", "analyze", "chat", "history", "list"]
+DEFAULT_MIX = "upload=1,analyze=1,chat=4,history=3,list=3"
+DEFAULT_PDF = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "services", "TEST_PDF.pdf")
+QUESTIONS = [
+    "这篇论文的主要贡献是什么？",
+    "请解释一下文中提出的方法",
+    "实验用了哪些数据集？",
+    "画个流程图说明方法步骤",
+    "这项工作有哪些局限性？",
+]
+LOOP_LAG_INTERVAL = 0.05
+# 吞吐增幅低于该比例、或 p95 较上一级翻倍时视为达到饱和
+SATURATION_GAIN = 0.10
+
+_emit = print  # 压测期间应用日志被静默，报告经此输出到原始 stdout
+
+
+# ======================== 本地 Semantic Scholar 替身 ========================
+class _S2StandIn(BaseHTTPRequestHandler):
+    latency = 0.2
+    miss_rate = 0.2
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, payload: Any):
+        time.sleep(self.latency)
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    @staticmethod
+    def _paper(seed: str) -> Dict[str, Any]:
+        paper_id = hashlib.sha1(seed.encode("utf-8")).hexdigest()[:16]
+        return {"paperId": paper_id, "title": f"Paper {paper_id}", "year": 2020,
+                "abstract": f"Abstract of {seed}. " * 5, "publicationDate": "2020-01-01", "citationCount": 10}
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        if parts[-1:] == ["search"]:
+            query = parse_qs(url.query).get("query", [""])[0]
+            self._send({"total": 1, "data": [{**self._paper(query), "title": query}]})
+        elif parts[-1:] in (["references"], ["citations"]):
+            key = "citedPaper" if parts[-1] == "references" else "citingPaper"
+            self._send({"data": [{key: self._paper(f"{parts[-2]}-{i}")} for i in range(10)]})
+        else:
+            self._send(self._paper(url.path))
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        ids = json.loads(self.rfile.read(length) or b"{}").get("ids", [])
+        # 一部分 id 查不到，返回 null，与真实接口一致
+        self._send([None if random.random() < self.miss_rate else self._paper(paper_id) for paper_id in ids])
+
+
+def start_s2_stand_in(latency: float) -> ThreadingHTTPServer:
+    _S2StandIn.latency = latency
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _S2StandIn)
+    threading.Thread(target=server.serve_forever, name="s2-stand-in", daemon=True).start()
+    return server
+
+
+# ======================== 假 LLM / 假解析器 ========================
+class FakeAIService:
+    """
+    与 AIService 接口一致的假实现：LLM 调用按配置延迟休眠后返回固定文本，
+    仍经过 llm_gateway（并发上限、统计）；S2 请求发往本地替身服务
+    """
+
+    def __init__(self, latency: float, jitter: float, chat_calls: int, embed_seconds_per_chunk: float, s2_api_base: str):
+        self.latency = latency
+        self.jitter = jitter
+        self.chat_calls = chat_calls
+        self.embed_seconds_per_chunk = embed_seconds_per_chunk
+        self.s2_api_base = s2_api_base
+        self.prompt_tokens: Dict[str, int] = {}
+        self._rng = random.Random()
+
+    def _llm(self, call_site: str, *args) -> str:
+        delay = self.latency * self._rng.uniform(1 - self.jitter, 1 + self.jitter)
+
+        def call():
+            time.sleep(max(0.0, delay))
+            return f"[{call_site}] fake output"
+
+        self.prompt_tokens[call_site] = sum(len(str(arg)) for arg in args) // 4
+        return llm_gateway.run(call_site, call)
+
+    def generate_summary(self, *args) -> str:
+        return self._llm("summary", *args)
+
+    def extract_key_content(self, *args) -> str:
+        return self._llm("key_content", *args)
+
+    def translate_text(self, *args) -> str:
+        return self._llm("translation", *args)
+
+    def explain_terminology(self, *args) -> str:
+        return self._llm("terminology", *args)
+
+    def analyze_research_context(self, *args) -> str:
+        return self._llm("research_context", *args)
+
+    def fetch_related_papers(self, title: str) -> Dict[str, Any]:
+        found = requests.get(f"{self.s2_api_base}/paper/search", params={"query": title}, timeout=15).json()
+        s2_id = found["data"][0]["paperId"]
+        references = requests.get(f"{self.s2_api_base}/paper/{s2_id}/references", timeout=15).json()
+        citations = requests.get(f"{self.s2_api_base}/paper/{s2_id}/citations", timeout=15).json()
+        return {"s2_id": s2_id, "related_papers_json": json.dumps(
+            {"references": references["data"], "citations": citations["data"]}, ensure_ascii=False)}
+
+    def setup_rag_from_parsed(self, parsed_data: Dict[str, Any], extra_texts: List[str], paper_id: int,
+                              user_id: Optional[int] = None, sections=None) -> bool:
+        # 按正文字符数估算分块数，向量化耗时与分块数成正比
+        sections = parsed_data.get("sections", []) if sections is None else sections
+        chars = sum(len(text) for section in sections for text in section.get("content", []))
+        chunks = chars // 1200 + len(extra_texts or [])
+        time.sleep(chunks * self.embed_seconds_per_chunk)
+        return True
+
+    def agentic_answer(self, question: str, paper) -> Dict[str, Any]:
+        answer = ""
+        for i in range(self.chat_calls):
+            answer = self._llm("agent", question, i)
+        return {"answer": answer, "diagram": None}
+
+    def fast_answer(self, question: str, paper) -> Dict[str, Any]:
+        return {"answer": self._llm("fast_answer", question), "diagram": None}
+
+
+def fake_parse_job(paper_id: int, file_path: str) -> Dict[str, Any]:
+    """替代 parse_pdf_job（在解析进程池中执行）：PyMuPDF 逐页取文本，每页一节"""
+    import pymupdf
+    from services.parsed_store import parsed_path, write_parsed
+
+    seconds_per_page = float(os.getenv("LOAD_TEST_PARSE_SECONDS_PER_PAGE", "0.05"))
+    result = {"title": "", "authors": "", "abstract": "", "sections": [], "tables": [], "images": [],
+              "formulas": [], "formula_pages": [], "references": [], "reference_pages": [], "full_text": ""}
+    texts = []
+    with pymupdf.open(file_path) as doc:
+        for page_number, page in enumerate(doc, start=1):
+            text = page.get_text()
+            texts.append(text)
+            paragraphs = [p.strip() for p in text.split("\n\n") if p.strip()]
+            result["sections"].append({"title": f"Page {page_number}", "content": paragraphs,
+                                       "pages": [page_number] * len(paragraphs)})
+            time.sleep(seconds_per_page)
+    first_lines = texts[0].strip().splitlines() if texts else []
+    result["title"] = first_lines[0] if first_lines else os.path.basename(file_path)
+    result["abstract"] = texts[0][:1000] if texts else ""
+    result["full_text"] = "\n\n".join(texts)
+    # 一半条目带 arXiv 号（走批量精确查询），一半只有标题（逐条检索）
+    result["bibliography"] = [
+        {"label": str(i + 1), "doi": None, "arxiv_id": f"2001.{i:05d}" if i % 2 == 0 else None,
+         "year": 2020, "authors": ["A. Author"], "title": f"Referenced paper number {i}", "raw": ""}
+        for i in range(10)
+    ]
+    result["references"] = [f"[{i + 1}] A. Author. Referenced paper number {i}. 2020." for i in range(10)]
+    result["reference_pages"] = [None] * 10
+    write_parsed(result, parsed_path(paper_id))
+    return result
+
+
+def install_fakes(args, s2_api_base: str, real_parser: bool):
+    fake = FakeAIService(args.llm_latency, args.llm_jitter, args.chat_llm_calls, args.embed_seconds_per_chunk,
+                         s2_api_base)
+
+    def create_fake_ai_service():
+        return fake
+
+    # create_ai_service 以名字导入到各模块，逐个替换
+    original = warmup.create_ai_service
+    for module in list(sys.modules.values()):
+        if getattr(module, "create_ai_service", None) is original:
+            module.create_ai_service = create_fake_ai_service
+
+    # services.tools 中按标题检索参考文献的函数改为查询替身服务
+    tools = importlib.import_module("services.tools")
+
+    def build_rag_chunks_from_titles(titles):
+        chunks = []
+        for title in titles:
+            found = requests.get(f"{s2_api_base}/paper/search", params={"query": title}, timeout=15).json()
+            chunks.extend(f"Title: {paper['title']}\nAbstract: {paper['abstract']}" for paper in found["data"])
+        return chunks
+
+    tools.build_rag_chunks_from_titles = build_rag_chunks_from_titles
+
+    if not real_parser:
+        os.environ["LOAD_TEST_PARSE_SECONDS_PER_PAGE"] = str(args.parse_seconds_per_page)
+        # 进程池按模块名 pickle 函数，以 -m 运行时本模块名为 __main__，需从正式模块名取得
+        analysis_pipeline.parse_pdf_job = importlib.import_module("routes.load_test").fake_parse_job
+
+    from routes import paper_routes
+    paper_routes.ANSWER_CACHE_ENABLED = args.use_cache
+
+
+# ======================== 统计 ========================
+def percentile(values: List[float], q: float) -> float:
+    """最近秩百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {name: [] for name in ENDPOINTS}
+        self.errors: Dict[str, int] = {name: 0 for name in ENDPOINTS}
+        self.status_codes: Dict[str, Dict[int, int]] = {name: {} for name in ENDPOINTS}
+        # 每个接口保留第一条错误信息，便于定位
+        self.error_samples: Dict[str, str] = {}
+
+    async def timed(self, endpoint: str, request) -> Optional[httpx.Response]:
+        start = time.perf_counter()
+        response = None
+        try:
+            response = await request
+            ok = response.status_code < 400
+            codes = self.status_codes[endpoint]
+            codes[response.status_code] = codes.get(response.status_code, 0) + 1
+            error = None if ok else f"HTTP {response.status_code}: {response.text[:300]}"
+        except Exception as e:
+            ok = False
+            error = f"{type(e).__name__}: {e}"
+        self.latencies[endpoint].append(time.perf_counter() - start)
+        if not ok:
+            self.errors[endpoint] += 1
+            self.error_samples.setdefault(endpoint, error)
+        return response if ok else None
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        endpoints = {}
+        for name in ENDPOINTS:
+            values = self.latencies[name]
+            if not values:
+                continue
+            endpoints[name] = {
+                "count": len(values),
+                "errors": self.errors[name],
+                "error_rate": round(self.errors[name] / len(values), 4),
+                "p50_ms": round(percentile(values, 50) * 1000, 1),
+                "p95_ms": round(percentile(values, 95) * 1000, 1),
+                "p99_ms": round(percentile(values, 99) * 1000, 1),
+                "status_codes": {str(code): count for code, count in sorted(self.status_codes[name].items())},
+            }
+            if name in self.error_samples:
+                endpoints[name]["error_sample"] = self.error_samples[name]
+        all_values = [v for values in self.latencies.values() for v in values]
+        total_errors = sum(self.errors.values())
+        return {
+            "requests": len(all_values),
+            "rps": round(len(all_values) / elapsed, 2) if elapsed else 0.0,
+            "error_rate": round(total_errors / len(all_values), 4) if all_values else 0.0,
+            "p50_ms": round(percentile(all_values, 50) * 1000, 1),
+            "p95_ms": round(percentile(all_values, 95) * 1000, 1),
+            "p99_ms": round(percentile(all_values, 99) * 1000, 1),
+            "endpoints": endpoints,
+        }
+
+
+async def monitor_loop_lag(samples: List[float], stop: asyncio.Event):
+    """定时休眠，实际唤醒时间与预期之差即事件循环延迟"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        samples.append(max(0.0, time.perf_counter() - start - LOOP_LAG_INTERVAL))
+
+
+# ======================== 虚拟用户 ========================
+class VirtualUser:
+    def __init__(self, user_id: int, pdf_bytes: bytes, mix: Dict[str, float], seed: int):
+        self.user_id = user_id
+        self.pdf_bytes = pdf_bytes
+        self.ops = list(mix.keys())
+        self.weights = list(mix.values())
+        self.rng = random.Random(seed)
+        self.uploaded: List[int] = []   # 已上传、未分析
+        self.analyzed: List[int] = []   # 已分析完成
+
+    def _pick(self) -> str:
+        op = self.rng.choices(self.ops, self.weights)[0]
+        # 聊天、历史需要已分析的论文；分析需要已上传的论文
+        if op in ("chat", "history") and not self.analyzed:
+            op = "analyze"
+        if op == "analyze" and not self.uploaded:
+            op = "upload"
+        return op
+
+    async def step(self, client: httpx.AsyncClient, recorder: Recorder):
+        op = self._pick()
+        if op == "upload":
+            response = await recorder.timed("upload", client.post(
+                "/api/papers/upload",
+                files={"file": ("load_test.pdf", self.pdf_bytes, "application/pdf")},
+                data={"user_id": str(self.user_id)},
+            ))
+            if response is not None:
+                self.uploaded.append(response.json()["paper_id"])
+        elif op == "analyze":
+            paper_id = self.uploaded.pop(0)
+            response = await recorder.timed("analyze", client.post(f"/api/papers/{paper_id}/analyze"))
+            if response is not None:
+                self.analyzed.append(paper_id)
+        elif op == "chat":
+            await recorder.timed("chat", client.post(
+                f"/api/papers/{self.rng.choice(self.analyzed)}/chat",
+                json={"user_id": self.user_id, "question": self.rng.choice(QUESTIONS)},
+            ))
+        elif op == "history":
+            await recorder.timed("history", client.get(
+                f"/api/papers/{self.rng.choice(self.analyzed)}/chat/history",
+                params={"user_id": self.user_id, "include_diagram": "false"},
+            ))
+        else:
+            await recorder.timed("list", client.get("/api/papers/", params={"user_id": self.user_id}))
+
+    async def run(self, client: httpx.AsyncClient, recorder: Recorder, deadline: float, think_time: float):
+        while time.perf_counter() < deadline:
+            await self.step(client, recorder)
+            if think_time:
+                await asyncio.sleep(self.rng.uniform(0, 2 * think_time))
+
+
+async def run_level(client: httpx.AsyncClient, users: List[VirtualUser], duration: float,
+                    think_time: float) -> Dict[str, Any]:
+    recorder = Recorder()
+    lag_samples: List[float] = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(monitor_loop_lag(lag_samples, stop))
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*(user.run(client, recorder, deadline, think_time) for user in users))
+    # 进行中的请求在截止后才结束，按实际耗时计算吞吐
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await monitor
+
+    result = recorder.summary(elapsed)
+    result["concurrency"] = len(users)
+    result["elapsed_seconds"] = round(elapsed, 2)
+    result["loop_lag_ms"] = {
+        "p50": round(percentile(lag_samples, 50) * 1000, 1),
+        "p99": round(percentile(lag_samples, 99) * 1000, 1),
+        "max": round(max(lag_samples, default=0.0) * 1000, 1),
+    }
+    return result
+
+
+# ======================== 报告 ========================
+def print_level(result: Dict[str, Any]):
+    lag = result["loop_lag_ms"]
+    _emit(f"[LOAD] 并发 {result['concurrency']}: {result['requests']} 请求, {result['rps']} req/s, "
+          f"错误率 {result['error_rate'] * 100:.1f}%, 事件循环延迟 p50/p99/max "
+          f"{lag['p50']}/{lag['p99']}/{lag['max']} ms")
+    _emit(f"       {'endpoint':<10}{'count':>7}{'err%':>7}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for name, stats in result["endpoints"].items():
+        _emit(f"       {name:<10}{stats['count']:>7}{stats['error_rate'] * 100:>7.1f}"
+              f"{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}")
+    for name, stats in result["endpoints"].items():
+        if "error_sample" in stats:
+            _emit(f"       {name} 错误示例：{stats['error_sample']}")
+
+
+def find_saturation(levels: List[Dict[str, Any]]) -> Optional[int]:
+    """吞吐不再随并发明显增长、或 p95 翻倍的第一个并发级别"""
+    for previous, current in zip(levels, levels[1:]):
+        gain = (current["rps"] - previous["rps"]) / previous["rps"] if previous["rps"] else 0.0
+        if gain < SATURATION_GAIN or (previous["p95_ms"] and current["p95_ms"] > 2 * previous["p95_ms"]):
+            return current["concurrency"]
+    return None
+
+
+def print_curve(levels: List[Dict[str, Any]], baseline: Optional[Dict[str, Any]] = None):
+    base = {level["concurrency"]: level for level in (baseline or {}).get("levels", [])}
+    _emit("[LOAD] 饱和曲线")
+    _emit(f"       {'users':>6}{'req/s':>10}{'p95 ms':>10}{'p99 ms':>10}{'err%':>7}{'lag p99':>9}"
+          + (f"{'Δreq/s':>10}{'Δp95':>10}" if base else ""))
+    for level in levels:
+        line = (f"       {level['concurrency']:>6}{level['rps']:>10.2f}{level['p95_ms']:>10.1f}"
+                f"{level['p99_ms']:>10.1f}{level['error_rate'] * 100:>7.1f}{level['loop_lag_ms']['p99']:>9.1f}")
+        old = base.get(level["concurrency"])
+        if old:
+            line += f"{level['rps'] - old['rps']:>+10.2f}{level['p95_ms'] - old['p95_ms']:>+10.1f}"
+        _emit(line)
+    knee = find_saturation(levels)
+    _emit(f"[LOAD] 饱和点：{'并发 ' + str(knee) if knee else '未达到（可继续提高并发级别）'}")
+    if baseline:
+        _emit(f"[LOAD] 基准饱和点：{baseline.get('saturation') or '未达到'}")
+
+
+# ======================== 入口 ========================
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        if name.strip() not in ENDPOINTS:
+            raise SystemExit(f"未知的请求类型: {name}（可选 {', '.join(ENDPOINTS)}）")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+async def seed_users(count: int):
+    await init_db()
+    async with AsyncSessionLocal() as db:
+        for user_id in range(1, count + 1):
+            if await db.get(User, user_id) is None:
+                db.add(User(id=user_id, username=f"load{user_id}", email=f"load{user_id}@example.com"))
+        await db.commit()
+
+
+async def main(args):
+    levels = [int(level) for level in args.levels.split(",")]
+    mix = parse_mix(args.mix)
+    with open(args.pdf, "rb") as f:
+        pdf_bytes = f.read()
+
+    s2_server = start_s2_stand_in(args.s2_latency)
+    s2_api_base = f"http://127.0.0.1:{s2_server.server_port}/graph/v1"
+    install_fakes(args, s2_api_base, args.real_parser)
+    await seed_users(max(levels))
+
+    _emit(f"[LOAD] 数据目录 {os.environ['DATA_DIR']}，S2 替身 {s2_api_base}，"
+          f"LLM 延迟 {args.llm_latency}s±{args.llm_jitter * 100:.0f}%，请求比例 {mix}")
+
+    # 虚拟用户跨级别复用：已上传、已分析的论文在后续级别继续使用
+    users = [VirtualUser(user_id, pdf_bytes, mix, args.seed + user_id) for user_id in range(1, max(levels) + 1)]
+    results = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=args.timeout) as client:
+        for concurrency in levels:
+            quiet = open(os.devnull, "w") if not args.verbose else None
+            with contextlib.redirect_stdout(quiet) if quiet else contextlib.nullcontext():
+                result = await run_level(client, users[:concurrency], args.duration, args.think_time)
+            if quiet:
+                quiet.close()
+            print_level(result)
+            results.append(result)
+
+    s2_server.shutdown()
+    report = {
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "levels": results,
+        "saturation": find_saturation(results),
+        "llm_gateway": llm_gateway.stats(),
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_curve(results, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        _emit(f"[LOAD] 结果已写入 {args.output}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent-user load test for the FastAPI app")
+    parser.add_argument("--levels", default="1,2,4,8,16,32", help="逐级提高的并发用户数")
+    parser.add_argument("--duration", type=float, default=30.0, help="每个级别持续的秒数")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="各类请求的权重")
+    parser.add_argument("--think-time", type=float, default=0.5, help="用户两次请求之间的平均间隔（秒）")
+    parser.add_argument("--llm-latency", type=float, default=0.8, help="假 LLM 单次调用的平均延迟（秒）")
+    parser.add_argument("--llm-jitter", type=float, default=0.3, help="延迟的随机浮动比例")
+    parser.add_argument("--chat-llm-calls", type=int, default=2, help="每次聊天的 LLM 调用次数")
+    parser.add_argument("--embed-seconds-per-chunk", type=float, default=0.01)
+    parser.add_argument("--parse-seconds-per-page", type=float, default=0.05)
+    parser.add_argument("--s2-latency", type=float, default=0.2, help="S2 替身服务的响应延迟（秒）")
+    parser.add_argument("--real-parser", action="store_true", help="使用正式解析器（需完整解析依赖）")
+    parser.add_argument("--use-cache", action="store_true", help="启用问答语义缓存（会加载向量模型）")
+    parser.add_argument("--pdf", default=DEFAULT_PDF, help="上传使用的 PDF")
+    parser.add_argument("--timeout", type=float, default=600.0, help="单个请求超时（秒）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="保留应用日志输出")
+    parser.add_argument("--output", help="结果 JSON 路径")
+    parser.add_argument("--compare", help="与之前保存的结果 JSON 对比")
+    args = parser.parse_args()
+    try:
+        asyncio.run(main(args))
+    finally:
+        if _CREATED_DATA_DIR:
+            shutil.rmtree(_CREATED_DATA_DIR, ignore_errors=True)
@@ -1,26 +1,48 @@
+import asyncio
 import json
 import os
 import uuid
-from datetime import datetime
+from urllib.parse import quote
+from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends, Request
-from sqlalchemy.orm import Session
+from fastapi.responses import FileResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from models.db import get_db_session
+from models.db import get_async_db_session
 from models.paper import Paper, ChatSession
-from services.pdf_parser_pro import PDFParser
-from services.ai_service import AIService
+from services.analysis_pipeline import run_analysis_pipeline
+from services.answer_cache import lookup_answer, store_answer
+from services.precompute import get_precomputed
+from services.storage import check_disk_quota, delete_paper, refresh_usage, touch
+from services.job_queue import (
+    check_job_quota, enqueue_analysis, fenced_update, keep_lease, latest_job, start_inline_job,
+)
+from services.element_store import search_elements
+from services.library_search import search_library
+from services.scheduler import (
+    job_scheduler, llm_scheduler, quota_manager, current_user_id, QuotaExceeded,
+    PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE,
+)
+from services.executors import embed_executor, llm_executor, render_executor
+from services.warmup import create_ai_service
+from services.figures import FIGURE_KINDS, list_figures, get_figure_image
+from services.parsed_store import parsed_path
+from services.file_serving import file_sha256, file_response
+from services.page_render import MIN_DPI, MAX_DPI, page_count, render_page
 
 from pydantic import BaseModel
 from schemas.paper_schemas import *
 from schemas.chat_schemas import *
 
-from configs import DATA_DIR
-from services.tools import *
+from configs import DATA_DIR, ANSWER_CACHE_ENABLED, JOB_LEASE_SECONDS
 
 router = APIRouter(prefix="/papers", tags=["papers"])
 
+INLINE_JOB_LEASE = timedelta(seconds=JOB_LEASE_SECONDS)
+
 UPLOAD_FOLDER = os.path.join(DATA_DIR, "uploads")
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
@@ -41,17 +63,21 @@ def env_check():
 async def upload_paper(
     file: UploadFile = File(...),
     user_id: int = Form(1),
-    db: Session = Depends(get_db_session),
+    db: AsyncSession = Depends(get_async_db_session),
 ):
     print(f"[UPLOAD] 用户 user_id={user_id} 上传文件 filename={file.filename}")
     if not file.filename.endswith(".pdf"):
         raise HTTPException(status_code=400, detail="Invalid file type")
 
+    content = await file.read()
+    # 超出磁盘配额时抛出 StorageQuotaExceeded，返回 413
+    await check_disk_quota(db, user_id, len(content))
+
     filename = f"{uuid.uuid4()}_{file.filename}"
     file_path = os.path.join(UPLOAD_FOLDER, filename)
 
     with open(file_path, "wb") as f:
-        f.write(await file.read())
+        f.write(content)
 
     paper = Paper(
         filename=filename,
@@ -61,8 +87,10 @@ async def upload_paper(
         processing_status="uploaded"
     )
     db.add(paper)
-    db.commit()
-    db.refresh(paper)
+    await db.commit()
+    await db.refresh(paper)
+    await refresh_usage(db, paper)
+    await db.commit()
 
     print(f"[UPLOAD] 文件已保存到 file_path={paper.file_path}, paper_id={paper.id}")
 
@@ -74,149 +102,321 @@ async def upload_paper(
 
 
 # ========== 分析论文 ==========
+async def _background_llm(user_id: int, func, *args):
+    """分析阶段的 LLM / HTTP 调用：以后台优先级排队，聊天请求优先"""
+    async with llm_scheduler.slot(user_id, PRIORITY_BACKGROUND):
+        return await llm_executor.run(func, *args)
+
+
+async def _run_analysis(paper: Paper, job_id: int, lease_owner: str, db: AsyncSession) -> PaperAnalysisResult:
+    async def commit_stage(stage: str):
+        # 每个阶段完成后立即提交（连同任务的阶段标记），避免 save_elements 等写入在后续 LLM 阶段期间一直占着 SQLite 写锁；
+        # 租约已被 worker 接手时放弃本次执行
+        if not await fenced_update(db, job_id, lease_owner, INLINE_JOB_LEASE, stage=stage):
+            await db.rollback()
+            raise RuntimeError(f"Analysis job {job_id} was taken over by a worker")
+        await db.commit()
+
+    parsed_data, ai_service = await run_analysis_pipeline(
+        paper, db,
+        run_llm=lambda func, *args: _background_llm(paper.user_id, func, *args),
+        on_stage_done=commit_stage,
+    )
+    await db.commit()
+
+    print(f"[ANALYZE] Paper {paper.id} analysis completed")
+
+    return PaperAnalysisResult(
+        message="Paper analysis completed",
+        paper=PaperResponse.model_validate(paper),
+        parsed_data=ParsedDataSummary(
+            sections_count=len(parsed_data.get('sections') or parsed_data.get('section_titles', [])),
+            tables_count=len(parsed_data.get('tables', [])),
+            images_count=len(parsed_data.get('images', [])),
+            formulas_count=len(parsed_data.get('formulas', [])),
+            references_count=len(parsed_data.get('references', [])),
+        ),
+        prompt_tokens=ai_service.prompt_tokens,
+    )
+
+
 @router.post("/{paper_id}/analyze", response_model=PaperAnalysisResult)
-async def analyze_paper(paper_id: int, db: Session = Depends(get_db_session)):
+async def analyze_paper(paper_id: int, db: AsyncSession = Depends(get_async_db_session)):
     print(f"[ANALYZE] 开始分析论文 paper_id={paper_id}")
-    paper = db.query(Paper).get(paper_id)
+    paper = await db.get(Paper, paper_id)
     if not paper:
         raise HTTPException(status_code=404, detail="Paper not found")
 
-    if paper.processing_status == 'processing':
+    if paper.processing_status in ('processing', 'queued'):
         raise HTTPException(status_code=400, detail="Paper is already being processed")
 
-    paper.processing_status = 'processing'
-    db.commit()
+    # 超出配额时抛出 QuotaExceeded，返回 429 + Retry-After
+    quota_manager.check_tokens(paper.user_id)
+    await check_disk_quota(db, paper.user_id)
+    # 队列中的任务也计入上限（数据库计数，包括 worker 进程中的任务）
+    await check_job_quota(db, paper.user_id)
+    with quota_manager.job(paper.user_id):
+        # 进程内分析同样持有任务租约，进程崩溃后由 worker 接手
+        job = await start_inline_job(db, paper, INLINE_JOB_LEASE)
+        await db.commit()
+        # rollback 后 ORM 对象会过期，异步会话中不能再隐式加载，先取出需要的字段
+        job_id, lease_owner = job.id, job.lease_owner
+        current_user_id.set(paper.user_id)
+
+        try:
+            async with keep_lease(job_id, lease_owner, INLINE_JOB_LEASE):
+                # 按用户公平排队，避免单个用户批量分析时占满所有名额
+                async with job_scheduler.slot(paper.user_id, PRIORITY_BACKGROUND):
+                    result = await _run_analysis(paper, job_id, lease_owner, db)
+                await fenced_update(db, job_id, lease_owner, INLINE_JOB_LEASE, status='completed', error=None)
+                await db.commit()
+                return result
+
+        except Exception as e:
+            await db.rollback()
+            # 任务已被 worker 接手时论文状态由 worker 维护
+            if await fenced_update(db, job_id, lease_owner, INLINE_JOB_LEASE, status='failed', error=str(e)):
+                paper.processing_status = 'failed'
+            await db.commit()
+            raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+
+
+# ========== 分析任务队列（由独立 worker 执行） ==========
+@router.post("/{paper_id}/analyze/queue", response_model=AnalysisJobResponse, status_code=202)
+async def queue_analysis(paper_id: int, db: AsyncSession = Depends(get_async_db_session)):
+    """将论文分析放入任务队列，由 python -m services.worker 启动的 worker 进程执行"""
+    paper = await db.get(Paper, paper_id)
+    if not paper:
+        raise HTTPException(status_code=404, detail="Paper not found")
 
-    try:
-        parser = PDFParser()
-        parsed_data = parser.parse_pdf(paper.id, paper.file_path)
-        print(f"[ANALYZE] PDF parse finished")
+    if paper.processing_status in ('processing', 'queued'):
+        raise HTTPException(status_code=400, detail="Paper is already being processed")
 
-        ai_service = AIService()
+    quota_manager.check_tokens(paper.user_id)
+    await check_disk_quota(db, paper.user_id)
+    await check_job_quota(db, paper.user_id)
+    job = await enqueue_analysis(db, paper)
+    await db.commit()
+    await db.refresh(job)
+    print(f"[ANALYZE] paper_id={paper_id} 已加入分析队列 job_id={job.id}")
+    return AnalysisJobResponse.model_validate(job)
+
+
+@router.get("/{paper_id}/analyze/job", response_model=AnalysisJobResponse)
+async def get_analysis_job(paper_id: int, db: AsyncSession = Depends(get_async_db_session)):
+    job = await latest_job(db, paper_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Analysis job not found")
+    return AnalysisJobResponse.model_validate(job)
+
+
+# ========== 全库检索 ==========
+# 注意：需在 /{paper_id} 之前注册，否则 "search" 会被当作 paper_id
+@router.get("/search", response_model=LibrarySearchPage)
+async def search_papers(
+    q: str,
+    user_id: int = 1,
+    offset: int = 0,
+    limit: int = 20,
+    db: AsyncSession = Depends(get_async_db_session),
+):
+    """在用户全部论文的标题、摘要、总结和正文中检索，支持排序、高亮和分页"""
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="Query must not be empty")
+    page = await search_library(db, user_id, q, offset=max(0, offset), limit=max(1, min(limit, 100)))
+    return LibrarySearchPage(**page)
+
+
+# ========== 跨论文语义检索 ==========
+@router.get("/semantic-search", response_model=List[SemanticSearchResult])
+async def semantic_search_papers(
+    q: str,
+    user_id: int = 1,
+    k: int = 50,
+    passages_per_paper: int = 3,
+    db: AsyncSession = Depends(get_async_db_session),
+):
+    """在用户全部论文的分块上做语义检索，结果按论文分组"""
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="Query must not be empty")
+    ai_service = await embed_executor.run(create_ai_service)
+    groups = await embed_executor.run(
+        ai_service.search_library, q, user_id, max(1, min(k, 200)), max(1, passages_per_paper)
+    )
+    if not groups:
+        return []
 
-        paper.title = parsed_data.get('title', paper.original_filename)
-        paper.authors = ', '.join(parsed_data.get('authors', []))
-        paper.abstract = parsed_data.get('abstract', '')
+    result = await db.execute(select(Paper.id, Paper.title).where(Paper.id.in_([g["paper_id"] for g in groups])))
+    titles = dict(result.all())
+    return [
+        SemanticSearchResult(title=titles.get(group["paper_id"]), **group)
+        for group in groups
+        if group["paper_id"] in titles
+    ]
 
-        print(f"[ANALYZE] 已保存 paper.title: {paper.title}")
-        print(f"[ANALYZE] 已保存 paper.authors: {paper.authors}")
-        print(f"[ANALYZE] 已保存 paper.abstract: {paper.abstract[:100]}...")
 
-        if paper.abstract and paper.title:
-            paper.summary = ai_service.generate_summary(paper.abstract, paper.title)
-            print(f"[ANALYZE] 已生成并保存 paper.summary")
-        else:
-            paper.summary = f"这是一篇关于{paper.title}的学术论文。"
+# ========== 获取单篇论文 ==========
+@router.get("/{paper_id}", response_model=PaperResponse)
+async def get_paper(paper_id: int, db: AsyncSession = Depends(get_async_db_session)):
+    paper = await db.get(Paper, paper_id)
+    if not paper:
+        raise HTTPException(status_code=404, detail="Paper not found")
+    await touch(db, paper_id)
+    return PaperResponse.model_validate(paper)
 
-        key_sections = extract_core_sections(parsed_data.get('sections',[]))
 
-        if key_sections:
-            paper.key_content = ai_service.extract_key_content(key_sections, paper.title)
-            print(f"[ANALYZE] 已生成并保存 paper.key_content")
-        else:
-            paper.key_content = "未提取到有效的key_sections"
+# ========== 删除论文 ==========
+@router.delete("/{paper_id}", status_code=204)
+async def delete_paper_route(paper_id: int, db: AsyncSession = Depends(get_async_db_session)):
+    """删除论文及其全部产物（上传文件、解析结果、向量索引、聊天记录等）"""
+    paper = await db.get(Paper, paper_id)
+    if not paper:
+        raise HTTPException(status_code=404, detail="Paper not found")
+    if paper.processing_status in ('processing', 'queued'):
+        raise HTTPException(status_code=400, detail="Paper is being processed")
+    await delete_paper(db, paper)
+    return None
+
+
+# ========== 论文内全文检索 ==========
+@router.get("/{paper_id}/search", response_model=List[ElementSearchHit])
+async def search_in_paper(
+    paper_id: int,
+    q: str,
+    kind: Optional[str] = None,
+    limit: int = 20,
+    db: AsyncSession = Depends(get_async_db_session),
+):
+    """基于 SQLite FTS5 检索论文的段落、表格、公式和参考文献，不经过向量模型和 LLM"""
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="Query must not be empty")
+    hits = await search_elements(db, paper_id, q, kind=kind, limit=max(1, min(limit, 100)))
+    return [ElementSearchHit(**hit) for hit in hits]
 
-        if paper.abstract:
-            paper.translation = ai_service.translate_text(paper.abstract)
-            print(f"[ANALYZE] 已完成摘要翻译（目前是demo版本）")
-        else:
-            paper.translation = "未提取到有效的摘要内容"
 
-        full_text = parsed_data.get('full_text', '')
-        if full_text:
-            paper.terminology = ai_service.explain_terminology(full_text[:2000])
-            print(f"[ANALYZE] 已生成术语解释")
-        else:
-            paper.terminology = "未提取到full_text文本内容。"
+# ========== 图表截图（按需渲染） ==========
+async def _get_analyzed_paper(paper_id: int, db: AsyncSession) -> Paper:
+    paper = await db.get(Paper, paper_id)
+    if not paper:
+        raise HTTPException(status_code=404, detail="Paper not found")
+    if not os.path.exists(parsed_path(paper_id)):
+        raise HTTPException(status_code=404, detail="Paper has not been analyzed")
+    return paper
+
+
+@router.get("/{paper_id}/figures", response_model=List[FigureInfo])
+async def get_figures(paper_id: int, db: AsyncSession = Depends(get_async_db_session)):
+    """列出论文中的图片和表格（页码、坐标），不触发渲染"""
+    await _get_analyzed_paper(paper_id, db)
+    figures = await render_executor.run(list_figures, paper_id)
+    return [FigureInfo(**figure) for figure in figures]
+
+
+@router.get("/{paper_id}/figures/{kind}/{index}")
+async def get_figure(
+    paper_id: int,
+    kind: str,
+    index: int,
+    thumbnail: bool = False,
+    db: AsyncSession = Depends(get_async_db_session),
+):
+    """返回单个图表的 PNG 截图；首次请求时从 PDF 裁剪渲染，并写入容量受限的 LRU 磁盘缓存"""
+    if kind not in FIGURE_KINDS:
+        raise HTTPException(status_code=400, detail=f"kind must be one of {list(FIGURE_KINDS)}")
+    paper = await _get_analyzed_paper(paper_id, db)
+    path = await render_executor.run(get_figure_image, paper_id, paper.file_path, kind, index, thumbnail)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Figure not found")
+    return FileResponse(path, media_type="image/png", headers={"Cache-Control": "public, max-age=86400"})
+
+
+# ========== 原文件与页面图片 ==========
+async def _get_paper_file(paper_id: int, db: AsyncSession):
+    paper = await db.get(Paper, paper_id)
+    if not paper:
+        raise HTTPException(status_code=404, detail="Paper not found")
+    if not os.path.exists(paper.file_path):
+        raise HTTPException(status_code=404, detail="Paper file not found")
+    content_hash = await render_executor.run(file_sha256, paper.file_path)
+    return paper, content_hash
+
+
+@router.get("/{paper_id}/file")
+async def get_paper_file(paper_id: int, request: Request, db: AsyncSession = Depends(get_async_db_session)):
+    """返回 PDF 原文件，支持 Range 分段加载与 ETag 条件请求，浏览器可按需加载页面"""
+    paper, content_hash = await _get_paper_file(paper_id, db)
+    return file_response(
+        request, paper.file_path, content_hash, "application/pdf",
+        filename=quote(paper.original_filename),
+    )
 
-        paper_references = ', '.join(parsed_data.get('references', []))
-        paper.research_context = ai_service.analyze_research_context(
-            paper.title, paper.abstract, paper.key_content, paper_references
-        )
-        print(f"[ANALYZE] Research context analyzed")
-
-        # --- 新增：调用Semantic Scholar服务 ---
-        print(f"[ANALYZE] Fetching related papers from Semantic Scholar for title: {paper.title}")
-        related_data = ai_service.fetch_related_papers(paper.title)
-        paper.s2_id = related_data.get('s2_id')
-        paper.related_papers_json = related_data.get('related_papers_json')
-        print(f"[ANALYZE] Semantic Scholar data fetched. S2 ID: {paper.s2_id}")
-
-        # rag 构建
-        # 首先，先提取引用的文章
-        references = extract_references_section(parsed_data)
-        titles = []
-        for title in references:
-            title = extract_reference_title(title)
-            titles.append(title)
-            # print(f"Reference title: {title}")
-
-        # 根据标题构建增强内容
-        rag_chunks = build_rag_chunks_from_titles(titles)
-
-        print(f"[ANALYZE] RAG chunks built: {len(rag_chunks)} items")
-        print(f"[ANALYZE] RAG chunks[0]: {rag_chunks[0] if rag_chunks else 'No chunks available'}")
-
-        # 拼接为一个整体string
-        augmented_full_text = full_text + "\n\n" + "\n\n".join(rag_chunks)
-        print(f"[RAG] augmented_full_text:\n{augmented_full_text}")
-
-        if augmented_full_text:
-            ai_service.setup_rag(augmented_full_text, paper.id)
-            print(f"[ANALYZE] RAG setup completed")
-
-        paper.processing_status = 'completed'
-        db.commit()
-
-        print(f"[ANALYZE] Paper {paper_id} analysis completed")
-
-        return PaperAnalysisResult(
-            message="Paper analysis completed",
-            paper=PaperResponse.model_validate(paper),
-            parsed_data=ParsedDataSummary(
-                sections_count=len(parsed_data.get('sections', [])),
-                tables_count=len(parsed_data.get('tables', [])),
-                images_count=len(parsed_data.get('images', [])),
-                formulas_count=len(parsed_data.get('formulas', [])),
-                references_count=len(parsed_data.get('references', [])),
-            )
-        )
 
-    except Exception as e:
-        paper.processing_status = 'failed'
-        db.commit()
-        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+@router.get("/{paper_id}/pages")
+async def get_page_count(paper_id: int, db: AsyncSession = Depends(get_async_db_session)):
+    paper, content_hash = await _get_paper_file(paper_id, db)
+    count = await render_executor.run(page_count, paper.file_path)
+    return {"paper_id": paper_id, "page_count": count, "etag": content_hash}
 
 
-# ========== 获取单篇论文 ==========
-@router.get("/{paper_id}", response_model=PaperResponse)
-async def get_paper(paper_id: int, db: Session = Depends(get_db_session)):
-    paper = db.query(Paper).get(paper_id)
-    if not paper:
-        raise HTTPException(status_code=404, detail="Paper not found")
-    return PaperResponse.model_validate(paper)
+@router.get("/{paper_id}/pages/{page}")
+async def get_page_image(
+    paper_id: int,
+    page: int,
+    request: Request,
+    dpi: int = 110,
+    db: AsyncSession = Depends(get_async_db_session),
+):
+    """按页渲染 PNG（页码从 1 开始），结果按 (文件哈希, 页码, dpi) 写入 LRU 磁盘缓存"""
+    dpi = max(MIN_DPI, min(MAX_DPI, dpi))
+    paper, content_hash = await _get_paper_file(paper_id, db)
+    etag = f"{content_hash[:32]}-{page}-{dpi}"
+    try:
+        path = await render_executor.run(render_page, paper.file_path, content_hash, page, dpi)
+    except IndexError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return file_response(request, path, etag, "image/png")
 
 
 # ========== 获取论文列表 ==========
 @router.get("/", response_model=List[PaperResponse])
-async def get_papers(user_id: int = 1, db: Session = Depends(get_db_session)):
-    papers = db.query(Paper).filter_by(user_id=user_id).order_by(Paper.upload_time.desc()).all()
+async def get_papers(user_id: int = 1, db: AsyncSession = Depends(get_async_db_session)):
+    result = await db.execute(
+        select(Paper).filter_by(user_id=user_id).order_by(Paper.upload_time.desc())
+    )
+    papers = result.scalars().all()
     return [PaperResponse.model_validate(p) for p in papers]
 
 
 # ========== 聊天问答 ==========
 @router.post("/{paper_id}/chat", response_model=ChatResponse)
-async def chat_with_paper(paper_id: int, request_data: QuestionRequest, db: Session = Depends(get_db_session)):
+async def chat_with_paper(paper_id: int, request_data: QuestionRequest, db: AsyncSession = Depends(get_async_db_session)):
     print(f"[CHAT] user_id={request_data.user_id} asking: question='{request_data.question}' for paper_id={paper_id}")
-    paper = db.query(Paper).get(paper_id)
+    paper = await db.get(Paper, paper_id)
     if not paper:
         raise HTTPException(status_code=404, detail="Paper not found")
+    await touch(db, paper_id)
 
-    ai_service = AIService()
     try:
-        result_dict = ai_service.agentic_answer(request_data.question, paper)
-        print(f"[CHAT] Agent result received: {result_dict}")
-        print(f"[CHAT] LLM answer completed")
+        # 预生成的常用图表/回答，或相似问题已回答过时，直接返回已有结果，不调用 LLM
+        cached, cache_key = None, None
+        if request_data.use_cache:
+            cached = await get_precomputed(db, paper, request_data.question)
+        if cached is None and ANSWER_CACHE_ENABLED and request_data.use_cache:
+            cached, cache_key = await lookup_answer(db, paper, request_data.question)
+
+        if cached is not None:
+            result_dict = {**cached, "cached": True}
+            print(f"[CHAT] Answer served from precomputed artifacts or semantic cache")
+        else:
+            quota_manager.check_tokens(request_data.user_id)
+            current_user_id.set(request_data.user_id)
+
+            ai_service = await embed_executor.run(create_ai_service)
+            async with llm_scheduler.slot(request_data.user_id, PRIORITY_INTERACTIVE):
+                result_dict = await llm_executor.run(ai_service.agentic_answer, request_data.question, paper)
+            print(f"[CHAT] Agent result received: {result_dict}")
+            print(f"[CHAT] LLM answer completed")
+            store_answer(paper_id, cache_key, result_dict)
 
         # --- 将结果字典序列化为 JSON 字符串存入数据库 ---
         # 这样前端就能收到完整的结构化信息
@@ -230,8 +430,8 @@ async def chat_with_paper(paper_id: int, request_data: QuestionRequest, db: Sess
             answer=answer_content
         )
         db.add(chat_session)
-        db.commit()
-        db.refresh(chat_session)
+        await db.commit()
+        await db.refresh(chat_session)
 
         print(f"[CHAT] Saved chat session id={chat_session.id}")
 
@@ -243,13 +443,170 @@ async def chat_with_paper(paper_id: int, request_data: QuestionRequest, db: Sess
             # answer=result['answer'],
             answer=answer_content,
             timestamp=chat_session.timestamp,
+            cached=cached is not None,
+        )
+
+    except QuotaExceeded:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Chat failed: {str(e)}")
+
+# ========== 多论文聊天 ==========
+MULTI_CHAT_MAX_PAPERS = 10
+MULTI_CHAT_CONTEXT_BUDGET = 6000   # 合并后上下文的字符预算
+MULTI_CHAT_K_PER_PAPER = 4
+
+
+@router.post("/multi-chat", response_model=MultiPaperChatResponse)
+async def chat_with_papers(request_data: MultiPaperQuestionRequest, db: AsyncSession = Depends(get_async_db_session)):
+    """
+    针对多篇论文提问：问题只向量化一次，并行检索各论文的向量库，
+    合并去重后在统一的上下文预算内，通过一次 LLM 调用回答
+    """
+    paper_ids = list(dict.fromkeys(request_data.paper_ids))
+    print(f"[MULTI_CHAT] user_id={request_data.user_id} asking: question='{request_data.question}' for paper_ids={paper_ids}")
+    if not paper_ids:
+        raise HTTPException(status_code=400, detail="paper_ids must not be empty")
+    if len(paper_ids) > MULTI_CHAT_MAX_PAPERS:
+        raise HTTPException(status_code=400, detail=f"At most {MULTI_CHAT_MAX_PAPERS} papers per question")
+
+    result = await db.execute(select(Paper).where(Paper.id.in_(paper_ids)))
+    papers = result.scalars().all()
+    if len(papers) != len(paper_ids):
+        missing = set(paper_ids) - {paper.id for paper in papers}
+        raise HTTPException(status_code=404, detail=f"Paper not found: {sorted(missing)}")
+    for paper in papers:
+        await touch(db, paper.id)
+
+    quota_manager.check_tokens(request_data.user_id)
+    current_user_id.set(request_data.user_id)
+
+    try:
+        ai_service = await embed_executor.run(create_ai_service)
+        query_embedding = await embed_executor.run(ai_service.embeddings.embed_query, request_data.question)
+        per_paper = await asyncio.gather(*[
+            embed_executor.run(
+                ai_service.retrieve_from_paper, paper.id, request_data.question, query_embedding,
+                MULTI_CHAT_K_PER_PAPER, request_data.section_kind,
+            )
+            for paper in papers
+        ])
+        passages = ai_service.merge_passages(per_paper, MULTI_CHAT_CONTEXT_BUDGET)
+        print(f"[MULTI_CHAT] 合并后保留 {len(passages)} 个段落")
+
+        async with llm_scheduler.slot(request_data.user_id, PRIORITY_INTERACTIVE):
+            result_dict = await llm_executor.run(ai_service.multi_paper_answer, request_data.question, papers, passages)
+        answer_content = json.dumps(result_dict, ensure_ascii=False)
+
+        # 每篇论文各记一条，便于在单篇论文的聊天历史中看到
+        chat_sessions = [
+            ChatSession(
+                paper_id=paper.id,
+                user_id=request_data.user_id,
+                question=request_data.question,
+                answer=answer_content,
+            )
+            for paper in papers
+        ]
+        db.add_all(chat_sessions)
+        await db.commit()
+
+        return MultiPaperChatResponse(
+            paper_ids=[paper.id for paper in papers],
+            question=request_data.question,
+            answer=answer_content,
+            passages_count=len(passages),
+            chat_session_ids=[chat.id for chat in chat_sessions],
         )
 
+    except QuotaExceeded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Chat failed: {str(e)}")
 
+
 # ========== 聊天历史记录 ==========
-@router.get("/{paper_id}/chat/history", response_model=List[ChatResponse])
-async def get_chat_history(paper_id: int, user_id: int = 1, db: Session = Depends(get_db_session)):
-    chats = db.query(ChatSession).filter_by(paper_id=paper_id, user_id=user_id).order_by(ChatSession.timestamp.asc()).all()
-    return [ChatResponse.model_validate(chat) for chat in chats]
+CHAT_HISTORY_PAGE_SIZE = 20
+CHAT_HISTORY_MAX_PAGE_SIZE = 100
+
+
+def _parse_answer(answer: str) -> Optional[dict]:
+    try:
+        data = json.loads(answer)
+    except (json.JSONDecodeError, TypeError):
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _strip_diagram(answer: str) -> str:
+    """去掉 answer JSON 中的 diagram 载荷，只保留文本回答"""
+    data = _parse_answer(answer)
+    if not data or not data.get("diagram"):
+        return answer
+    data["diagram"] = None
+    data["has_diagram"] = True  # 告知前端该条原本带图，可通过 /{paper_id}/chat/{chat_id}/diagram 单独拉取
+    return json.dumps(data, ensure_ascii=False)
+
+
+@router.get("/{paper_id}/chat/history", response_model=ChatHistoryPage)
+async def get_chat_history(
+    paper_id: int,
+    user_id: int = 1,
+    before: Optional[int] = None,
+    since: Optional[int] = None,
+    limit: int = CHAT_HISTORY_PAGE_SIZE,
+    include_diagram: bool = True,
+    db: AsyncSession = Depends(get_async_db_session),
+):
+    """
+    按时间倒序（最新在前）分页返回聊天历史
+    - before: 游标，返回 id 小于该值的更早记录（取上一页的 next_cursor）
+    - since: 增量，返回 id 大于该值的新记录中最早的 limit 条（取上次的 latest_id）；
+      has_more 为 True 时以新的 latest_id 继续拉取，不会跳过记录
+    - include_diagram: 为 False 时不返回 Mermaid 图表载荷
+    """
+    limit = max(1, min(limit, CHAT_HISTORY_MAX_PAGE_SIZE))
+
+    query = select(ChatSession).filter_by(paper_id=paper_id, user_id=user_id)
+    if before is not None:
+        query = query.where(ChatSession.id < before)
+    if since is not None:
+        query = query.where(ChatSession.id > since)
+
+    # 增量刷新从 since 之后最早的记录取起，否则新记录超过 limit 条时较早的会被跳过；多取一条用于判断 has_more
+    order = ChatSession.id.asc() if since is not None else ChatSession.id.desc()
+    result = await db.execute(query.order_by(order).limit(limit + 1))
+    chats = result.scalars().all()
+    has_more = len(chats) > limit
+    chats = chats[:limit]
+    if since is not None:
+        chats.reverse()
+
+    items = []
+    for chat in chats:
+        item = ChatResponse.model_validate(chat)
+        if not include_diagram:
+            item.answer = _strip_diagram(item.answer)
+        items.append(item)
+
+    return ChatHistoryPage(
+        items=items,
+        next_cursor=items[-1].id if has_more and since is None else None,
+        latest_id=items[0].id if items else since,
+        has_more=has_more,
+    )
+
+
+@router.get("/{paper_id}/chat/{chat_id}/diagram", response_model=ChatDiagramResponse)
+async def get_chat_diagram(
+    paper_id: int,
+    chat_id: int,
+    user_id: int = 1,
+    db: AsyncSession = Depends(get_async_db_session),
+):
+    """单独拉取某条聊天记录的图表载荷"""
+    chat = await db.get(ChatSession, chat_id)
+    if not chat or chat.paper_id != paper_id or chat.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Chat message not found")
+    data = _parse_answer(chat.answer)
+    return ChatDiagramResponse(id=chat.id, diagram=data.get("diagram") if data else None)
@@ -0,0 +1,36 @@
+from typing import Any, Dict, List
+
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from configs import INDEX_ARCHIVE_IDLE_DAYS
+from models.db import get_async_db_session
+from services.storage import archive_idle_indexes, cleanup_orphans, usage_report, user_usage
+
+router = APIRouter(prefix="/storage", tags=["storage"])
+
+
+# ========== 磁盘用量 ==========
+@router.get("/")
+async def get_usage_report(refresh: bool = False, db: AsyncSession = Depends(get_async_db_session)) -> Dict[str, Any]:
+    """按产物类型和用户汇总磁盘用量；refresh=true 时重新统计所有论文（较慢）"""
+    return await usage_report(db, refresh)
+
+
+@router.get("/users/{user_id}")
+async def get_user_usage(user_id: int, db: AsyncSession = Depends(get_async_db_session)) -> Dict[str, Any]:
+    return await user_usage(db, user_id)
+
+
+# ========== 清理与归档 ==========
+@router.post("/cleanup")
+async def cleanup(dry_run: bool = True, db: AsyncSession = Depends(get_async_db_session)) -> Dict[str, Any]:
+    """清理孤儿产物；默认只列出，dry_run=false 时实际删除"""
+    return await cleanup_orphans(db, dry_run)
+
+
+@router.post("/archive")
+async def archive(idle_days: int = INDEX_ARCHIVE_IDLE_DAYS,
+                  db: AsyncSession = Depends(get_async_db_session)) -> List[int]:
+    """压缩归档长期未访问论文的向量索引，返回归档的论文 id"""
+    return await archive_idle_indexes(db, idle_days)
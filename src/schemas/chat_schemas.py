@@ -1,12 +1,21 @@
 # schemas/chat.py
 from pydantic import BaseModel, ConfigDict
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 from datetime import datetime
 
 
 class QuestionRequest(BaseModel):
     user_id: int = 1
     question: str
+    # 为 False 时不使用语义缓存，总是重新生成回答
+    use_cache: bool = True
+
+
+class MultiPaperQuestionRequest(BaseModel):
+    user_id: int = 1
+    paper_ids: List[int]
+    question: str
+    section_kind: Optional[str] = None  # 只检索某类章节，如 "method"
 
 
 class ChatResponse(BaseModel):
@@ -16,5 +25,29 @@ class ChatResponse(BaseModel):
     question: str
     answer: str
     timestamp: datetime
+    # 回答是否来自语义缓存
+    cached: bool = False
 
     model_config = ConfigDict(from_attributes=True)
+
+
+class ChatHistoryPage(BaseModel):
+    """聊天历史分页结果（按时间倒序，最新在前）"""
+    items: List[ChatResponse]
+    next_cursor: Optional[int] = None   # 继续向更早翻页时作为 before 传入
+    latest_id: Optional[int] = None     # 本页最新一条的 id，增量刷新时作为 since 传入
+    has_more: bool = False              # 翻页时表示还有更早的记录；增量刷新时表示还有更新的记录，应以 latest_id 继续拉取
+
+
+class ChatDiagramResponse(BaseModel):
+    """单条聊天记录的图表载荷（历史记录以 include_diagram=False 拉取时按需获取）"""
+    id: int
+    diagram: Optional[Dict[str, Any]] = None
+
+
+class MultiPaperChatResponse(BaseModel):
+    paper_ids: List[int]
+    question: str
+    answer: str                 # JSON 字符串：{"answer", "diagram", "paper_ids"}
+    passages_count: int
+    chat_session_ids: List[int]
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, ConfigDict
-from typing import Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 
 class PaperResponse(BaseModel):
@@ -37,4 +37,65 @@ class PaperAnalysisResult(BaseModel):
     message: str
     paper: PaperResponse
     parsed_data: ParsedDataSummary
+    prompt_tokens: Dict[str, int] = {}  # 各分析阶段发送的 prompt token 数
 
+
+
+class ElementSearchHit(BaseModel):
+    id: int
+    kind: str
+    section: Optional[str]
+    ordinal: int
+    page: Optional[int]
+    snippet: str
+    score: float
+
+
+class LibrarySearchHit(BaseModel):
+    paper_id: int
+    title: str
+    title_highlight: str
+    snippet: str
+    score: float
+
+
+class LibrarySearchPage(BaseModel):
+    items: List[LibrarySearchHit]
+    total: int
+    offset: int
+    limit: int
+
+
+class SemanticPassage(BaseModel):
+    text: str
+    distance: float
+
+
+class SemanticSearchResult(BaseModel):
+    paper_id: int
+    title: Optional[str]
+    best_distance: float
+    passages: List[SemanticPassage]
+
+
+class AnalysisJobResponse(BaseModel):
+    id: int
+    paper_id: int
+    user_id: int
+    status: str
+    stage: Optional[str]
+    attempts: int
+    error: Optional[str]
+    lease_owner: Optional[str]
+    created_at: datetime
+    updated_at: Optional[datetime]
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class FigureInfo(BaseModel):
+    kind: str           # image / table
+    index: int
+    page: Optional[int]
+    bbox: Dict[str, Optional[float]]
+    caption: str
@@ -1,11 +1,12 @@
 import os
 import re
 import json
-from typing import List, Dict, Any
+import shutil
+from itertools import islice
+from typing import List, Dict, Any, Iterable
 
 import requests
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import Chroma
 from langchain.chains import RetrievalQA
 from langchain_community.chat_models.tongyi import ChatTongyi
@@ -13,16 +14,27 @@ from langchain_core.prompts import ChatPromptTemplate
 from langchain.schema import Document
 from langgraph.graph import StateGraph,END
 
-from configs import DATA_DIR
+from configs import DATA_DIR, EMBEDDING_BACKEND, INDEX_BATCH_SIZE, S2_API_BASE
+from services.answer_cache import answer_cache
+from services import vector_index
+from services.chunker import SectionChunker
+from services.embeddings import get_embeddings
+from services.memory_guard import MemoryGuard
+from services.llm_gateway import llm_gateway, in_leaf_call, token_usage, content_text
+from services.intent_router import INTENT_QA, INTENT_MINDMAP, route as route_intent
+from services.prompt_budget import STAGE_BUDGETS, count_tokens, select_salient, fit_sections, fit_list, truncate_tokens
 
 import time#用于访问时间限制
-from typing import List, Dict, Any, TypedDict, Annotated, Literal,Optional
+from typing import List, Dict, Any, TypedDict, Annotated, Literal,Optional, Union
 from operator import itemgetter
+import threading
+from collections import OrderedDict
 
 # --- LangChain 新增依赖 ---
 from langchain.agents import AgentExecutor, create_tool_calling_agent
 from langchain_core.tools import tool, Tool
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from langchain_core.callbacks import BaseCallbackHandler
 
 # 导入 Paper 模型，以便访问其属性
 from models.paper import Paper
@@ -36,23 +48,83 @@ class S2State(TypedDict):
     final_result: str | Dict
 
 
+# ======================== 多论文检索缓存 ========================
+# 已打开的单篇论文向量库 paper_id -> (索引目录, store)，避免每次问答都重新打开
+_paper_store_cache: Dict[int, Any] = {}
+# 单篇论文检索结果：(paper_id, 索引目录, 规范化问题, k, 章节类型) -> [passage, ...]，LRU
+_retrieval_cache: "OrderedDict[tuple, List[Dict[str, Any]]]" = OrderedDict()
+RETRIEVAL_CACHE_SIZE = 512
+_cache_lock = threading.Lock()
+
+
+def invalidate_paper_retrieval_cache(paper_id: int):
+    """论文重新分析后清除其检索缓存和问答语义缓存"""
+    answer_cache.invalidate(paper_id)
+    with _cache_lock:
+        _paper_store_cache.pop(paper_id, None)
+        for key in [key for key in _retrieval_cache if key[0] == paper_id]:
+            del _retrieval_cache[key]
+
+
+# Agent 包含多轮模型调用和工具调用，整体超时为单次调用的若干倍
+AGENT_TIMEOUT_FACTOR = 3
+
+
+class TokenUsageHandler(BaseCallbackHandler):
+    """
+    统计链 / Agent 内部直接发起的模型调用的 token 用量，供 llm_gateway.run(usage=...) 记录；
+    工具中经 llm_gateway.invoke 发起的调用已自行记录，这里跳过
+    """
+
+    def __init__(self):
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self._prompt_tokens: Dict[Any, int] = {}
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._prompt_tokens[run_id] = count_tokens("\n".join(prompts))
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._prompt_tokens[run_id] = count_tokens("\n".join(
+            str(message.content) for batch in messages for message in batch
+        ))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        estimated_input = self._prompt_tokens.pop(run_id, 0)
+        if in_leaf_call():
+            return
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                input_tokens, output_tokens = token_usage(message) if message is not None else (None, None)
+                self.input_tokens += estimated_input if input_tokens is None else input_tokens
+                self.output_tokens += count_tokens(
+                    content_text(message) if message is not None else generation.text
+                ) if output_tokens is None else output_tokens
+                estimated_input = 0  # 同一次调用的多个候选只计一次输入
+
+    def usage(self, _result=None):
+        return self.input_tokens, self.output_tokens
+
+
 class AIService:
-    def __init__(self, api_key: str = None):
+    def __init__(self, api_key: str = None, embedding_backend: Optional[str] = None):
         self.api_key = api_key or os.getenv('DASHSCOPE_API_KEY')
         self.llm = ChatTongyi(
             name="qwen-turbo",
             streaming=False,
             api_key=self.api_key
         )
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2"
-        )
+        # 向量模型进程内共享；后端（torch / torch-int8 / onnx）由 EMBEDDING_BACKEND 或参数指定
+        self.embedding_backend = embedding_backend or EMBEDDING_BACKEND
+        self.embeddings = get_embeddings(self.embedding_backend)
         # self.embeddings = OpenAIEmbeddings()
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=1000,
             chunk_overlap=200,
             length_function=len,
         )
+        self.section_chunker = SectionChunker(chunk_size=1200)
         self.vectorstore = None
         self.qa_chain = None
         self.rag_search_tool = self._get_rag_search_tool()
@@ -62,34 +134,80 @@ class AIService:
         #查看被引用文献基本信息
         # 我们不再从环境变量中读取S2_API_KEY，强制使用无Key模式
         # S2 API 配置
-        self.s2_api_base = "https://api.semanticscholar.org/graph/v1"
+        self.s2_api_base = S2_API_BASE
 
         # --- 新增: Agent 相关变量 ---
         self.agent_executor = None
 
-    def _simple_prompt(self, user_msg: str, system_msg: str = "") -> str:
+        # 各分析阶段实际发送的 prompt token 数
+        self.prompt_tokens: Dict[str, int] = {}
+
+    def _record_prompt(self, stage: str, prompt: str):
+        tokens = count_tokens(prompt)
+        self.prompt_tokens[stage] = tokens
+        print(f"[PROMPT] stage={stage} tokens={tokens} (content budget {STAGE_BUDGETS.get(stage, '-')})")
+
+    def _simple_prompt(self, user_msg: str, system_msg: str = "", call_site: str = "simple") -> str:
         messages = []
         if system_msg:
             messages.append({"role": "system", "content": system_msg})
         messages.append({"role": "user", "content": user_msg})
 
-        print(f"[LLM] answer: {self.llm.invoke(messages).content[:20]}...")
-        return self.llm.invoke(messages).content
+        answer = llm_gateway.invoke(self.llm, messages, call_site=call_site)
+        print(f"[LLM] {call_site} answer: {answer[:20]}...")
+        return answer
+
+    def setup_rag(self, paper_content: str, paper_id: int, user_id: Optional[int] = None):
+        """设置RAG系统（纯文本输入，按字符分块）"""
+        texts = self.text_splitter.split_text(paper_content)
+        documents = [Document(page_content=text) for text in texts]
+        return self._build_rag(documents, paper_id, user_id, chunker="recursive:1000:200")
+
+    def setup_rag_from_parsed(self, parsed_data: Dict[str, Any], extra_texts: List[str], paper_id: int,
+                              user_id: Optional[int] = None, sections: Optional[Iterable[Dict[str, Any]]] = None):
+        """
+        设置RAG系统（按解析出的章节/段落结构分块，分块带章节、页码等元数据）
+        sections 可以是从 parsed_store 逐个读取章节的迭代器（大文件），分块随读随写入索引
+        """
+        documents = self.section_chunker.iter_chunks(parsed_data, extra_texts, sections)
+        # 保存增强内容，之后更换分块器或向量模型时可直接从解析结果重建索引
+        vector_index.save_extra_texts(paper_id, extra_texts or [])
+        return self._build_rag(documents, paper_id, user_id, chunker=self.section_chunker.signature)
+
+    def index_signature(self, chunker: str) -> Dict[str, str]:
+        return vector_index.index_signature(chunker, vector_index.embedding_signature(self.embedding_backend))
 
-    def setup_rag(self, paper_content: str, paper_id: int):
-        """设置RAG系统"""
+    def _build_rag(self, documents: Iterable[Document], paper_id: int, user_id: Optional[int] = None,
+                   chunker: str = "unknown"):
+        """
+        在新的版本目录中构建向量索引，完成后原子切换；构建期间旧索引照常提供检索
+        documents 按批取出、向量化并写入，内存中只保留当前一批；每批后检查本任务的内存增量，超出上限时批次减半
+        """
+        signature = self.index_signature(chunker)
+        persist_directory = vector_index.new_index_dir(paper_id, signature)
         try:
-            # 分割文档
-            texts = self.text_splitter.split_text(paper_content)
-            documents = [Document(page_content=text) for text in texts]
-            
             # 创建向量存储
-            persist_directory = os.path.join(DATA_DIR, "chroma_db", f"paper_{paper_id}")
-            self.vectorstore = Chroma.from_documents(
-                documents=documents,
-                embedding=self.embeddings,
-                persist_directory=persist_directory
+            start = time.perf_counter()
+            # 分批向量化并写入，大文件的分块不会一次性全部驻留为向量
+            self.vectorstore = Chroma(
+                persist_directory=persist_directory,
+                embedding_function=self.embeddings
             )
+            documents = iter(documents)
+            guard = MemoryGuard(f"paper_id={paper_id} 向量化")
+            batch_size, chunk_count, char_count = INDEX_BATCH_SIZE, 0, 0
+            while True:
+                batch = list(islice(documents, batch_size))
+                if not batch:
+                    break
+                self.vectorstore.add_documents(batch)
+                chunk_count += len(batch)
+                char_count += sum(len(d.page_content) for d in batch)
+                batch_size = guard.next_size(batch_size)
+            print(f"[RAG] paper_id={paper_id} 分块数 {chunk_count}，"
+                  f"总字符 {char_count}，向量化耗时 {time.perf_counter() - start:.2f}s")
+            vector_index.commit_index(paper_id, persist_directory, signature, chunk_count)
+            invalidate_paper_retrieval_cache(paper_id)
             
             # 创建QA链
             self.qa_chain = RetrievalQA.from_chain_type(
@@ -98,17 +216,22 @@ class AIService:
                 retriever=self.vectorstore.as_retriever(search_kwargs={"k": 3}),
                 return_source_documents=True
             )
+
+            if user_id is not None:
+                self.update_library_index(paper_id, user_id)
             
             return True
         except Exception as e:
             print(f"Error setting up RAG: {str(e)}")
+            if vector_index.current_index_dir(paper_id) != persist_directory:
+                shutil.rmtree(persist_directory, ignore_errors=True)
             return False
     
     def load_rag(self, paper_id: int):
         """加载已存在的RAG系统"""
         try:
-            persist_directory = os.path.join(DATA_DIR, "chroma_db", f"paper_{paper_id}")
-            if os.path.exists(persist_directory):
+            persist_directory = vector_index.current_index_dir(paper_id)
+            if persist_directory:
                 self.vectorstore = Chroma(
                     persist_directory=persist_directory,
                     embedding_function=self.embeddings
@@ -127,8 +250,171 @@ class AIService:
             print(f"Error loading RAG: {str(e)}")
             return False
     
+    def _get_library_store(self):
+        """全库向量索引：所有论文的分块共用一个集合，metadata 中记录 paper_id / user_id"""
+        persist_directory = os.path.join(DATA_DIR, "chroma_db", "library")
+        return Chroma(
+            collection_name="library",
+            persist_directory=persist_directory,
+            embedding_function=self.embeddings,
+        )
+
+    def update_library_index(self, paper_id: int, user_id: int):
+        """
+        将当前论文向量库中的分块同步到全库索引（增量：先删除该论文旧分块）
+        直接复用已计算好的 embedding，不重复向量化
+        """
+        if not self.vectorstore:
+            return
+        collection = self.vectorstore._collection
+        library = self._get_library_store()._collection
+        library.delete(where={"paper_id": paper_id})
+        # 分批读取和写入，避免大文件的全部向量同时驻留内存
+        synced = 0
+        while True:
+            data = collection.get(include=["embeddings", "documents", "metadatas"],
+                                  limit=INDEX_BATCH_SIZE, offset=synced)
+            if not data["ids"]:
+                break
+            library.upsert(
+                ids=[f"{paper_id}:{synced + i}" for i in range(len(data["ids"]))],
+                embeddings=data["embeddings"],
+                documents=data["documents"],
+                metadatas=[
+                    {**(metadata or {}), "paper_id": paper_id, "user_id": user_id}
+                    for metadata in data["metadatas"]
+                ],
+            )
+            synced += len(data["ids"])
+        print(f"[LIBRARY] paper_id={paper_id} 已同步 {synced} 个分块到全库索引")
+
+    def search_library(self, query: str, user_id: int, k: int = 50, passages_per_paper: int = 3) -> List[Dict[str, Any]]:
+        """
+        跨论文语义检索：查询只向量化一次，在全库索引中做 kNN（按 user_id 过滤），
+        结果按论文分组，每篇保留最相关的若干段落
+        """
+        query_embedding = self.embeddings.embed_query(query)
+        library = self._get_library_store()._collection
+        result = library.query(
+            query_embeddings=[query_embedding],
+            n_results=k,
+            where={"user_id": user_id},
+            include=["documents", "metadatas", "distances"],
+        )
+
+        grouped: Dict[int, Dict[str, Any]] = {}
+        for document, metadata, distance in zip(result["documents"][0], result["metadatas"][0], result["distances"][0]):
+            paper_id = metadata["paper_id"]
+            group = grouped.setdefault(paper_id, {"paper_id": paper_id, "best_distance": distance, "passages": []})
+            if len(group["passages"]) < passages_per_paper:
+                group["passages"].append({"text": document, "distance": distance})
+            group["best_distance"] = min(group["best_distance"], distance)
+
+        return sorted(grouped.values(), key=lambda group: group["best_distance"])
+
+    def _get_paper_store(self, paper_id: int):
+        # 缓存按索引目录（及其 inode）区分，其他进程切换索引或归档后恢复时自动重新打开
+        persist_directory = vector_index.current_index_dir(paper_id)
+        if persist_directory is None:
+            return None
+        identity = (persist_directory, os.stat(persist_directory).st_ino)
+        with _cache_lock:
+            cached = _paper_store_cache.get(paper_id)
+        if cached is not None and cached[0] == identity:
+            return cached[1]
+        store = Chroma(persist_directory=persist_directory, embedding_function=self.embeddings)
+        with _cache_lock:
+            _paper_store_cache[paper_id] = (identity, store)
+        return store
+
+    def retrieve_from_paper(self, paper_id: int, query: str, query_embedding: List[float], k: int = 4,
+                            section_kind: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        从单篇论文向量库检索，结果按 (paper_id, 问题) 缓存，追问相同问题时不再访问向量库
+        section_kind 不为空时只检索该类章节（如 "method"），取值见 chunker.SECTION_KINDS
+        """
+        cache_key = (paper_id, vector_index.current_index_dir(paper_id), " ".join(query.lower().split()), k, section_kind)
+        with _cache_lock:
+            if cache_key in _retrieval_cache:
+                _retrieval_cache.move_to_end(cache_key)
+                return _retrieval_cache[cache_key]
+
+        store = self._get_paper_store(paper_id)
+        passages = []
+        if store is not None:
+            results = store.similarity_search_by_vector_with_relevance_scores(
+                query_embedding, k=k, filter={"section_kind": section_kind} if section_kind else None
+            )
+            passages = [
+                {
+                    "paper_id": paper_id,
+                    "text": doc.page_content,
+                    "distance": float(distance),
+                    "section": doc.metadata.get("section"),
+                    "page": doc.metadata.get("page"),
+                }
+                for doc, distance in results
+            ]
+
+        with _cache_lock:
+            _retrieval_cache[cache_key] = passages
+            while len(_retrieval_cache) > RETRIEVAL_CACHE_SIZE:
+                _retrieval_cache.popitem(last=False)
+        return passages
+
+    @staticmethod
+    def merge_passages(per_paper: List[List[Dict[str, Any]]], context_budget: int = 6000) -> List[Dict[str, Any]]:
+        """
+        合并多篇论文的检索结果：按各论文内排名轮流选取（保证每篇论文都有机会入选），
+        去除重复段落，总长度不超过 context_budget 字符
+        """
+        ranked = [sorted(passages, key=lambda p: p["distance"]) for passages in per_paper]
+        merged, seen, used = [], set(), 0
+        for rank in range(max((len(passages) for passages in ranked), default=0)):
+            for passages in ranked:
+                if rank >= len(passages):
+                    continue
+                passage = passages[rank]
+                fingerprint = " ".join(passage["text"].lower().split())
+                if fingerprint in seen:
+                    continue
+                if used + len(passage["text"]) > context_budget:
+                    continue
+                seen.add(fingerprint)
+                merged.append(passage)
+                used += len(passage["text"])
+        return merged
+
+    def multi_paper_answer(self, question: str, papers: List[Paper], passages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """基于多篇论文合并后的上下文，一次 LLM 调用完成回答"""
+        titles = {paper.id: paper.title or paper.original_filename for paper in papers}
+        context = "\n\n".join(
+            f"[论文{passage['paper_id']}《{titles.get(passage['paper_id'], '')}》]\n{passage['text']}"
+            for passage in passages
+        )
+        prompt = f"""
+        你是一个论文分析专家。请结合以下来自多篇论文的检索内容回答用户的问题。
+        如需比较，请分别指出各论文的做法，并在引用时标注论文编号。
+
+        涉及论文：
+        {chr(10).join(f"- 论文{paper_id}：{title}" for paper_id, title in titles.items())}
+
+        检索内容：
+        ---
+        {context}
+        ---
+
+        用户的问题：{question}
+        """
+        return {
+            "answer": self._simple_prompt(prompt, call_site="multi_paper"),
+            "diagram": None,
+            "paper_ids": [paper.id for paper in papers],
+        }
+
     def generate_summary(self, abstract: str, title: str) -> str:
         """生成简明摘要"""
+        abstract = select_salient(abstract, STAGE_BUDGETS["summary"], focus=title)
         prompt = f"""
         请为以下学术论文生成一个简明的摘要，用一句话或一小段话通俗地解释这篇论文在做什么：
 
@@ -141,14 +427,21 @@ class AIService:
         3. 控制在50字以内
         """
         
-        return self._simple_prompt(prompt)
+        self._record_prompt("summary", prompt)
+        return self._simple_prompt(prompt, call_site="summary")
     
     def extract_key_content(self, key_sections: dict, title: str) -> str:
         """提取关键内容"""
-        introduction_text = key_sections.get("introduction", "not found introduction")
-        method_text = key_sections.get("method", "not found method")
-        experiments_text = key_sections.get("experiments", "not found experiments")
-        conclusion_text = key_sections.get("conclusion", "not found conclusion")
+        # 四个章节共享该阶段的 token 预算，章节内按显著性选句
+        fitted = fit_sections(
+            {name: key_sections.get(name) or "" for name in ["introduction", "method", "experiments", "conclusion"]},
+            STAGE_BUDGETS["key_content"],
+            focus=title,
+        )
+        introduction_text = fitted["introduction"] or "not found introduction"
+        method_text = fitted["method"] or "not found method"
+        experiments_text = fitted["experiments"] or "not found experiments"
+        conclusion_text = fitted["conclusion"] or "not found conclusion"
         prompt = f"""
         请基于以下论文内容，提取并总结关键信息：
 
@@ -170,14 +463,20 @@ class AIService:
         每项用1-2句话概括。
         """
         
-        return self._simple_prompt(prompt)
+        self._record_prompt("key_content", prompt)
+        return self._simple_prompt(prompt, call_site="key_content")
     
     def translate_text(self, text: str) -> str:
         """翻译文本"""
+        # 翻译需要连续的原文，超出预算时按原文顺序截断，而不是按显著性挑句子
+        budget = STAGE_BUDGETS["translation"]
+        content = truncate_tokens(text, budget)
+        if content != text:
+            print(f"[PROMPT] stage=translation 原文 {count_tokens(text)} tokens 超出预算 {budget}，只翻译前 {count_tokens(content)} tokens")
         prompt = f"""
         请将以下英文学术论文内容翻译成简体中文，保持学术性和准确性：
 
-        {text}
+        {content}
 
         翻译要求：
         1. 保持原文的学术风格
@@ -185,10 +484,12 @@ class AIService:
         3. 语言要流畅自然
         """
         
-        return self._simple_prompt(prompt)
+        self._record_prompt("translation", prompt)
+        return self._simple_prompt(prompt, call_site="translation")
     
-    def explain_terminology(self, text: str) -> str:
+    def explain_terminology(self, text: str, focus: str = "") -> str:
         """解释术语"""
+        text = select_salient(text, STAGE_BUDGETS["terminology"], focus=focus)
         prompt = f"""
         请从以下论文内容中识别关键术语，并提供通俗易懂的解释：
 
@@ -202,10 +503,19 @@ class AIService:
            术语名称：解释内容
         """
         
-        return self._simple_prompt(prompt)
+        self._record_prompt("terminology", prompt)
+        return self._simple_prompt(prompt, call_site="terminology")
     
-    def analyze_research_context(self, title: str, abstract: str, key_content: str, references: str) -> str:
+    def analyze_research_context(self, title: str, abstract: str, key_content: str,
+                                 references: Union[str, List[str]]) -> str:
         """分析研究脉络"""
+        # 预算的 60% 给参考文献列表，其余给摘要；关键内容已是压缩后的总结，原样保留
+        budget = STAGE_BUDGETS["research_context"]
+        if isinstance(references, list):
+            references = fit_list(references, int(budget * 0.6))
+        else:
+            references = select_salient(references, int(budget * 0.6), focus=title)
+        abstract = select_salient(abstract or "", budget - int(budget * 0.6), focus=title)
         prompt = f"""
         基于以下论文信息，请分析其研究脉络和背景：
 
@@ -223,7 +533,8 @@ class AIService:
         请提供结构化的分析结果。
         """
         
-        return self._simple_prompt(prompt)
+        self._record_prompt("research_context", prompt)
+        return self._simple_prompt(prompt, call_site="research_context")
 
 
     def safe_text(self, text:str):
@@ -298,17 +609,15 @@ class AIService:
             if not self.qa_chain:
                 return "RAG 知识库未加载。无法回答问题。"
             try:
-                result = self.qa_chain.invoke({"query": query})
+                usage = TokenUsageHandler()
+                result = llm_gateway.run(
+                    "rag_qa", lambda: self.qa_chain.invoke({"query": query}, config={"callbacks": [usage]}),
+                    usage=usage.usage,
+                )
                 print(f"[AGENT_TOOL] RAG Search Tool Result: '{result}'")
                 prompt = self.safe_prompt_from_rag(query, result["result"])
                 print(f"[AGENT_TOOL] Final Prompt: '{prompt}']")
-                res = self.llm.invoke(prompt).content  # 直接调用 llm
-                if isinstance(res, str):
-                    return res
-                elif isinstance(res, list):
-                    return "\n".join([str(x) for x in res])
-                else:
-                    return str(res)
+                return llm_gateway.invoke(self.llm, prompt, call_site="rag_search_tool")
             except Exception as e:
                 return f"RAG 搜索时出错: {str(e)}"
 
@@ -319,6 +628,32 @@ class AIService:
         )
 
 
+    def _mindmap_prompt(self, topic: str, content: str) -> str:
+        return f"""
+        你是一个数据可视化专家。请根据以下内容，并且精炼概括出关键内容，控制文本长度，创建一个 Mermaid.js 格式的思维导图。
+        思维导图应以 '{topic}' 为中心主题，并清晰地展示信息的层级结构。
+
+        内容:
+        ---
+        {content}
+        ---
+
+        请严格按照 Mermaid mindmap 语法输出，不要包含任何其他解释或注释，直接给出代码。
+        """
+
+    def _flowchart_prompt(self, topic: str, content: str) -> str:
+        return f"""
+        你是一个流程图绘制专家。请根据以下描述的流程，并且精炼概括出关键内容，控制文本长度，创建一个 Mermaid.js 格式的自顶向下（TD）流程图。
+        流程图标题应为 '{topic}'。
+
+        流程描述内容:
+        ---
+        {content}
+        ---
+
+        请严格按照 Mermaid graph TD 语法输出，不要包含任何其他解释或注释，直接给出代码。
+        """
+
     def _get_generate_mindmap_mermaid_tool(self):
         @tool
         def generate_mindmap_mermaid(topic: str, content: Optional[str] = None) -> str:
@@ -335,26 +670,10 @@ class AIService:
                 if (content is None) or ("未能找到" in content) or ("无法回答" in content):
                     return f"无法为主题 '{topic}' 生成思维导图，因为在论文中找不到相关内容。"
 
-            prompt = f"""
-            你是一个数据可视化专家。请根据以下内容，并且精炼概括出关键内容，控制文本长度，创建一个 Mermaid.js 格式的思维导图。
-            思维导图应以 '{topic}' 为中心主题，并清晰地展示信息的层级结构。
-
-            内容:
-            ---
-            {content}
-            ---
-
-            请严格按照 Mermaid mindmap 语法输出，不要包含任何其他解释或注释，直接给出代码。
-            """
+            prompt = self._mindmap_prompt(topic, content)
             if not self.llm:
                 return "LLM 未初始化。"
-            res = self.llm.invoke(prompt).content
-            if isinstance(res, str):
-                return res
-            elif isinstance(res, list):
-                return "\n".join([str(x) for x in res])
-            else:
-                return str(res)
+            return llm_gateway.invoke(self.llm, prompt, call_site="mindmap_tool")
 
         return Tool.from_function(
             func=generate_mindmap_mermaid,
@@ -378,26 +697,10 @@ class AIService:
                 if (content is None) or ("未能找到" in content) or ("无法回答" in content):
                     return f"无法为主题 '{topic}' 生成流程图，因为在论文中找不到相关内容。"
 
-            prompt = f"""
-            你是一个流程图绘制专家。请根据以下描述的流程，并且精炼概括出关键内容，控制文本长度，创建一个 Mermaid.js 格式的自顶向下（TD）流程图。
-            流程图标题应为 '{topic}'。
-
-            流程描述内容:
-            ---
-            {content}
-            ---
-
-            请严格按照 Mermaid graph TD 语法输出，不要包含任何其他解释或注释，直接给出代码。
-            """
+            prompt = self._flowchart_prompt(topic, content)
             if not self.llm:
                 return "LLM 未初始化。"
-            res = self.llm.invoke(prompt).content
-            if isinstance(res, str):
-                return res
-            elif isinstance(res, list):
-                return "\n".join([str(x) for x in res])
-            else:
-                return str(res)
+            return llm_gateway.invoke(self.llm, prompt, call_site="flowchart_tool")
 
         return Tool.from_function(
             func=generate_flowchart_mermaid,
@@ -438,14 +741,77 @@ class AIService:
     #     # 如果是 JSON 但格式不对，也作为普通文本返回
     #     return {"answer": output}
 
+    def _retrieve_context(self, query: str, k: int = 3) -> str:
+        """只做检索（不调用 LLM），返回拼接后的相关段落"""
+        if not self.vectorstore:
+            return ""
+        documents = self.vectorstore.similarity_search(query, k=k)
+        return "\n\n".join(doc.page_content for doc in documents)
+
+    @staticmethod
+    def _strip_code_fence(text: str) -> str:
+        """去掉 LLM 输出中的 ```mermaid 代码块标记"""
+        text = text.strip()
+        match = re.match(r"^```[a-zA-Z]*\s*\n(.*?)\n?```$", text, re.DOTALL)
+        return match.group(1).strip() if match else text
+
+    def fast_answer(self, question: str, paper: Paper, intent: str, topic: str = "") -> Dict[str, Any]:
+        """
+        固定流水线：一次检索 + 一次 LLM 调用
+        - qa：检索后直接基于论文信息和检索内容回答
+        - mindmap / flowchart：检索后直接生成 Mermaid 代码
+        """
+        if not self.vectorstore and not self.load_rag(paper.id):
+            print(f"[ROUTER_WARNING] Could not load RAG for paper {paper.id}.")
+        topic = topic or paper.title or "论文关键内容"
+        context = self._retrieve_context(question if intent == INTENT_QA else topic)
+
+        if intent == INTENT_QA:
+            prompt = f"""
+            你是一个论文分析专家。请结合论文核心信息和检索到的原文内容，回答用户的问题，
+            提供一个学术权威又通俗易懂的解释。
+
+            # 论文核心信息
+            ## 标题: {paper.title}
+            ## 摘要: {paper.summary}
+            ## 关键内容总结:
+            {paper.key_content}
+
+            # 检索到的原文内容
+            ---
+            {context}
+            ---
+
+            用户的问题：{question}
+            """
+            return {"answer": self._simple_prompt(prompt, call_site="chat_qa"), "diagram": None}
+
+        # 图表：检索内容为空时退回论文的关键内容总结
+        content = context or paper.key_content or paper.summary or ""
+        if intent == INTENT_MINDMAP:
+            prompt, title = self._mindmap_prompt(topic, content), f"{topic}思维导图"
+        else:
+            prompt, title = self._flowchart_prompt(topic, content), f"{topic}流程图"
+        code = self._strip_code_fence(self._simple_prompt(prompt, call_site="chat_diagram"))
+        return {
+            "answer": "这是为您生成的图表：",
+            "diagram": {"type": "mermaid", "title": title, "code": code},
+        }
+
     def agentic_answer(self, question: str, paper: Paper) -> Dict[str, Any]:
         """
-        使用 Agent 来回答问题，返回统一格式：
+        回答问题，返回统一格式：
         {
             "answer": "...",
             "diagram": { ... } 或 None
         }
+        先由意图路由判断请求类型，能确定时走固定的快速流水线，否则使用 Agent
         """
+        intent, topic = route_intent(question, default_topic=paper.title or "")
+        print(f"[ROUTER] question='{question}' intent={intent} topic='{topic}'")
+        if intent is not None:
+            return self.fast_answer(question, paper, intent, topic)
+
         self.setup_agent(paper)
 
         if not self.agent_executor:
@@ -455,7 +821,13 @@ class AIService:
             }
 
         print(f"[AGENT_INVOKE] Invoking agent with question: '{question}'")
-        response = self.agent_executor.invoke({"input": question})
+        # Agent 内部的多轮调用作为一个整体受网关的并发和超时控制：只占一个名额（工具中的嵌套调用复用该名额），
+        # 不做超时重试，否则第一次仍在运行时会再跑一遍整个 Agent
+        usage = TokenUsageHandler()
+        response = llm_gateway.run(
+            "agent", lambda: self.agent_executor.invoke({"input": question}, config={"callbacks": [usage]}),
+            usage=usage.usage, max_retries=0, timeout=llm_gateway.timeout * AGENT_TIMEOUT_FACTOR,
+        )
         print(f"[AGENT_INVOKE] Get Raw response: '{response}'")
 
         output = response.get("output", "").strip()
@@ -0,0 +1,259 @@
+import importlib
+import os
+import time
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.paper import Paper
+from services.bibliography import batch_lookup, enrichment_text, parse_bibliography
+from services.element_store import save_elements
+from services.executors import parse_executor, embed_executor, llm_executor, parse_pdf_job
+from services.library_search import body_text, index_paper
+from services.parsed_store import ParsedDocument, parsed_path, write_parsed
+from services.precompute import delete_artifacts
+from services.storage import refresh_usage
+from services.warmup import create_ai_service
+
+if TYPE_CHECKING:
+    from services.ai_service import AIService
+
+# 分析阶段，按顺序执行；任务队列据此记录进度，崩溃后从下一个阶段继续
+STAGES = [
+    "parse",
+    "summary",
+    "key_content",
+    "translation",
+    "terminology",
+    "research_context",
+    "related_papers",
+    "rag",
+    "index",
+]
+
+
+async def _default_run_llm(func, *args):
+    return await llm_executor.run(func, *args)
+
+
+def _written_since(path: str, since: float) -> bool:
+    """文件是否在 since 之后写入（解析器在子进程中已落盘本次结果）"""
+    try:
+        return os.path.getmtime(path) >= since
+    except OSError:
+        return False
+
+
+# 送入关键内容提取的核心章节类型（与 chunker.SECTION_KINDS 对应）
+_CORE_SECTION_KINDS = {"abstract", "introduction", "method", "experiment", "result", "conclusion"}
+
+
+def _load_parsed(paper_id: int) -> Dict[str, Any]:
+    """读取解析结果；流式解析的大文件不读取章节和全文，由后续阶段从 parsed_store 逐块读取"""
+    with ParsedDocument.open(parsed_path(paper_id)) as doc:
+        return doc.to_dict(include_bulk=not doc.streamed)
+
+
+def _load_sections(paper_id: int, kinds: Set[str]) -> List[Dict[str, Any]]:
+    """只读取指定类型的章节（流式解析的大文件）"""
+    # chunker 依赖 LangChain，在执行器中按需导入
+    from services.chunker import classify_section
+
+    with ParsedDocument.open(parsed_path(paper_id)) as doc:
+        indices = [i for i, title in enumerate(doc.section_titles) if classify_section(title) in kinds]
+        return list(doc.iter_sections(indices))
+
+
+def _salient_full_text(paper_id: int, focus: str) -> str:
+    """逐块读取全文并在术语解释的预算内选句（流式解析的大文件）"""
+    from services.prompt_budget import STAGE_BUDGETS, select_salient_blocks
+
+    with ParsedDocument.open(parsed_path(paper_id)) as doc:
+        return select_salient_blocks(doc.iter_full_text(), STAGE_BUDGETS["terminology"], focus)
+
+
+def _setup_rag_streamed(ai_service: "AIService", parsed_data: Dict[str, Any], extra_texts: List[str],
+                        paper_id: int, user_id: Optional[int]) -> bool:
+    """逐章节读取、分块并写入向量索引（流式解析的大文件）"""
+    with ParsedDocument.open(parsed_path(paper_id)) as doc:
+        return ai_service.setup_rag_from_parsed(parsed_data, extra_texts, paper_id, user_id, doc.iter_sections())
+
+
+def _load_body_text(paper_id: int) -> str:
+    """逐章节读取并拼接全库检索的正文（流式解析的大文件）"""
+    with ParsedDocument.open(parsed_path(paper_id)) as doc:
+        return body_text({}, doc.iter_sections())
+
+
+async def run_analysis_pipeline(
+    paper: Paper,
+    db: AsyncSession,
+    run_llm: Callable[..., Awaitable[Any]] = _default_run_llm,
+    completed_stage: Optional[str] = None,
+    on_stage_done: Optional[Callable[[str], Awaitable[None]]] = None,
+) -> Tuple[Dict[str, Any], "AIService"]:
+    """
+    执行论文分析流水线
+    - run_llm：LLM / HTTP 阶段的执行方式（API 中经过公平调度，worker 中直接执行）
+    - completed_stage：已完成的最后一个阶段，之前的阶段跳过（解析结果从 parsed_store 读取）
+    - on_stage_done：每个阶段完成后回调，worker 用它提交结果并校验租约
+    返回 (parsed_data, ai_service)
+    """
+    # services.tools 依赖 LangChain，首次执行流水线时在执行器中导入，不阻塞事件循环
+    tools = await embed_executor.run(importlib.import_module, "services.tools")
+
+    done_index = STAGES.index(completed_stage) if completed_stage else -1
+
+    def pending(stage: str) -> bool:
+        return STAGES.index(stage) > done_index
+
+    async def finish(stage: str):
+        if on_stage_done is not None:
+            await on_stage_done(stage)
+
+    if pending("parse"):
+        # 解析在进程池中执行，事件循环可继续响应其他请求
+        parse_started = time.time()
+        parsed_data = await parse_executor.run(parse_pdf_job, paper.id, paper.file_path)
+        print(f"[ANALYZE] PDF parse finished")
+        if parsed_data.get("streamed"):
+            # 流式解析只返回轻量结果，章节和全文已写入 parsed_store，不经进程间传递
+            parsed_data = await embed_executor.run(_load_parsed, paper.id)
+        elif not _written_since(parsed_path(paper.id), parse_started):
+            # parsed.epk 的 mtime 是答案缓存和图表产物的失效标记，解析器未写入本次结果时必须覆盖旧文件
+            write_parsed(parsed_data, parsed_path(paper.id))
+
+        if parsed_data.get("streamed"):
+            # 章节逐个从 parsed_store 读取，按批写入，不在内存中保留全部元素
+            with await embed_executor.run(ParsedDocument.open, parsed_path(paper.id)) as doc:
+                elements_count = await save_elements(db, paper.id, parsed_data, doc.iter_sections())
+        else:
+            elements_count = await save_elements(db, paper.id, parsed_data)
+        await delete_artifacts(db, paper.id)
+        print(f"[ANALYZE] 已保存 {elements_count} 个论文元素用于全文检索")
+
+        paper.title = parsed_data.get('title', paper.original_filename)
+        paper.authors = ', '.join(parsed_data.get('authors', []))
+        paper.abstract = parsed_data.get('abstract', '')
+
+        print(f"[ANALYZE] 已保存 paper.title: {paper.title}")
+        print(f"[ANALYZE] 已保存 paper.authors: {paper.authors}")
+        print(f"[ANALYZE] 已保存 paper.abstract: {paper.abstract[:100]}...")
+        await finish("parse")
+    else:
+        parsed_data = await embed_executor.run(_load_parsed, paper.id)
+        print(f"[ANALYZE] 从已保存的解析结果继续，上次完成阶段: {completed_stage}")
+
+    # 导入和构造时会加载 LangChain 与向量模型，同样放到执行器中
+    ai_service = await embed_executor.run(create_ai_service)
+
+    if pending("summary"):
+        if paper.abstract and paper.title:
+            paper.summary = await run_llm(ai_service.generate_summary, paper.abstract, paper.title)
+            print(f"[ANALYZE] 已生成并保存 paper.summary")
+        else:
+            paper.summary = f"这是一篇关于{paper.title}的学术论文。"
+        await finish("summary")
+
+    if pending("key_content"):
+        if parsed_data.get("streamed"):
+            core_sections = await embed_executor.run(_load_sections, paper.id, _CORE_SECTION_KINDS)
+        else:
+            core_sections = parsed_data.get('sections',[])
+        key_sections = tools.extract_core_sections(core_sections)
+
+        if key_sections:
+            paper.key_content = await run_llm(ai_service.extract_key_content, key_sections, paper.title)
+            print(f"[ANALYZE] 已生成并保存 paper.key_content")
+        else:
+            paper.key_content = "未提取到有效的key_sections"
+        await finish("key_content")
+
+    if pending("translation"):
+        if paper.abstract:
+            paper.translation = await run_llm(ai_service.translate_text, paper.abstract)
+            print(f"[ANALYZE] 已完成摘要翻译（目前是demo版本）")
+        else:
+            paper.translation = "未提取到有效的摘要内容"
+        await finish("translation")
+
+    if pending("terminology"):
+        if parsed_data.get("streamed"):
+            # 全文逐块选句，不整体读入内存
+            full_text = await embed_executor.run(_salient_full_text, paper.id, paper.title or "")
+        else:
+            full_text = parsed_data.get('full_text', '')
+        if full_text:
+            paper.terminology = await run_llm(ai_service.explain_terminology, full_text, paper.title)
+            print(f"[ANALYZE] 已生成术语解释")
+        else:
+            paper.terminology = "未提取到full_text文本内容。"
+        await finish("terminology")
+
+    if pending("research_context"):
+        paper_references = parsed_data.get('references', [])
+        paper.research_context = await run_llm(
+            ai_service.analyze_research_context,
+            paper.title, paper.abstract, paper.key_content, paper_references
+        )
+        print(f"[ANALYZE] Research context analyzed")
+        await finish("research_context")
+
+    if pending("related_papers"):
+        # --- 新增：调用Semantic Scholar服务 ---
+        print(f"[ANALYZE] Fetching related papers from Semantic Scholar for title: {paper.title}")
+        related_data = await run_llm(ai_service.fetch_related_papers, paper.title)
+        paper.s2_id = related_data.get('s2_id')
+        paper.related_papers_json = related_data.get('related_papers_json')
+        print(f"[ANALYZE] Semantic Scholar data fetched. S2 ID: {paper.s2_id}")
+        await finish("related_papers")
+
+    if pending("rag"):
+        # rag 构建
+        # 首先，取出结构化的参考文献；带 DOI / arXiv 号的条目批量精确查询
+        bibliography = parsed_data.get('bibliography') or parse_bibliography(parsed_data.get('references', []))
+        if bibliography:
+            resolved = await run_llm(batch_lookup, bibliography, ai_service.s2_api_base)
+            rag_chunks = [enrichment_text(found) for found in resolved if found]
+            # 只有没有标识符（或未命中）的条目才按标题逐条检索
+            titles = [entry['title'] for entry, found in zip(bibliography, resolved)
+                      if not found and entry['title']]
+        else:
+            # 没有识别到参考文献区时沿用旧的提取方式
+            rag_chunks = []
+            if parsed_data.get("streamed"):
+                references_source = {**parsed_data, "sections": await embed_executor.run(
+                    _load_sections, paper.id, {"references"})}
+            else:
+                references_source = parsed_data
+            titles = [tools.extract_reference_title(reference)
+                      for reference in tools.extract_references_section(references_source)]
+
+        # 根据标题构建增强内容
+        if titles:
+            rag_chunks += await run_llm(tools.build_rag_chunks_from_titles, titles)
+
+        print(f"[ANALYZE] RAG chunks built: {len(rag_chunks)} items")
+        print(f"[ANALYZE] RAG chunks[0]: {rag_chunks[0] if rag_chunks else 'No chunks available'}")
+
+        # 按章节结构分块，参考文献增强内容作为独立分块
+        if parsed_data.get("streamed"):
+            await embed_executor.run(
+                _setup_rag_streamed, ai_service, parsed_data, rag_chunks, paper.id, paper.user_id
+            )
+        else:
+            await embed_executor.run(
+                ai_service.setup_rag_from_parsed, parsed_data, rag_chunks, paper.id, paper.user_id
+            )
+        print(f"[ANALYZE] RAG setup completed")
+        await finish("rag")
+
+    if pending("index"):
+        body = await embed_executor.run(_load_body_text, paper.id) if parsed_data.get("streamed") else None
+        await index_paper(db, paper, parsed_data, body)
+        print(f"[ANALYZE] 已更新全库检索索引")
+        paper.processing_status = 'completed'
+        await refresh_usage(db, paper)
+        await finish("index")
+
+    return parsed_data, ai_service
@@ -0,0 +1,176 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from configs import (
+    ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_MAX_ENTRIES,
+)
+from models.paper import ChatSession, Paper
+from services.executors import embed_executor
+from services.intent_router import route as route_intent
+from services.parsed_store import parsed_path
+
+
+def _embed(texts: List[str]) -> np.ndarray:
+    """在执行器线程中向量化问题并归一化（向量模型按需导入）"""
+    from services.embeddings import get_embeddings
+    vectors = np.asarray(get_embeddings().embed_documents(texts), dtype=np.float32)
+    return vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+
+
+def analysis_marker(paper_id: int) -> float:
+    """论文最近一次解析的时间（解析结果文件的 mtime），早于它的问答视为过期"""
+    try:
+        return os.path.getmtime(parsed_path(paper_id))
+    except OSError:
+        return 0.0
+
+
+def _intent(question: str) -> Optional[str]:
+    return route_intent(question)[0]
+
+
+def _cacheable(result: Dict[str, Any]) -> bool:
+    return bool((result.get("answer") or "").strip() or result.get("diagram"))
+
+
+class _PaperEntries:
+    def __init__(self, marker: float):
+        self.marker = marker
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.items: List[Tuple[Optional[str], Dict[str, Any], float]] = []  # (intent, result, created_at)
+
+
+class SemanticAnswerCache:
+    """
+    按论文缓存问答结果：新问题向量与已答问题向量的余弦相似度超过阈值、
+    且路由意图一致（问答 / 思维导图 / 流程图）时，直接返回已有的 {answer, diagram}
+    - 进程内首次访问某论文时从 ChatSession 历史记录加载
+    - 超过 TTL 的条目不再命中；论文重新解析后（analysis_marker 变化）整体失效
+    """
+
+    def __init__(self, threshold: float = ANSWER_CACHE_THRESHOLD, ttl_seconds: int = ANSWER_CACHE_TTL_SECONDS,
+                 max_entries: int = ANSWER_CACHE_MAX_ENTRIES):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._papers: Dict[int, _PaperEntries] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def is_loaded(self, paper_id: int, marker: float) -> bool:
+        with self._lock:
+            entries = self._papers.get(paper_id)
+            return entries is not None and entries.marker == marker
+
+    def load(self, paper_id: int, marker: float, vectors: np.ndarray,
+             items: List[Tuple[Optional[str], Dict[str, Any], float]]):
+        entries = _PaperEntries(marker)
+        entries.vectors, entries.items = vectors, items
+        with self._lock:
+            self._papers[paper_id] = entries
+
+    def add(self, paper_id: int, vector: np.ndarray, intent: Optional[str], result: Dict[str, Any]):
+        if not _cacheable(result):
+            return
+        with self._lock:
+            entries = self._papers.get(paper_id)
+            if entries is None:
+                return
+            vectors = vector[None, :] if entries.vectors.size == 0 else np.vstack([entries.vectors, vector])
+            entries.items.append((intent, result, time.time()))
+            # 超出上限时丢弃最早的条目
+            entries.vectors = vectors[-self.max_entries:]
+            entries.items = entries.items[-self.max_entries:]
+
+    def lookup(self, paper_id: int, vector: np.ndarray, intent: Optional[str]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entries = self._papers.get(paper_id)
+            if entries is None or entries.vectors.size == 0:
+                self.misses += 1
+                return None
+            scores = entries.vectors @ vector
+            oldest = time.time() - self.ttl_seconds
+            for index in np.argsort(-scores):
+                if scores[index] < self.threshold:
+                    break
+                cached_intent, result, created_at = entries.items[index]
+                if cached_intent == intent and created_at >= oldest:
+                    self.hits += 1
+                    print(f"[ANSWER_CACHE] paper_id={paper_id} hit, similarity={scores[index]:.3f}")
+                    return result
+            self.misses += 1
+            return None
+
+    def invalidate(self, paper_id: int):
+        with self._lock:
+            self._papers.pop(paper_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "papers": len(self._papers),
+                "entries": sum(len(entries.items) for entries in self._papers.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+answer_cache = SemanticAnswerCache()
+
+
+async def _ensure_loaded(db: AsyncSession, paper_id: int, marker: float):
+    if answer_cache.is_loaded(paper_id, marker):
+        return
+    oldest = max(marker, time.time() - answer_cache.ttl_seconds)
+    result = await db.execute(
+        select(ChatSession)
+        .filter(ChatSession.paper_id == paper_id, ChatSession.timestamp >= datetime.utcfromtimestamp(oldest))
+        .order_by(ChatSession.id.desc())
+        .limit(answer_cache.max_entries)
+    )
+    questions, items = [], []
+    for row in reversed(result.scalars().all()):
+        try:
+            answer = json.loads(row.answer)
+        except (TypeError, json.JSONDecodeError):
+            continue
+        # 缓存命中时保存的记录不再加载，避免同一回答反复续期
+        if not isinstance(answer, dict) or answer.get("cached") or not _cacheable(answer):
+            continue
+        created_at = (row.timestamp - datetime.utcfromtimestamp(0)).total_seconds()
+        questions.append(row.question)
+        items.append((_intent(row.question), {"answer": answer.get("answer", ""), "diagram": answer.get("diagram")},
+                      created_at))
+    vectors = await embed_executor.run(_embed, questions) if questions else np.zeros((0, 0), dtype=np.float32)
+    answer_cache.load(paper_id, marker, vectors, items)
+    print(f"[ANSWER_CACHE] paper_id={paper_id} 从历史记录加载 {len(items)} 条问答")
+
+
+async def lookup_answer(db: AsyncSession, paper: Paper, question: str) -> Tuple[Optional[Dict[str, Any]], Any]:
+    """
+    查询语义缓存，返回 (缓存的结果或 None, 用于 store_answer 的问题向量及意图)
+    论文未完成分析时不使用缓存
+    """
+    if paper.processing_status != 'completed':
+        return None, None
+    marker = analysis_marker(paper.id)
+    await _ensure_loaded(db, paper.id, marker)
+    vector = (await embed_executor.run(_embed, [question]))[0]
+    intent = _intent(question)
+    return answer_cache.lookup(paper.id, vector, intent), (vector, intent)
+
+
+def store_answer(paper_id: int, key: Any, result: Dict[str, Any]):
+    """将新生成的回答加入缓存；key 为 lookup_answer 返回的问题向量及意图"""
+    if key is not None:
+        vector, intent = key
+        answer_cache.add(paper_id, vector, intent, result)
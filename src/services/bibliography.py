@@ -0,0 +1,178 @@
+"""
+参考文献解析
+
+一次遍历把参考文献区切成条目，并用预编译的正则抽取 DOI、arXiv 号、年份、作者和标题：
+- 条目边界：行首的 [n] / n. / n) 编号；无编号时按“作者, 首字母. ... (年份)”式的行首切分
+- 带 DOI / arXiv 号的条目可通过 Semantic Scholar 的 /paper/batch 接口一次精确查询，
+  只有没有标识符的条目才需要逐条按标题检索
+"""
+import re
+import time
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+from configs import S2_API_BASE
+
+S2_BATCH_SIZE = 500  # /paper/batch 单次最多 500 个 id
+S2_BATCH_FIELDS = "title,abstract,year,externalIds"
+
+# 参考文献区标题
+REFERENCE_HEADING = re.compile(
+    r"^\s*(?:\d+\.?\s*|[IVX]+\.\s*)?(references?|bibliography|literature cited|参考文献)\s*:?\s*$",
+    re.IGNORECASE,
+)
+
+# 编号条目：[12] / 12. / 12)
+_NUMBERED_START = re.compile(r"(?:^|\n|\s)(?=\[\d{1,3}\]\s|\d{1,3}[.)]\s+[A-Z一-鿿])")
+# 作者-年份格式的条目起点：换行后紧跟 “Surname, X.” 或 “Surname X,”
+_AUTHOR_YEAR_START = re.compile(
+    r"\n(?=[A-Z][A-Za-z'\-]+(?:\s[A-Z][A-Za-z'\-]+)?,\s(?:[A-Z]\.|[A-Z][a-z]+)[^\n]{0,200}?\b(?:19|20)\d{2})"
+)
+_LABEL = re.compile(r"^\s*(?:\[(\d{1,3})\]|(\d{1,3})[.)])\s*")
+
+_DOI = re.compile(r"\b(10\.\d{4,9}/[^\s\"<>,;]+)", re.IGNORECASE)
+_ARXIV_NEW = re.compile(r"\barxiv\s*(?:preprint\s*)?:?\s*(?:abs/)?(\d{4}\.\d{4,5})(?:v\d+)?\b", re.IGNORECASE)
+_ARXIV_URL = re.compile(r"arxiv\.org/(?:abs|pdf)/(\d{4}\.\d{4,5}|[a-z\-]+(?:\.[A-Z]{2})?/\d{7})(?:v\d+)?", re.IGNORECASE)
+_ARXIV_OLD = re.compile(r"\barxiv\s*:?\s*([a-z\-]+(?:\.[A-Z]{2})?/\d{7})(?:v\d+)?", re.IGNORECASE)
+_YEAR = re.compile(r"(?<!\d)((?:19|20)\d{2})[a-z]?(?!\d)")
+_QUOTED_TITLE = re.compile(r"[\"“”]([^\"“”]{8,300}?)[,.]?[\"“”]")
+_URL = re.compile(r"https?://\S+")
+_SPACES = re.compile(r"\s+")
+# 作者段的结束位置：年份括号或第一个“. ”（跳过首字母缩写，如 “J. Smith”）
+_AUTHORS_END = re.compile(r"\s*\((?:19|20)\d{2}[a-z]?\)\.?\s*|(?<![A-Z])(?<!\b[A-Z][a-z])\.\s+(?=[A-Z一-鿿\"“])")
+_AUTHOR_SPLIT = re.compile(r"\s*(?:,\s*and\s+|\band\s+|;\s*|,?\s*&\s*|(?<=\.),\s*|,\s*(?=[A-Z][a-z]*\.?\s))")
+
+
+def is_reference_heading(text: str) -> bool:
+    """判断一行文字是否是参考文献区的标题"""
+    return bool(text) and len(text) < 40 and bool(REFERENCE_HEADING.match(text))
+
+
+def split_entries(text: str) -> List[str]:
+    """把参考文献区文本切成条目；优先按编号切分，没有编号时按作者-年份行首切分"""
+    text = (text or "").strip()
+    if not text:
+        return []
+    if _LABEL.match(text):
+        parts = _NUMBERED_START.split(text)
+    else:
+        parts = _AUTHOR_YEAR_START.split(text)
+    return [_SPACES.sub(" ", part).strip() for part in parts if part and part.strip()]
+
+
+def _clean_identifier(value: str) -> str:
+    return value.rstrip(".)]")
+
+
+def _parse_authors(segment: str) -> List[str]:
+    segment = segment.strip().rstrip(".,")
+    if not segment or len(segment) > 400:
+        return []
+    authors = [a.strip(" ,.") for a in _AUTHOR_SPLIT.split(segment)]
+    return [a for a in authors if a and a.lower() not in ("et al", "others")][:50]
+
+
+def parse_entry(raw: str) -> Dict[str, Any]:
+    """解析单条参考文献，返回 label / doi / arxiv_id / year / authors / title / raw"""
+    text = _SPACES.sub(" ", raw).strip()
+    label = None
+    match = _LABEL.match(text)
+    if match:
+        label = match.group(1) or match.group(2)
+        text = text[match.end():]
+
+    doi = _DOI.search(text)
+    arxiv = _ARXIV_URL.search(text) or _ARXIV_NEW.search(text) or _ARXIV_OLD.search(text)
+    year = _YEAR.search(text)
+
+    body = _URL.sub("", text)
+    authors_segment, title = "", ""
+    quoted = _QUOTED_TITLE.search(body)
+    if quoted:
+        authors_segment = body[:quoted.start()]
+        title = quoted.group(1)
+    else:
+        end = _AUTHORS_END.search(body)
+        if end:
+            authors_segment = body[:end.start()]
+            rest = body[end.end():]
+            # 标题取作者段之后的第一句
+            title = re.split(r"(?<=[a-z0-9)\]?])\.\s|\.\s*(?:In|Proceedings|arXiv)\b|[?!]\s", rest, maxsplit=1)[0]
+    title = title.strip(" .,\"“”")
+    if len(title) < 8:
+        title = ""
+
+    return {
+        "label": label,
+        "doi": _clean_identifier(doi.group(1)).lower() if doi else None,
+        "arxiv_id": _clean_identifier(arxiv.group(1)) if arxiv else None,
+        "year": int(year.group(1)) if year else None,
+        "authors": _parse_authors(authors_segment),
+        "title": title,
+        "raw": raw.strip(),
+    }
+
+
+def parse_bibliography(references: Union[str, Iterable[str]]) -> List[Dict[str, Any]]:
+    """把参考文献区（整段文本或解析器给出的段落列表）一次性解析为结构化条目"""
+    text = references if isinstance(references, str) else "\n".join(r for r in references if r)
+    entries = []
+    for raw in split_entries(text):
+        # 跳过残留的“References”标题或过短的碎片
+        if is_reference_heading(raw) or len(raw) < 15:
+            continue
+        entries.append(parse_entry(raw))
+    return entries
+
+
+def lookup_id(entry: Dict[str, Any]) -> Optional[str]:
+    """Semantic Scholar 可识别的外部 id"""
+    if entry.get("doi"):
+        return f"DOI:{entry['doi']}"
+    if entry.get("arxiv_id"):
+        return f"ARXIV:{entry['arxiv_id']}"
+    return None
+
+
+def _post_batch(ids: List[str], api_base: str, max_retries: int = 3) -> List[Optional[Dict[str, Any]]]:
+    import requests
+
+    url = f"{api_base}/paper/batch"
+    for attempt in range(max_retries):
+        try:
+            response = requests.post(url, params={"fields": S2_BATCH_FIELDS}, json={"ids": ids}, timeout=30)
+            response.raise_for_status()
+            return response.json()
+        except requests.RequestException as e:
+            if e.response is not None and e.response.status_code == 429:
+                wait_time = 5 * (2 ** attempt)
+                print(f"[BIBLIO] S2 batch rate limited, retrying in {wait_time}s ({attempt + 1}/{max_retries})")
+                time.sleep(wait_time)
+            else:
+                print(f"[BIBLIO] S2 batch request failed: {e}")
+                break
+    return [None] * len(ids)
+
+
+def batch_lookup(entries: List[Dict[str, Any]], api_base: str = S2_API_BASE) -> List[Optional[Dict[str, Any]]]:
+    """按 DOI / arXiv 号批量精确查询，结果与 entries 一一对应，查不到或无标识符的为 None"""
+    results: List[Optional[Dict[str, Any]]] = [None] * len(entries)
+    pending = [(i, lookup_id(entry)) for i, entry in enumerate(entries)]
+    pending = [(i, paper_id) for i, paper_id in pending if paper_id]
+    for start in range(0, len(pending), S2_BATCH_SIZE):
+        chunk = pending[start:start + S2_BATCH_SIZE]
+        papers = _post_batch([paper_id for _, paper_id in chunk], api_base)
+        for (i, _), paper in zip(chunk, papers):
+            results[i] = paper
+    print(f"[BIBLIO] {len(pending)}/{len(entries)} 条参考文献带标识符，"
+          f"精确命中 {sum(1 for r in results if r)} 条")
+    return results
+
+
+def enrichment_text(paper: Dict[str, Any]) -> str:
+    """把 S2 返回的论文信息整理为参考文献增强分块的文本"""
+    parts = [f"Title: {paper.get('title') or ''}"]
+    if paper.get("year"):
+        parts.append(f"Year: {paper['year']}")
+    if paper.get("abstract"):
+        parts.append(f"Abstract: {paper['abstract']}")
+    return "\n".join(parts)
@@ -0,0 +1,152 @@
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from langchain.schema import Document
+
+# 章节标题关键词 -> 规范化章节类型（与 PDFParser.extract_key_sections 的划分一致）
+SECTION_KINDS = {
+    "abstract": ["abstract", "摘要"],
+    "introduction": ["introduction", "背景", "引言"],
+    "related_work": ["related work", "background", "相关工作"],
+    "method": ["method", "approach", "model", "方法", "算法"],
+    "experiment": ["experiment", "evaluation", "实验", "评估"],
+    "result": ["result", "finding", "结果", "发现"],
+    "conclusion": ["conclusion", "summary", "结论", "总结"],
+    "references": ["references", "bibliography", "参考文献"],
+}
+
+_SENTENCE_END = re.compile(r"(?<=[.!?。！？])\s+")
+
+
+def classify_section(title: str) -> str:
+    """根据章节标题返回规范化的章节类型，用于检索时按章节过滤"""
+    title_lower = (title or "").lower()
+    for kind, keywords in SECTION_KINDS.items():
+        if any(keyword in title_lower for keyword in keywords):
+            return kind
+    return "other"
+
+
+class SectionChunker:
+    """
+    按论文结构分块：
+    - 以章节为边界，分块不会跨章节
+    - 章节内按段落累积到 chunk_size，段落过长时再按句子切分
+    - 不做重叠，每个分块带 section / section_kind / page / element_type 元数据
+    """
+
+    # 分块逻辑变化时递增，已有向量索引随之视为过期（见 services.vector_index）
+    VERSION = 1
+
+    def __init__(self, chunk_size: int = 1200, min_chunk_size: int = 200):
+        self.chunk_size = chunk_size
+        self.min_chunk_size = min_chunk_size
+
+    @property
+    def signature(self) -> str:
+        return f"section-v{self.VERSION}:{self.chunk_size}:{self.min_chunk_size}"
+
+    def _split_long(self, text: str) -> List[str]:
+        """按句子切分超长段落；单句仍超长时按字符硬切"""
+        pieces, current = [], ""
+        for sentence in _SENTENCE_END.split(text):
+            while len(sentence) > self.chunk_size:
+                if current:
+                    pieces.append(current)
+                    current = ""
+                pieces.append(sentence[:self.chunk_size])
+                sentence = sentence[self.chunk_size:]
+            if current and len(current) + len(sentence) + 1 > self.chunk_size:
+                pieces.append(current)
+                current = sentence
+            else:
+                current = f"{current} {sentence}" if current else sentence
+        if current:
+            pieces.append(current)
+        return pieces
+
+    def _chunk_paragraphs(self, paragraphs: List[str], pages: List[Optional[int]]) -> List[Dict[str, Any]]:
+        chunks, buffer, buffer_page = [], [], None
+        size = 0
+
+        def flush():
+            nonlocal buffer, buffer_page, size
+            if buffer:
+                chunks.append({"text": "\n".join(buffer), "page": buffer_page})
+            buffer, buffer_page, size = [], None, 0
+
+        for i, paragraph in enumerate(paragraphs):
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+            page = pages[i] if i < len(pages) else None
+            for piece in (self._split_long(paragraph) if len(paragraph) > self.chunk_size else [paragraph]):
+                if size and size + len(piece) + 1 > self.chunk_size:
+                    flush()
+                if buffer_page is None:
+                    buffer_page = page
+                buffer.append(piece)
+                size += len(piece) + 1
+        flush()
+
+        # 末尾过短的分块并入前一块（仍受 chunk_size 约束）
+        if len(chunks) > 1 and len(chunks[-1]["text"]) < self.min_chunk_size \
+                and len(chunks[-2]["text"]) + len(chunks[-1]["text"]) + 1 <= self.chunk_size:
+            last = chunks.pop()
+            chunks[-1]["text"] += "\n" + last["text"]
+        return chunks
+
+    @staticmethod
+    def _metadata(section: str, element_type: str, page: Optional[int]) -> Dict[str, Any]:
+        # Chroma 的 metadata 不接受 None
+        metadata = {
+            "section": section or "",
+            "section_kind": classify_section(section),
+            "element_type": element_type,
+        }
+        if page is not None:
+            metadata["page"] = page
+        return metadata
+
+    def iter_chunks(self, parsed_data: Dict[str, Any], extra_texts: Optional[List[str]] = None,
+                    sections: Optional[Iterable[Dict[str, Any]]] = None) -> Iterator[Document]:
+        """
+        逐个生成带元数据的 Document；extra_texts 为参考文献增强内容
+        sections 为空时取 parsed_data["sections"]，大文件可传入从 parsed_store 逐个读取章节的迭代器
+        """
+        if parsed_data.get("abstract"):
+            yield Document(
+                page_content=parsed_data["abstract"],
+                metadata=self._metadata("Abstract", "abstract", None),
+            )
+
+        for section in parsed_data.get("sections", []) if sections is None else sections:
+            title = section.get("title", "")
+            for chunk in self._chunk_paragraphs(section.get("content", []), section.get("pages", [])):
+                # 分块开头带上章节标题，便于向量检索和阅读
+                yield Document(
+                    page_content=f"{title}\n{chunk['text']}" if title else chunk["text"],
+                    metadata=self._metadata(title, "paragraph", chunk["page"]),
+                )
+
+        for table in parsed_data.get("tables", []):
+            content = (table.get("content") or "").strip()
+            if not content:
+                continue
+            page = (table.get("metadata") or {}).get("page_number")
+            for piece in self._split_long(content) if len(content) > self.chunk_size else [content]:
+                yield Document(
+                    page_content=piece,
+                    metadata=self._metadata(table.get("section", ""), "table", page),
+                )
+
+        for text in extra_texts or []:
+            if text and text.strip():
+                yield Document(
+                    page_content=text,
+                    metadata=self._metadata("References", "reference_enrichment", None),
+                )
+
+    def chunk(self, parsed_data: Dict[str, Any], extra_texts: Optional[List[str]] = None) -> List[Document]:
+        """将 parse_pdf 的结果转换为带元数据的 Document 列表；extra_texts 为参考文献增强内容"""
+        return list(self.iter_chunks(parsed_data, extra_texts))
@@ -0,0 +1,168 @@
+import re
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from sqlalchemy import delete, insert, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.paper import PaperElement
+from services.executors import embed_executor
+from services.memory_guard import MemoryGuard
+
+# trigram 分词下每个字符位置都是一个词，snippet 的长度按字符计
+SNIPPET_TOKENS = 48
+SNIPPET_CHARS = 48
+# 元素按批写入，大文件不一次性在内存中生成全部元素
+ELEMENT_BATCH_SIZE = 1000
+
+
+def iter_elements(parsed_data: Dict[str, Any],
+                  sections: Optional[Iterable[Dict[str, Any]]] = None) -> Iterator[Dict[str, Any]]:
+    """将 parse_pdf 的结果展开为 (kind, section, page, text) 行；sections 为空时取 parsed_data["sections"]"""
+    for section in parsed_data.get("sections", []) if sections is None else sections:
+        pages = section.get("pages", [])
+        for i, content in enumerate(section.get("content", [])):
+            yield {
+                "kind": "paragraph",
+                "section": section.get("title", ""),
+                "page": pages[i] if i < len(pages) else None,
+                "text": content,
+            }
+
+    for table in parsed_data.get("tables", []):
+        yield {
+            "kind": "table",
+            "section": table.get("section", ""),
+            "page": (table.get("metadata") or {}).get("page_number"),
+            "text": table.get("content", ""),
+        }
+
+    formula_pages = parsed_data.get("formula_pages", [])
+    for i, formula in enumerate(parsed_data.get("formulas", [])):
+        yield {
+            "kind": "formula",
+            "section": "",
+            "page": formula_pages[i] if i < len(formula_pages) else None,
+            "text": formula,
+        }
+
+    reference_pages = parsed_data.get("reference_pages", [])
+    for i, reference in enumerate(parsed_data.get("references", [])):
+        yield {
+            "kind": "reference",
+            "section": "References",
+            "page": reference_pages[i] if i < len(reference_pages) else None,
+            "text": reference,
+        }
+
+
+async def save_elements(db: AsyncSession, paper_id: int, parsed_data: Dict[str, Any],
+                        sections: Optional[Iterable[Dict[str, Any]]] = None) -> int:
+    """
+    保存论文元素（重新分析时先清空旧数据），由调用方负责 commit
+    按批生成并写入：sections 可以是从 parsed_store 逐个读取章节的迭代器（大文件），
+    读取和展开在执行器中进行，内存中只保留当前一批；每批后检查本任务的内存增量，超出上限时批次减半
+    """
+    await db.execute(delete(PaperElement).where(PaperElement.paper_id == paper_id))
+    rows = (
+        {"paper_id": paper_id, "ordinal": ordinal, **row}
+        for ordinal, row in enumerate(iter_elements(parsed_data, sections))
+        if row["text"] and row["text"].strip()
+    )
+    guard = MemoryGuard(f"paper_id={paper_id} 元素入库")
+    batch_size, count = ELEMENT_BATCH_SIZE, 0
+    while True:
+        batch = await embed_executor.run(lambda size: list(islice(rows, size)), batch_size)
+        if not batch:
+            break
+        await db.execute(insert(PaperElement), batch)
+        count += len(batch)
+        batch_size = guard.next_size(batch_size)
+    return count
+
+
+def to_fts_query(query: str) -> str:
+    """把用户输入转换为安全的 FTS5 查询：每个词加引号，词之间为 AND"""
+    terms = [term.replace('"', '""') for term in query.split()]
+    return " ".join(f'"{term}"' for term in terms if term)
+
+
+def _paper_token(paper_id: int) -> str:
+    return f"<p{paper_id}>"
+
+
+def _like_pattern(term: str) -> str:
+    return "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def _highlight(text_value: str, terms: List[str], width: int = SNIPPET_CHARS) -> str:
+    """没有 FTS 匹配可用时（只有短词）在 Python 中截取并高亮片段"""
+    lower = text_value.lower()
+    hit = min((i for i in (lower.find(term.lower()) for term in terms) if i >= 0), default=0)
+    start = max(0, hit - width // 3)
+    fragment = text_value[start:start + width]
+    # 所有词合成一个正则一次替换（长词优先），避免后面的词匹配到已插入的 <mark> 标签
+    pattern = "|".join(re.escape(term) for term in sorted(set(terms), key=len, reverse=True))
+    if pattern:
+        fragment = re.sub(pattern, lambda m: f"<mark>{m.group(0)}</mark>", fragment, flags=re.IGNORECASE)
+    return ("…" if start > 0 else "") + fragment + ("…" if start + width < len(text_value) else "")
+
+
+async def search_elements(
+    db: AsyncSession,
+    paper_id: int,
+    query: str,
+    kind: Optional[str] = None,
+    limit: int = 20,
+) -> List[Dict[str, Any]]:
+    """
+    论文内全文检索，按 bm25 排序返回带页码的高亮片段
+    索引使用 trigram 分词，只能匹配 ≥3 个字符的词；更短的词（如两字中文词）在本论文的元素内用 LIKE 过滤
+    """
+    terms = [term for term in query.split() if term]
+    long_terms = [term for term in terms if len(term) >= 3]
+    short_terms = [term for term in terms if len(term) < 3]
+    if not terms:
+        return []
+
+    params: Dict[str, Any] = {"paper_id": paper_id, "limit": limit}
+    filters = []
+    if kind:
+        filters.append("AND e.kind = :kind")
+        params["kind"] = kind
+    for i, term in enumerate(short_terms):
+        filters.append(f"AND e.text LIKE :like{i} ESCAPE '\\'")
+        params[f"like{i}"] = _like_pattern(term)
+
+    if not long_terms:
+        # 只有短词：按 paper_id 索引取本论文元素逐条过滤，按出现顺序返回
+        sql = f"""
+            SELECT e.id, e.kind, e.section, e.ordinal, e.page, e.text
+            FROM paper_elements e
+            WHERE e.paper_id = :paper_id
+              {" ".join(filters)}
+            ORDER BY e.ordinal
+            LIMIT :limit
+        """
+        rows = (await db.execute(text(sql), params)).mappings().all()
+        return [
+            {**{k: v for k, v in row.items() if k != "text"}, "snippet": _highlight(row["text"], short_terms), "score": 0.0}
+            for row in rows
+        ]
+
+    # 论文过滤在索引内完成：paper 列必须包含该论文的标记
+    params["query"] = f'paper : "{_paper_token(paper_id)}" AND text : ({to_fts_query(" ".join(long_terms))})'
+    sql = f"""
+        SELECT e.id, e.kind, e.section, e.ordinal, e.page,
+               snippet(paper_elements_fts, 0, '<mark>', '</mark>', '…', {SNIPPET_TOKENS}) AS snippet,
+               bm25(paper_elements_fts, 1.0, 0.0) AS score
+        FROM paper_elements_fts
+        JOIN paper_elements e ON e.id = paper_elements_fts.rowid
+        WHERE paper_elements_fts MATCH :query
+          {" ".join(filters)}
+        ORDER BY score
+        LIMIT :limit
+    """
+    rows = (await db.execute(text(sql), params)).mappings().all()
+    # bm25 越小越相关，转为越大越相关
+    return [{**row, "score": -row["score"]} for row in rows]
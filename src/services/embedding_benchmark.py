@@ -0,0 +1,112 @@
+# 运行此脚本可以比较各向量模型后端在本地论文语料上的吞吐和召回
+# 用法（在 src 目录下）：
+#   python -m services.embedding_benchmark [--backends torch,torch-int8,onnx] [--threads 4] [--k 10]
+# 语料为 parsed_results 下所有解析结果按 SectionChunker 切出的分块；
+# 查询取随机分块的首句，召回分两项：
+#   self@k  —— 查询来源分块出现在前 k 个结果中的比例
+#   ref@k   —— 与第一个后端（基准）前 k 个结果的重合比例
+
+
+import argparse
+import glob
+import os
+import random
+import re
+import statistics
+import time
+
+import numpy as np
+
+from services.chunker import SectionChunker
+from services.embeddings import EMBEDDING_BACKENDS, create_embeddings
+from services.parsed_store import OUTPUT_BASE_DIR, ParsedDocument
+
+_FIRST_SENTENCE = re.compile(r"^(.{20,200}?[.!?。！？])(\s|$)", re.S)
+
+
+def load_corpus(max_chunks: int):
+    chunker = SectionChunker()
+    texts = []
+    for path in sorted(glob.glob(os.path.join(OUTPUT_BASE_DIR, "paper_*", "parsed.epk"))):
+        with ParsedDocument.open(path) as doc:
+            texts.extend(document.page_content for document in chunker.chunk(doc.to_dict()))
+        if len(texts) >= max_chunks:
+            break
+    return texts[:max_chunks]
+
+
+def make_queries(texts, count: int, seed: int):
+    rng = random.Random(seed)
+    queries = []
+    for index in rng.sample(range(len(texts)), min(count, len(texts))):
+        # 去掉分块开头的章节标题行
+        body = texts[index].split("\n", 1)[-1].strip()
+        match = _FIRST_SENTENCE.match(body)
+        queries.append((index, match.group(1) if match else body[:200]))
+    return queries
+
+
+def top_k(matrix: np.ndarray, vector: np.ndarray, k: int):
+    scores = matrix @ vector
+    return set(np.argsort(-scores)[:k].tolist())
+
+
+def normalize(vectors) -> np.ndarray:
+    array = np.asarray(vectors, dtype=np.float32)
+    return array / np.clip(np.linalg.norm(array, axis=-1, keepdims=True), 1e-12, None)
+
+
+def run_backend(backend: str, texts, queries, threads: int, k: int):
+    embeddings = create_embeddings(backend, threads=threads)
+    embeddings.embed_documents(texts[:8])  # 预热
+
+    start = time.perf_counter()
+    matrix = normalize(embeddings.embed_documents(texts))
+    index_seconds = time.perf_counter() - start
+
+    latencies, results = [], []
+    for _, query in queries:
+        start = time.perf_counter()
+        vector = normalize(embeddings.embed_query(query))
+        latencies.append(time.perf_counter() - start)
+        results.append(top_k(matrix, vector, k))
+    return {
+        "chunks_per_second": len(texts) / index_seconds,
+        "query_ms_p50": statistics.median(latencies) * 1000,
+        "query_ms_p95": sorted(latencies)[int(0.95 * (len(latencies) - 1))] * 1000,
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", default=",".join(EMBEDDING_BACKENDS))
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--max-chunks", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    texts = load_corpus(args.max_chunks)
+    if not texts:
+        raise SystemExit(f"No parsed papers found under {OUTPUT_BASE_DIR}")
+    queries = make_queries(texts, args.queries, args.seed)
+    print(f"[BENCH] 语料 {len(texts)} 个分块，{len(queries)} 个查询，k={args.k}，threads={args.threads or 'default'}")
+
+    reference = None
+    for backend in args.backends.split(","):
+        try:
+            stats = run_backend(backend, texts, queries, args.threads, args.k)
+        except Exception as e:
+            print(f"[BENCH] {backend}: 跳过（{e}）")
+            continue
+        if reference is None:
+            reference = stats["results"]
+        self_recall = statistics.mean(index in found for (index, _), found in zip(queries, stats["results"]))
+        ref_recall = statistics.mean(
+            len(found & expected) / len(expected) for found, expected in zip(stats["results"], reference)
+        )
+        print(f"[BENCH] {backend:<11} {stats['chunks_per_second']:8.1f} chunks/s  "
+              f"query p50 {stats['query_ms_p50']:6.1f}ms p95 {stats['query_ms_p95']:6.1f}ms  "
+              f"self@{args.k} {self_recall:.3f}  ref@{args.k} {ref_recall:.3f}")
@@ -0,0 +1,150 @@
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from configs import (
+    EMBEDDING_BACKEND, EMBEDDING_MODEL, EMBEDDING_THREADS, EMBEDDING_BATCH_SIZE, EMBEDDING_ONNX_DIR,
+)
+
+EMBEDDING_BACKENDS = ("torch", "torch-int8", "onnx")
+# ONNX 目录中优先使用量化后的模型
+ONNX_MODEL_FILES = ("model_quantized.onnx", "model.onnx")
+MAX_SEQ_LENGTH = 256
+
+_instances: Dict[tuple, Embeddings] = {}
+_instances_lock = threading.Lock()
+
+
+def _set_torch_threads(threads: int):
+    if threads > 0:
+        import torch
+        torch.set_num_threads(threads)
+
+
+def _torch_embeddings(model_name: str, threads: int, batch_size: int, quantize: bool) -> Embeddings:
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+
+    _set_torch_threads(threads)
+    embeddings = HuggingFaceEmbeddings(
+        model_name=model_name,
+        model_kwargs={"device": "cpu"},
+        encode_kwargs={"batch_size": batch_size},
+    )
+    if quantize:
+        import torch
+        # Linear 层权重转为 int8，激活在推理时动态量化；向量维度不变，可与原模型的索引混用
+        embeddings.client = torch.quantization.quantize_dynamic(
+            embeddings.client, {torch.nn.Linear}, dtype=torch.qint8
+        )
+    return embeddings
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    用 ONNX Runtime 运行导出的 sentence-transformers 模型（均值池化 + L2 归一化，与原模型输出一致）
+    模型目录由 export_onnx 生成，包含 tokenizer 文件和 model[_quantized].onnx
+    """
+
+    def __init__(self, model_dir: str = EMBEDDING_ONNX_DIR, threads: int = EMBEDDING_THREADS,
+                 batch_size: int = EMBEDDING_BATCH_SIZE):
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        model_path = next(
+            (os.path.join(model_dir, name) for name in ONNX_MODEL_FILES
+             if os.path.exists(os.path.join(model_dir, name))),
+            None,
+        )
+        if model_path is None:
+            raise RuntimeError(
+                f"ONNX embedding model not found in {model_dir}; "
+                f"run `python -m services.embeddings export` first"
+            )
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {item.name for item in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.batch_size = batch_size
+        self.model_path = model_path
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        encoded = self.tokenizer(
+            texts, padding=True, truncation=True, max_length=MAX_SEQ_LENGTH, return_tensors="np"
+        )
+        inputs = {name: value.astype(np.int64) for name, value in encoded.items() if name in self.input_names}
+        hidden = self.session.run(None, inputs)[0]
+        mask = encoded["attention_mask"][..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            vectors.extend(self._embed_batch(texts[start:start + self.batch_size]).tolist())
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed_batch([text])[0].tolist()
+
+
+def create_embeddings(backend: str = EMBEDDING_BACKEND, model_name: str = EMBEDDING_MODEL,
+                      threads: int = EMBEDDING_THREADS, batch_size: int = EMBEDDING_BATCH_SIZE) -> Embeddings:
+    """按后端名称构造向量模型（每次调用都会重新加载，通常应使用 get_embeddings）"""
+    start = time.perf_counter()
+    if backend == "torch":
+        embeddings = _torch_embeddings(model_name, threads, batch_size, quantize=False)
+    elif backend == "torch-int8":
+        embeddings = _torch_embeddings(model_name, threads, batch_size, quantize=True)
+    elif backend == "onnx":
+        embeddings = OnnxEmbeddings(EMBEDDING_ONNX_DIR, threads, batch_size)
+    else:
+        raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {EMBEDDING_BACKENDS}")
+    print(f"[EMBED] backend={backend} model={model_name} threads={threads or 'default'} "
+          f"加载耗时 {time.perf_counter() - start:.2f}s")
+    return embeddings
+
+
+def get_embeddings(backend: Optional[str] = None) -> Embeddings:
+    """返回进程内共享的向量模型实例，模型只加载一次"""
+    backend = backend or EMBEDDING_BACKEND
+    key = (backend, EMBEDDING_MODEL, EMBEDDING_THREADS, EMBEDDING_BATCH_SIZE)
+    with _instances_lock:
+        if key not in _instances:
+            _instances[key] = create_embeddings(backend)
+        return _instances[key]
+
+
+def export_onnx(model_name: str = EMBEDDING_MODEL, output_dir: str = EMBEDDING_ONNX_DIR, quantize: bool = True) -> str:
+    """将 sentence-transformers 模型导出为 ONNX，并可选做动态 int8 量化（需要安装 optimum[onnxruntime]）"""
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer
+
+    model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True)
+    model.save_pretrained(output_dir)
+    AutoTokenizer.from_pretrained(model_name).save_pretrained(output_dir)
+    if quantize:
+        quantizer = ORTQuantizer.from_pretrained(output_dir)
+        quantizer.quantize(
+            save_dir=output_dir,
+            quantization_config=AutoQuantizationConfig.avx2(is_static=False, per_channel=False),
+        )
+    print(f"[EMBED] 已导出 ONNX 模型到 {output_dir}（量化: {quantize}）")
+    return output_dir
+
+
+if __name__ == "__main__":
+    # 用法（在 src 目录下）：python -m services.embeddings export [--no-quantize]
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == "export":
+        export_onnx(quantize="--no-quantize" not in sys.argv)
+    else:
+        print("usage: python -m services.embeddings export [--no-quantize]")
@@ -0,0 +1,151 @@
+import asyncio
+import contextvars
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Optional
+
+from configs import (PARSE_MAX_WORKERS, EMBED_MAX_WORKERS, LLM_MAX_CONCURRENCY, RENDER_MAX_WORKERS, STORAGE_MAX_WORKERS,
+                     STREAM_PARSE_MIN_PAGES)
+
+
+class BoundedExecutor:
+    """
+    按资源类型划分的有界执行器：
+    - 阻塞任务提交到底层线程池/进程池，由 handler 直接 await，不占用事件循环
+    - 通过信号量限制并发，超出部分在信号量上排队，并统计排队/运行指标
+    """
+
+    def __init__(self, name: str, max_concurrency: int, executor_factory: Optional[Callable[[], Executor]] = None,
+                 is_process_pool: bool = False):
+        self.name = name
+        self.is_process_pool = is_process_pool
+        self.max_concurrency = max_concurrency
+        self._executor_factory = executor_factory
+        self._executor: Optional[Executor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+        # 指标
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_wait_seconds = 0.0
+        self.total_run_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # 延迟创建，保证绑定到实际运行的事件循环
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def _get_executor(self) -> Optional[Executor]:
+        if self._executor is None and self._executor_factory is not None:
+            self._executor = self._executor_factory()
+        return self._executor
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """在本执行器中运行阻塞函数（或协程函数），返回其结果"""
+        enqueue_time = time.perf_counter()
+        self.queued += 1
+        async with self._get_semaphore():
+            self.queued -= 1
+            wait = time.perf_counter() - enqueue_time
+            self.total_wait_seconds += wait
+            self.max_wait_seconds = max(self.max_wait_seconds, wait)
+
+            self.running += 1
+            start = time.perf_counter()
+            try:
+                if asyncio.iscoroutinefunction(func):
+                    result = await func(*args, **kwargs)
+                else:
+                    loop = asyncio.get_running_loop()
+                    call = partial(func, *args, **kwargs)
+                    if not self.is_process_pool:
+                        # 线程池中沿用调用方的 contextvars（如当前用户），进程池无法传递
+                        call = partial(contextvars.copy_context().run, call)
+                    result = await loop.run_in_executor(self._get_executor(), call)
+                self.completed += 1
+                return result
+            except Exception:
+                self.failed += 1
+                raise
+            finally:
+                self.running -= 1
+                self.total_run_seconds += time.perf_counter() - start
+
+    def stats(self) -> Dict[str, Any]:
+        finished = self.completed + self.failed
+        return {
+            "name": self.name,
+            "max_concurrency": self.max_concurrency,
+            "queued": self.queued,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "avg_wait_ms": round(self.total_wait_seconds / finished * 1000, 1) if finished else 0.0,
+            "max_wait_ms": round(self.max_wait_seconds * 1000, 1),
+            "avg_run_ms": round(self.total_run_seconds / finished * 1000, 1) if finished else 0.0,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# 解析：进程池，避免 hi_res/OCR 持有 GIL 拖慢主进程
+parse_executor = BoundedExecutor(
+    "parse", PARSE_MAX_WORKERS,
+    lambda: ProcessPoolExecutor(max_workers=PARSE_MAX_WORKERS),
+    is_process_pool=True,
+)
+# 向量化：线程池
+embed_executor = BoundedExecutor(
+    "embed", EMBED_MAX_WORKERS,
+    lambda: ThreadPoolExecutor(max_workers=EMBED_MAX_WORKERS, thread_name_prefix="embed"),
+)
+# LLM / HTTP：同步 SDK 调用放入独立线程池，原生协程直接 await
+llm_executor = BoundedExecutor(
+    "llm", LLM_MAX_CONCURRENCY,
+    lambda: ThreadPoolExecutor(max_workers=LLM_MAX_CONCURRENCY, thread_name_prefix="llm"),
+)
+
+# 页面 / 图表渲染：线程池（PyMuPDF 渲染时释放 GIL）
+render_executor = BoundedExecutor(
+    "render", RENDER_MAX_WORKERS,
+    lambda: ThreadPoolExecutor(max_workers=RENDER_MAX_WORKERS, thread_name_prefix="render"),
+)
+
+# 磁盘统计、归档、删除等文件操作：线程池
+storage_executor = BoundedExecutor(
+    "storage", STORAGE_MAX_WORKERS,
+    lambda: ThreadPoolExecutor(max_workers=STORAGE_MAX_WORKERS, thread_name_prefix="storage"),
+)
+
+ALL_EXECUTORS = [parse_executor, embed_executor, llm_executor, render_executor, storage_executor]
+
+
+def executor_stats() -> Dict[str, Dict[str, Any]]:
+    return {executor.name: executor.stats() for executor in ALL_EXECUTORS}
+
+
+def shutdown_executors():
+    for executor in ALL_EXECUTORS:
+        executor.shutdown()
+
+
+def parse_pdf_job(paper_id: int, file_path: str) -> Dict[str, Any]:
+    """解析任务入口（在子进程中执行，需为模块级函数以便 pickle）"""
+    import pymupdf
+    from services.pdf_parser import PDFParser
+
+    with pymupdf.open(file_path) as doc:
+        pages = doc.page_count
+    if pages >= STREAM_PARSE_MIN_PAGES:
+        # 书籍、论文集等大文件按页窗口流式解析，限制单个任务的内存占用
+        return PDFParser().parse_pdf_streaming(paper_id, file_path)
+    # 小文件整体解析；两条路径共用同一套元素处理（页码、参考文献标题识别、结构化参考文献）
+    return PDFParser().parse_pdf(paper_id, file_path)
@@ -0,0 +1,90 @@
+import os
+from typing import Any, Dict, List, Optional
+
+from configs import DATA_DIR, FIGURE_CACHE_MAX_BYTES
+from services.disk_cache import DiskLRUCache
+from services.parsed_store import ParsedDocument, parsed_path
+
+FIGURE_KINDS = {"image": "images", "table": "tables"}
+FIGURE_DPI = 150
+THUMBNAIL_MAX_WIDTH = 320
+# 裁剪区域四周留白（PDF 点）
+CROP_MARGIN = 4
+
+figure_cache = DiskLRUCache(os.path.join(DATA_DIR, "cache", "figures"), FIGURE_CACHE_MAX_BYTES)
+
+
+def _bbox(metadata: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """从 unstructured 的 metadata.coordinates 中取出包围盒（版面像素坐标）"""
+    coordinates = metadata.get("coordinates") or {}
+    points = coordinates.get("points")
+    if not points:
+        return None
+    xs = [point[0] for point in points]
+    ys = [point[1] for point in points]
+    return {
+        "x0": min(xs), "y0": min(ys), "x1": max(xs), "y1": max(ys),
+        "layout_width": coordinates.get("layout_width"),
+        "layout_height": coordinates.get("layout_height"),
+    }
+
+
+def list_figures(paper_id: int) -> List[Dict[str, Any]]:
+    """列出论文中的图片和表格（只读取解析结果中的页码和坐标，不渲染）"""
+    figures = []
+    with ParsedDocument.open(parsed_path(paper_id)) as doc:
+        for kind, key in FIGURE_KINDS.items():
+            for index, item in enumerate(doc.load(key)):
+                metadata = item.get("metadata") or {}
+                bbox = _bbox(metadata)
+                if bbox is None:
+                    continue
+                figures.append({
+                    "kind": kind,
+                    "index": index,
+                    "page": metadata.get("page_number"),
+                    "bbox": bbox,
+                    "caption": (item.get("content") or "")[:200],
+                })
+    return figures
+
+
+def _find_figure(paper_id: int, kind: str, index: int) -> Optional[Dict[str, Any]]:
+    for figure in list_figures(paper_id):
+        if figure["kind"] == kind and figure["index"] == index:
+            return figure
+    return None
+
+
+def _render(pdf_path: str, figure: Dict[str, Any], thumbnail: bool) -> bytes:
+    bbox = figure["bbox"]
+    import pymupdf
+
+    with pymupdf.open(pdf_path) as pdf:
+        page = pdf[figure["page"] - 1]
+        # 版面坐标（hi_res 模型的像素空间）换算为 PDF 点
+        scale_x = page.rect.width / (bbox["layout_width"] or page.rect.width)
+        scale_y = page.rect.height / (bbox["layout_height"] or page.rect.height)
+        clip = pymupdf.Rect(
+            bbox["x0"] * scale_x - CROP_MARGIN, bbox["y0"] * scale_y - CROP_MARGIN,
+            bbox["x1"] * scale_x + CROP_MARGIN, bbox["y1"] * scale_y + CROP_MARGIN,
+        ) & page.rect
+        zoom = FIGURE_DPI / 72
+        if thumbnail and clip.width * zoom > THUMBNAIL_MAX_WIDTH:
+            zoom = THUMBNAIL_MAX_WIDTH / clip.width
+        pixmap = page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), clip=clip, alpha=False)
+        return pixmap.tobytes("png")
+
+
+def get_figure_image(paper_id: int, pdf_path: str, kind: str, index: int, thumbnail: bool = False) -> Optional[str]:
+    """返回图表截图的缓存文件路径；首次请求时渲染"""
+    # 解析结果的修改时间作为版本，重新分析后旧截图自然失效（由 LRU 淘汰）
+    version = int(os.path.getmtime(parsed_path(paper_id)))
+    key = f"{paper_id}:{version}:{kind}:{index}:{'thumb' if thumbnail else 'full'}"
+    path = figure_cache.get(key, ".png")
+    if path:
+        return path
+    figure = _find_figure(paper_id, kind, index)
+    if figure is None or not figure["page"]:
+        return None
+    return figure_cache.put(key, _render(pdf_path, figure, thumbnail), ".png")
@@ -0,0 +1,116 @@
+import hashlib
+import os
+import re
+import threading
+from typing import Dict, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+CHUNK_SIZE = 256 * 1024
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+_RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+# (路径, 大小, mtime) -> sha256，文件不变时只计算一次
+_hash_cache: Dict[Tuple[str, int, float], str] = {}
+_hash_lock = threading.Lock()
+
+
+def file_sha256(path: str) -> str:
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime)
+    with _hash_lock:
+        if key in _hash_cache:
+            return _hash_cache[key]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    with _hash_lock:
+        _hash_cache[key] = digest.hexdigest()
+    return _hash_cache[key]
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    return header.strip() == "*" or etag in [tag.strip() for tag in header.split(",")]
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """解析单段 Range 头，返回闭区间 (start, end)；不合法时返回 None"""
+    match = _RANGE_PATTERN.match(header.strip())
+    if not match:
+        return None
+    start, end = match.groups()
+    if start == "" and end == "":
+        return None
+    if start == "":
+        # 后缀区间：最后 N 个字节
+        length = int(end)
+        if length == 0:
+            return None
+        return max(0, size - length), size - 1
+    start = int(start)
+    end = int(end) if end else size - 1
+    if start >= size or end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+def _iter_file(path: str, start: int, end: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            data = f.read(min(CHUNK_SIZE, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+
+def file_response(request: Request, path: str, etag: str, media_type: str,
+                  filename: Optional[str] = None) -> Response:
+    """
+    返回支持条件请求和 Range 请求的文件响应
+    - 强 ETag（由内容哈希得到），If-None-Match 命中返回 304
+    - 单段 Range 返回 206；If-Range 与 ETag 不一致时返回完整文件
+    - 内容由哈希寻址，可长期缓存（immutable）
+    """
+    etag = f'"{etag}"'
+    size = os.path.getsize(path)
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+    }
+    if filename:
+        headers["Content-Disposition"] = f"inline; filename*=UTF-8''{filename}"
+
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == etag):
+        byte_range = _parse_range(range_header, size)
+        if byte_range is None:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        start, end = byte_range
+        return StreamingResponse(
+            _iter_file(path, start, end),
+            status_code=206,
+            media_type=media_type,
+            headers={
+                **headers,
+                "Content-Range": f"bytes {start}-{end}/{size}",
+                "Content-Length": str(end - start + 1),
+            },
+        )
+
+    return StreamingResponse(
+        _iter_file(path, 0, size - 1),
+        media_type=media_type,
+        headers={**headers, "Content-Length": str(size)},
+    )
@@ -0,0 +1,101 @@
+# 运行此脚本可以测量各模块的导入耗时，并检查 main 是否在启动时导入了重量级依赖
+# 用法（在 src 目录下）：python -m services.import_time_test
+# 预算可通过环境变量 IMPORT_BUDGET_SECONDS 调整；超出预算或导入了重量级依赖时以非零状态退出
+
+
+import os
+import re
+import subprocess
+import sys
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 逐个在新进程中导入，避免模块缓存互相影响
+MODULES = [
+    "main",
+    "routes.paper_routes",
+    "routes.user_routes",
+    "services.analysis_pipeline",
+    "services.worker",
+    "services.ai_service",
+    "services.pdf_parser",
+]
+
+# main 导入时不应加载的包
+FORBIDDEN_AT_STARTUP = [
+    "langchain", "langchain_community", "langchain_core", "langgraph",
+    "chromadb", "sentence_transformers", "torch", "transformers", "unstructured", "pymupdf",
+]
+
+IMPORT_BUDGET_SECONDS = float(os.getenv("IMPORT_BUDGET_SECONDS", "3"))
+
+_LINE_PATTERN = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure(module: str):
+    """返回 (总耗时秒数, [(累计耗时秒数, 直接依赖), ...])；导入失败时返回 None"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SRC_DIR, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        print(f"[IMPORT] {module} 导入失败:\n{result.stderr.strip().splitlines()[-1]}")
+        return None
+    total = 0.0
+    children, direct = [], []
+    for line in result.stderr.splitlines():
+        match = _LINE_PATTERN.match(line)
+        if not match:
+            continue
+        cumulative = int(match.group(2)) / 1e6
+        depth = len(match.group(3))
+        if depth <= 1:
+            # 顶层条目出现时，之前缩进一级的条目就是它的直接依赖
+            if match.group(4) == module:
+                total, direct = cumulative, children
+            children = []
+        elif depth == 3:
+            children.append((cumulative, match.group(4)))
+    return total, sorted(direct, reverse=True)
+
+
+_FORBIDDEN_SENTINEL = "__FORBIDDEN__:"
+
+
+def loaded_forbidden(module: str):
+    """返回导入 module 后已加载的重量级包；模块导入时自身也会打印日志（如 [DB]），只解析带标记前缀的一行"""
+    code = (
+        f"import sys, {module}\n"
+        f"print({_FORBIDDEN_SENTINEL!r} + ','.join(sorted({{name.split('.')[0] for name in sys.modules}} & set({FORBIDDEN_AT_STARTUP!r}))))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=SRC_DIR, capture_output=True, text=True)
+    for line in reversed(result.stdout.splitlines()):
+        if line.startswith(_FORBIDDEN_SENTINEL):
+            return [name for name in line[len(_FORBIDDEN_SENTINEL):].split(",") if name]
+    raise RuntimeError(f"{module} 导入失败，无法检查重量级依赖: {result.stderr.strip()[-500:]}")
+
+
+if __name__ == "__main__":
+    failed = False
+    for module in MODULES:
+        measured = measure(module)
+        if measured is None:
+            failed = failed or module == "main"
+            continue
+        total, top_level = measured
+        print(f"[IMPORT] {module}: {total:.3f}s")
+        for cumulative, name in top_level[:5]:
+            print(f"    {cumulative:.3f}s  {name}")
+
+    startup = measure("main")
+    if startup is not None:
+        if startup[0] > IMPORT_BUDGET_SECONDS:
+            print(f"[IMPORT] FAIL: main 导入用时 {startup[0]:.3f}s，超过预算 {IMPORT_BUDGET_SECONDS}s")
+            failed = True
+        heavy = loaded_forbidden("main")
+        if heavy:
+            print(f"[IMPORT] FAIL: main 启动时导入了重量级依赖: {heavy}")
+            failed = True
+
+    print("[IMPORT] FAIL" if failed else "[IMPORT] OK")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,111 @@
+import re
+from typing import Optional, Tuple
+
+# 意图：普通问答 / 思维导图 / 流程图；无法确定时返回 None，交给 Agent 处理
+INTENT_QA = "qa"
+INTENT_MINDMAP = "mindmap"
+INTENT_FLOWCHART = "flowchart"
+
+_MINDMAP_PATTERNS = [r"思维导图", r"脑图", r"导图", r"mind\s*-?\s*map"]
+# 明确指流程图的说法
+_FLOWCHART_PATTERNS = [r"流程图", r"flow\s*-?\s*chart", r"pipeline\s+diagram"]
+# “流程”在普通问题中也常见（如“训练流程是什么”），需与绘图词同时出现才算流程图
+_PROCESS_PATTERNS = [r"流程"]
+# 有绘图意愿但没有指明图表类型
+_DRAW_PATTERNS = [r"画", r"绘制", r"绘图", r"图表", r"可视化", r"\bdraw\b", r"\bdiagram\b", r"\bvisuali[sz]e\b", r"\bplot\b"]
+# 请求 / 祈使说法；只提到图表类型而没有请求（如“什么是思维导图”）不算绘图请求
+_REQUEST_PATTERNS = [
+    r"画", r"绘", r"生成", r"制作", r"做", r"整理成", r"转成", r"给我", r"帮我", r"来[一个张幅份]", r"请(?!问)", r"能否", r"能不能",
+    r"\bdraw\b", r"\bcreate\b", r"\bmake\b", r"\bgenerate\b", r"\bbuild\b", r"\bproduce\b", r"\bgive me\b",
+    r"\bshow me\b", r"\bcan you\b", r"\bcould you\b", r"\bplease\b", r"\bturn\b.+\binto\b",
+]
+# 询问概念本身的问题
+_QUESTION_PATTERNS = [r"什么是", r"是什么", r"什么叫", r"含义", r"意思", r"区别", r"吗[?？]?$", r"[?？]$",
+                      r"^\s*(?:what|why|how|when|which|who|is|are|does|do)\b"]
+# 复合请求（先做 A 再做 B），固定流水线处理不了；“再画一个思维导图”中的“再”只表示重复，不算复合
+_COMPOUND_PATTERNS = [r"然后", r"先.+再", r"[，,；;]\s*再", r"完再", r"之后", r"并且", r"同时",
+                      r"\band then\b", r"\bafter that\b"]
+
+_TOPIC_STRIP = re.compile(
+    # 量词需先于单独的动词匹配，否则“画个流程图”只剩下“个”
+    r"((?:画|绘制|生成|做|来|给我|帮我)\s*(?:一|几|这|那)?\s*[个张幅份]|(?:一|这|那)[个张幅份]|"
+    r"请|帮我|给我|能否|可以|一下|再|画|绘制|生成|做|关于|的|思维导图|脑图|导图|流程图|"
+    r"\b(?:please|can you|draw|generate|create|make|a|an|the|of|about|for|mind\s*-?\s*map|flow\s*-?\s*chart|diagram)\b)",
+    re.IGNORECASE,
+)
+
+
+def _matches(patterns, text: str) -> bool:
+    return any(re.search(pattern, text, re.IGNORECASE) for pattern in patterns)
+
+
+def classify_intent(question: str) -> Optional[str]:
+    """
+    基于规则的轻量意图分类，不调用 LLM
+    - 请求绘制且只提到一种图表类型 -> mindmap / flowchart
+    - 提到图表类型但不是绘图请求：询问概念 -> qa，其余 -> None
+    - 没有任何绘图意愿 -> qa
+    - 其余情况（两种图表都提到、想画图但没说类型、复合请求）-> None
+    """
+    text = question.strip()
+    wants_drawing = _matches(_DRAW_PATTERNS, text)
+    wants_mindmap = _matches(_MINDMAP_PATTERNS, text)
+    wants_flowchart = _matches(_FLOWCHART_PATTERNS, text) or (_matches(_PROCESS_PATTERNS, text) and wants_drawing)
+
+    if wants_mindmap and wants_flowchart:
+        return None
+    if wants_mindmap or wants_flowchart:
+        if not _matches(_REQUEST_PATTERNS, text):
+            return INTENT_QA if _matches(_QUESTION_PATTERNS, text) else None
+        if _matches(_COMPOUND_PATTERNS, text):
+            return None
+        return INTENT_MINDMAP if wants_mindmap else INTENT_FLOWCHART
+    if wants_drawing:
+        return None
+    return INTENT_QA
+
+
+def extract_topic(question: str, default: str = "") -> str:
+    """从绘图请求中提取主题，如“画一个方法部分的流程图” -> “方法部分”"""
+    topic = _TOPIC_STRIP.sub(" ", question)
+    topic = re.sub(r"[\s，。,.!?！？:：'\"“”‘’]+", " ", topic).strip()
+    return topic or default
+
+
+def route(question: str, default_topic: str = "") -> Tuple[Optional[str], str]:
+    intent = classify_intent(question)
+    return intent, extract_topic(question, default_topic) if intent in (INTENT_MINDMAP, INTENT_FLOWCHART) else ""
+
+
+# ======================== 预生成内容 ========================
+# 预生成内容类型 -> (意图, 生成时使用的问题, 绘图主题)
+PRECOMPUTED_KINDS = {
+    "key_mindmap": (INTENT_MINDMAP, "画一个论文关键内容的思维导图", "论文关键内容"),
+    "method_flowchart": (INTENT_FLOWCHART, "画一个论文方法的流程图", "论文方法"),
+    "contributions": (INTENT_QA, "这篇论文的主要贡献和创新点是什么？", ""),
+}
+
+# 不指明具体部分的主题，视为整篇论文
+_GENERIC_TOPIC_PATTERNS = [r"论文", r"文章", r"全文", r"整体", r"关键", r"核心", r"主要内容",
+                           r"\bpaper\b", r"\boverall\b", r"\bkey\b", r"\bsummary\b"]
+_METHOD_TOPIC_PATTERNS = [r"方法", r"算法", r"模型", r"框架", r"\bmethod", r"\bapproach\b", r"\bmodel\b",
+                          r"\bframework\b", r"\bpipeline\b", r"\balgorithm\b"]
+_CONTRIBUTION_PATTERNS = [r"贡献", r"创新点", r"\bcontributions?\b", r"\bnovelty\b"]
+
+
+def precomputed_kind(question: str) -> Optional[str]:
+    """
+    判断问题能否直接使用预生成内容：
+    - 思维导图且主题为空或泛指整篇论文 -> key_mindmap
+    - 流程图且主题为空或指向方法 -> method_flowchart
+    - 询问论文贡献的普通问题 -> contributions
+    """
+    intent, topic = route(question)
+    if intent == INTENT_MINDMAP:
+        generic = not topic or (_matches(_GENERIC_TOPIC_PATTERNS, topic) and not _matches(_METHOD_TOPIC_PATTERNS, topic))
+        return "key_mindmap" if generic else None
+    if intent == INTENT_FLOWCHART:
+        return "method_flowchart" if not topic or _matches(_METHOD_TOPIC_PATTERNS, topic) else None
+    if intent == INTENT_QA and _matches(_CONTRIBUTION_PATTERNS, question):
+        return "contributions"
+    return None
@@ -0,0 +1,166 @@
+import asyncio
+import os
+import socket
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from configs import JOB_MAX_ATTEMPTS, USER_MAX_ACTIVE_JOBS
+from models.db import AsyncSessionLocal
+from models.job import AnalysisJob
+from models.paper import Paper
+from services.scheduler import QuotaExceeded
+
+
+def claimable(now: datetime):
+    """可领取的任务：排队中，或运行中但租约已过期（worker 崩溃）且未用完重试次数"""
+    return or_(
+        AnalysisJob.status == 'queued',
+        and_(AnalysisJob.status == 'running', AnalysisJob.lease_expires_at < now,
+             AnalysisJob.attempts < JOB_MAX_ATTEMPTS),
+    )
+
+
+def claim_order(now: datetime):
+    """
+    领取顺序：先按该用户正在运行的任务数（少的优先），再按创建时间，
+    避免一个用户批量排队时其他用户的任务一直排在后面
+    """
+    other = aliased(AnalysisJob)
+    running = (
+        select(func.count(other.id))
+        .where(other.user_id == AnalysisJob.user_id, other.status == 'running', other.lease_expires_at >= now)
+        .correlate(AnalysisJob)
+        .scalar_subquery()
+    )
+    return running.asc(), AnalysisJob.created_at.asc()
+
+
+async def check_job_quota(db: AsyncSession, user_id: int, retry_after: int = 30):
+    """
+    用户排队 / 运行中的任务数达到上限时抛出 QuotaExceeded
+    按数据库中的任务计数：quota_manager 只能看到本进程内的任务，看不到 worker 进程
+    """
+    active = (await db.execute(
+        select(func.count(AnalysisJob.id))
+        .where(AnalysisJob.user_id == user_id, AnalysisJob.status.in_(['queued', 'running']))
+    )).scalar()
+    if active >= USER_MAX_ACTIVE_JOBS:
+        raise QuotaExceeded(
+            f"Too many analysis jobs: at most {USER_MAX_ACTIVE_JOBS} queued or running per user",
+            retry_after,
+        )
+
+
+def exhausted(now: datetime):
+    """租约已过期且已用完重试次数的任务（每次执行都使进程崩溃的论文）"""
+    return and_(AnalysisJob.status == 'running', AnalysisJob.lease_expires_at < now,
+                AnalysisJob.attempts >= JOB_MAX_ATTEMPTS)
+
+
+async def fenced_update(db: AsyncSession, job_id: int, owner: str, lease: timedelta, **values) -> bool:
+    """仅当租约仍属于 owner 时更新任务（并顺带续约）"""
+    now = datetime.utcnow()
+    result = await db.execute(
+        update(AnalysisJob)
+        .where(AnalysisJob.id == job_id, AnalysisJob.lease_owner == owner, AnalysisJob.status == 'running')
+        .values(lease_expires_at=now + lease, heartbeat_at=now, **values)
+    )
+    return result.rowcount == 1
+
+
+async def enqueue_analysis(db: AsyncSession, paper: Paper) -> AnalysisJob:
+    """创建分析任务（由调用方 commit）"""
+    job = AnalysisJob(paper_id=paper.id, user_id=paper.user_id, status='queued')
+    db.add(job)
+    paper.processing_status = 'queued'
+    return job
+
+
+async def start_inline_job(db: AsyncSession, paper: Paper, lease: timedelta) -> AnalysisJob:
+    """
+    API 进程内分析也登记为一个持有租约的运行中任务（由调用方 commit），
+    这样进程崩溃后任务在租约过期时可被 worker 接手，processing 状态的论文不会无人认领
+    """
+    now = datetime.utcnow()
+    job = AnalysisJob(
+        paper_id=paper.id, user_id=paper.user_id, status='running', attempts=1,
+        lease_owner=f"api-{socket.gethostname()}-{os.getpid()}",
+        lease_expires_at=now + lease, heartbeat_at=now,
+    )
+    db.add(job)
+    paper.processing_status = 'processing'
+    return job
+
+
+@asynccontextmanager
+async def keep_lease(job_id: int, owner: str, lease: timedelta):
+    """在后台定期续约，直到退出上下文"""
+    async def renew():
+        while True:
+            await asyncio.sleep(lease.total_seconds() / 3)
+            async with AsyncSessionLocal() as db:
+                alive = await fenced_update(db, job_id, owner, lease)
+                await db.commit()
+            if not alive:
+                print(f"[JOB_QUEUE] job={job_id} 租约已丢失，停止续约")
+                return
+
+    task = asyncio.create_task(renew())
+    try:
+        yield
+    finally:
+        task.cancel()
+
+
+async def fail_exhausted(db: AsyncSession, now: datetime) -> int:
+    """将用完重试次数的过期任务及其论文标记为失败，返回处理的任务数"""
+    jobs = (await db.execute(select(AnalysisJob).where(exhausted(now)))).scalars().all()
+    for job in jobs:
+        job.status = 'failed'
+        job.error = f"Lease expired after {job.attempts} attempts"
+        job.lease_owner = None
+        paper = await db.get(Paper, job.paper_id)
+        if paper is not None and paper.processing_status == 'processing':
+            paper.processing_status = 'failed'
+    if jobs:
+        print(f"[JOB_QUEUE] {len(jobs)} 个任务多次中断，已标记失败: {[job.id for job in jobs]}")
+    return len(jobs)
+
+
+async def recover_orphans(db: AsyncSession) -> int:
+    """
+    将 processing 状态但没有活动任务的论文重新入队（由调用方 commit），返回入队数量
+    进程内分析同样持有任务租约，因此没有活动任务的 processing 论文一定是中断遗留，worker 空闲时自动调用
+    """
+    active = select(AnalysisJob.paper_id).where(AnalysisJob.status.in_(['queued', 'running']))
+    result = await db.execute(
+        select(Paper).where(Paper.processing_status == 'processing', Paper.id.not_in(active))
+    )
+    papers = result.scalars().all()
+    for paper in papers:
+        await enqueue_analysis(db, paper)
+    if papers:
+        print(f"[JOB_QUEUE] 重新入队 {len(papers)} 篇中断的论文: {[paper.id for paper in papers]}")
+    return len(papers)
+
+
+async def reap_jobs() -> int:
+    """清理中断的任务：先将用完重试次数的任务标记失败，再重新入队孤立的 processing 论文"""
+    async with AsyncSessionLocal() as db:
+        count = await fail_exhausted(db, datetime.utcnow())
+        await db.flush()
+        count += await recover_orphans(db)
+        await db.commit()
+    return count
+
+
+async def latest_job(db: AsyncSession, paper_id: int) -> Optional[AnalysisJob]:
+    result = await db.execute(
+        select(AnalysisJob).where(AnalysisJob.paper_id == paper_id).order_by(AnalysisJob.id.desc()).limit(1)
+    )
+    return result.scalars().first()
@@ -0,0 +1,93 @@
+from typing import Any, Dict, Iterable, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from services.element_store import to_fts_query
+
+# bm25 列权重：title, abstract, summary, body, owner
+_BM25_WEIGHTS = "10.0, 5.0, 3.0, 1.0, 0.0"
+_CONTENT_COLUMNS = "{title abstract summary body}"
+SNIPPET_TOKENS = 24
+
+
+def _owner_token(user_id: int) -> str:
+    return f"u{user_id}"
+
+
+def body_text(parsed_data: Dict[str, Any], sections: Optional[Iterable[Dict[str, Any]]] = None) -> str:
+    parts = []
+    for section in parsed_data.get("sections", []) if sections is None else sections:
+        parts.append(section.get("title", ""))
+        parts.extend(section.get("content", []))
+    return "\n".join(parts)
+
+
+async def index_paper(db: AsyncSession, paper, parsed_data: Optional[Dict[str, Any]] = None,
+                      body: Optional[str] = None):
+    """
+    增量更新单篇论文的索引行（先删后插），由调用方负责 commit
+    body 为已拼好的正文（大文件由调用方逐章节读取后拼接），为空时从 parsed_data 的章节生成
+    """
+    await remove_paper(db, paper.id)
+    await db.execute(
+        text(
+            "INSERT INTO library_fts (title, abstract, summary, body, owner, paper_id) "
+            "VALUES (:title, :abstract, :summary, :body, :owner, :paper_id)"
+        ),
+        {
+            "title": paper.title or paper.original_filename or "",
+            "abstract": paper.abstract or "",
+            "summary": paper.summary or "",
+            "body": body if body is not None else body_text(parsed_data or {}),
+            "owner": _owner_token(paper.user_id),
+            "paper_id": paper.id,
+        },
+    )
+
+
+async def remove_paper(db: AsyncSession, paper_id: int):
+    await db.execute(text("DELETE FROM library_fts WHERE paper_id = :paper_id"), {"paper_id": paper_id})
+
+
+async def search_library(
+    db: AsyncSession,
+    user_id: int,
+    query: str,
+    offset: int = 0,
+    limit: int = 20,
+) -> Dict[str, Any]:
+    """检索用户全部论文，按 bm25 加权排序，返回高亮标题和正文片段"""
+    fts_query = to_fts_query(query)
+    if not fts_query:
+        return {"items": [], "total": 0, "offset": offset, "limit": limit}
+
+    # 用户过滤与关键词一起在倒排索引内求交，而不是匹配后再逐行过滤
+    match = f'owner : "{_owner_token(user_id)}" AND {_CONTENT_COLUMNS} : ({fts_query})'
+
+    total = (await db.execute(
+        text("SELECT count(*) FROM library_fts WHERE library_fts MATCH :match"),
+        {"match": match},
+    )).scalar_one()
+
+    rows = (await db.execute(
+        text(f"""
+            SELECT paper_id,
+                   title,
+                   highlight(library_fts, 0, '<mark>', '</mark>') AS title_highlight,
+                   snippet(library_fts, -1, '<mark>', '</mark>', '…', {SNIPPET_TOKENS}) AS snippet,
+                   bm25(library_fts, {_BM25_WEIGHTS}) AS score
+            FROM library_fts
+            WHERE library_fts MATCH :match
+            ORDER BY score
+            LIMIT :limit OFFSET :offset
+        """),
+        {"match": match, "limit": limit, "offset": offset},
+    )).mappings().all()
+
+    return {
+        "items": [{**row, "score": -row["score"]} for row in rows],
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+    }
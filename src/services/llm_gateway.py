@@ -0,0 +1,239 @@
+import contextvars
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from configs import LLM_MAX_CONCURRENCY, LLM_TIMEOUT_SECONDS, LLM_MAX_RETRIES
+from services.prompt_budget import count_tokens
+
+
+class LLMTimeoutError(Exception):
+    pass
+
+
+# 当前 context 是否已占用网关名额（嵌套调用据此复用名额，避免自身死锁）
+_holding_slot: contextvars.ContextVar[bool] = contextvars.ContextVar("llm_gateway_holding_slot", default=False)
+
+# 当前是否处于 invoke() 的单次模型调用中（该调用的用量由 invoke 自己记录）
+_in_leaf_call: contextvars.ContextVar[bool] = contextvars.ContextVar("llm_gateway_in_leaf_call", default=False)
+
+# 可重试的 HTTP 状态码：限流和服务端暂时性错误
+_TRANSIENT_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+def is_transient_error(e: Exception) -> bool:
+    """超时、连接错误、限流和 5xx 视为暂时性错误，其余（参数错误、解析错误等）重试也无济于事"""
+    if isinstance(e, (LLMTimeoutError, TimeoutError, ConnectionError)):
+        return True
+    status = getattr(e, "status_code", None) or getattr(getattr(e, "response", None), "status_code", None)
+    if status in _TRANSIENT_STATUS:
+        return True
+    name = type(e).__name__
+    return any(marker in name for marker in ("Timeout", "RateLimit", "Connection", "ServiceUnavailable"))
+
+
+class LLMGateway:
+    """
+    所有 LLM 调用的统一入口：
+    - 全局并发上限（对 DashScope 的同时请求数）
+    - 单次调用超时 + 指数退避重试
+    - single-flight：相同 prompt 的并发请求只真正调用一次，其余等待同一结果
+    - 按调用点统计次数、延迟和 token
+    """
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, timeout: float = LLM_TIMEOUT_SECONDS,
+                 max_retries: int = LLM_MAX_RETRIES, backoff_seconds: float = 1.0):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        # 超时后底层请求仍在运行，需占用线程直到返回，因此线程数多于并发上限
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency * 2, thread_name_prefix="llm-gateway")
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        # token 用量监听器：callback(call_site, input_tokens, output_tokens)，在调用方的 context 中执行
+        self._usage_listeners: List[Callable[[str, int, int], None]] = []
+
+    def add_usage_listener(self, listener: Callable[[str, int, int], None]):
+        self._usage_listeners.append(listener)
+
+    # ---------- 统计 ----------
+    def _site(self, call_site: str) -> Dict[str, Any]:
+        return self._stats.setdefault(call_site, {
+            "calls": 0, "coalesced": 0, "errors": 0, "timeouts": 0, "retries": 0,
+            "total_latency_ms": 0.0, "max_latency_ms": 0.0,
+            "input_tokens": 0, "output_tokens": 0,
+        })
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            result = {}
+            for call_site, site in self._stats.items():
+                finished = site["calls"] - site["errors"]
+                result[call_site] = {
+                    **site,
+                    "avg_latency_ms": round(site["total_latency_ms"] / finished, 1) if finished else 0.0,
+                }
+            return result
+
+    # ---------- 调用 ----------
+    def _run_with_timeout(self, fn: Callable[[], Any], timeout: float) -> Any:
+        """占用一个并发名额执行 fn；名额在底层调用真正结束时才释放"""
+        # 等待名额同样受超时限制，网关被占满时不会无限阻塞
+        if not self._semaphore.acquire(timeout=self.timeout):
+            raise LLMTimeoutError(f"No LLM slot available within {self.timeout}s")
+
+        def hold_slot():
+            # 在名额内发起的嵌套调用（如 Agent 的工具再调用 LLM）直接复用该名额
+            _holding_slot.set(True)
+            return fn()
+
+        try:
+            future = self._pool.submit(contextvars.copy_context().run, hold_slot)
+        except Exception:
+            self._semaphore.release()
+            raise
+        future.add_done_callback(lambda _: self._semaphore.release())
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            raise LLMTimeoutError(f"LLM call timed out after {timeout}s")
+
+    def _run_with_retry(self, call_site: str, fn: Callable[[], Any], max_retries: int, timeout: float) -> Any:
+        nested = _holding_slot.get()
+        for attempt in range(max_retries + 1):
+            try:
+                # 嵌套调用已在外层名额和超时之内，直接在当前线程执行
+                return fn() if nested else self._run_with_timeout(fn, timeout)
+            except Exception as e:
+                transient = is_transient_error(e)
+                with self._lock:
+                    site = self._site(call_site)
+                    if isinstance(e, LLMTimeoutError):
+                        site["timeouts"] += 1
+                    if transient and attempt < max_retries:
+                        site["retries"] += 1
+                # 只重试超时、限流、连接错误等暂时性错误
+                if not transient or attempt >= max_retries:
+                    raise
+                wait = self.backoff_seconds * (2 ** attempt)
+                print(f"[LLM_GATEWAY] {call_site} 调用失败（{e}），{wait:.1f}s 后重试 ({attempt + 1}/{max_retries})")
+                time.sleep(wait)
+
+    def record_usage(self, call_site: str, input_tokens: int, output_tokens: int):
+        """记录 token 用量并通知监听器（在调用方的 context 中执行）"""
+        with self._lock:
+            site = self._site(call_site)
+            site["input_tokens"] += input_tokens
+            site["output_tokens"] += output_tokens
+        for listener in self._usage_listeners:
+            listener(call_site, input_tokens, output_tokens)
+
+    def run(self, call_site: str, fn: Callable[[], Any], dedupe_key: Optional[str] = None,
+            usage: Optional[Callable[[Any], Tuple[int, int]]] = None, max_retries: Optional[int] = None,
+            timeout: Optional[float] = None) -> Any:
+        """
+        执行一次 LLM 相关调用
+        - dedupe_key 相同的并发调用合并为一次
+        - usage：从结果中取 (input_tokens, output_tokens)，用于链、Agent 等内部多次调用 LLM 的场景
+        - max_retries / timeout：默认使用网关配置；Agent 这类包含多次调用的整体调用不应重试，
+          超时重试会在第一次仍在运行时再跑一遍
+        """
+        leader = True
+        if dedupe_key is not None:
+            with self._lock:
+                future = self._inflight.get(dedupe_key)
+                if future is None:
+                    future = Future()
+                    self._inflight[dedupe_key] = future
+                else:
+                    leader = False
+                    self._site(call_site)["coalesced"] += 1
+            if not leader:
+                return future.result()
+
+        start = time.perf_counter()
+        try:
+            result = self._run_with_retry(call_site, fn,
+                                          self.max_retries if max_retries is None else max_retries,
+                                          self.timeout if timeout is None else timeout)
+        except Exception as e:
+            with self._lock:
+                site = self._site(call_site)
+                site["calls"] += 1
+                site["errors"] += 1
+                if dedupe_key is not None:
+                    self._inflight.pop(dedupe_key, None).set_exception(e)
+            raise
+
+        latency_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            site = self._site(call_site)
+            site["calls"] += 1
+            site["total_latency_ms"] += latency_ms
+            site["max_latency_ms"] = max(site["max_latency_ms"], latency_ms)
+            if dedupe_key is not None:
+                self._inflight.pop(dedupe_key, None).set_result(result)
+        if usage is not None:
+            input_tokens, output_tokens = usage(result)
+            self.record_usage(call_site, input_tokens, output_tokens)
+        return result
+
+    def invoke(self, llm, prompt: Any, call_site: str) -> str:
+        """调用聊天模型并返回文本内容；相同 prompt 的并发调用自动合并"""
+        dedupe_key = hashlib.sha256(
+            json.dumps([call_site, prompt], ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()
+
+        def call():
+            token = _in_leaf_call.set(True)
+            try:
+                response = llm.invoke(prompt)
+            finally:
+                _in_leaf_call.reset(token)
+            # token 只在真正发起请求的调用中统计，合并的调用不重复计数
+            input_tokens, output_tokens = token_usage(response)
+            if input_tokens is None:
+                input_tokens = count_tokens(
+                    prompt if isinstance(prompt, str) else json.dumps(prompt, ensure_ascii=False, default=str)
+                )
+            if output_tokens is None:
+                output_tokens = count_tokens(content_text(response))
+            self.record_usage(call_site, input_tokens, output_tokens)
+            return response
+
+        return content_text(self.run(call_site, call, dedupe_key=dedupe_key))
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def in_leaf_call() -> bool:
+    """链 / Agent 的用量回调据此跳过已由 invoke() 记录的调用，避免重复计数"""
+    return _in_leaf_call.get()
+
+
+def content_text(response) -> str:
+    content = response.content
+    if isinstance(content, list):
+        return "\n".join(str(x) for x in content)
+    return content if isinstance(content, str) else str(content)
+
+
+def token_usage(response) -> tuple:
+    """从 LangChain 的 AIMessage 中读取 token 用量（不同版本字段不同）"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        return usage.get("input_tokens"), usage.get("output_tokens")
+    metadata = getattr(response, "response_metadata", None) or {}
+    reported = metadata.get("token_usage") or {}
+    if reported:
+        return reported.get("input_tokens"), reported.get("output_tokens")
+    return None, None
+
+
+llm_gateway = LLMGateway()
@@ -0,0 +1,51 @@
+"""
+单个任务的内存上限检查
+
+解析子进程按页窗口、分析流水线按元素 / 分块批次处理大文件，每批结束后检查本任务新增的常驻内存
+（相对任务开始时的基线：进程池 worker 和 API / worker 进程都会被复用，之前残留的内存不计入），
+超出上限时调用方缩小窗口或批次，最小窗口仍超出则放弃
+"""
+import os
+
+from configs import PARSE_MEMORY_LIMIT_MB
+
+
+class ParseMemoryExceeded(Exception):
+    """最小窗口 / 批次仍超出内存上限"""
+
+
+def current_rss_mb() -> float:
+    """当前进程常驻内存（MB）；非 Linux 平台退化为峰值常驻内存"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS 上 ru_maxrss 单位为字节，Linux 上为 KB
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class MemoryGuard:
+    """记录任务开始时的常驻内存基线，按批次检查增量并给出下一批的大小"""
+
+    def __init__(self, label: str, limit_mb: int = PARSE_MEMORY_LIMIT_MB):
+        self.label = label
+        self.limit_mb = limit_mb
+        self.baseline_mb = current_rss_mb()
+
+    def used_mb(self) -> float:
+        return current_rss_mb() - self.baseline_mb
+
+    def next_size(self, size: int) -> int:
+        """本批结束后调用：未超出上限时保持 size，超出时减半；size 已为 1 仍超出时抛出 ParseMemoryExceeded"""
+        used = self.used_mb()
+        if not self.limit_mb or used <= self.limit_mb:
+            return size
+        if size <= 1:
+            raise ParseMemoryExceeded(
+                f"{self.label}: 最小批次下本任务常驻内存增量 {used:.0f}MB 仍超出上限 {self.limit_mb}MB")
+        size = max(1, size // 2)
+        print(f"[MEMORY] {self.label} 本任务常驻内存增量 {used:.0f}MB 超出上限 {self.limit_mb}MB，批次缩小为 {size}")
+        return size
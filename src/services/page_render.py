@@ -0,0 +1,32 @@
+import os
+
+from configs import DATA_DIR, PAGE_CACHE_MAX_BYTES
+from services.disk_cache import DiskLRUCache
+
+MIN_DPI = 36
+MAX_DPI = 300
+
+page_cache = DiskLRUCache(os.path.join(DATA_DIR, "cache", "pages"), PAGE_CACHE_MAX_BYTES)
+
+
+def page_count(pdf_path: str) -> int:
+    import pymupdf
+
+    with pymupdf.open(pdf_path) as pdf:
+        return pdf.page_count
+
+
+def render_page(pdf_path: str, content_hash: str, page_number: int, dpi: int) -> str:
+    """将单页渲染为 PNG 并写入 LRU 磁盘缓存，返回缓存文件路径（page_number 从 1 开始）"""
+    key = f"{content_hash}:{page_number}:{dpi}"
+    path = page_cache.get(key, ".png")
+    if path:
+        return path
+    import pymupdf
+
+    with pymupdf.open(pdf_path) as pdf:
+        if not 1 <= page_number <= pdf.page_count:
+            raise IndexError(f"Page {page_number} out of range (1-{pdf.page_count})")
+        zoom = dpi / 72
+        pixmap = pdf[page_number - 1].get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), alpha=False)
+        return page_cache.put(key, pixmap.tobytes("png"), ".png")
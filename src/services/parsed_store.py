@@ -0,0 +1,329 @@
+"""
+解析结果的紧凑二进制存储
+
+文件布局：
+    MAGIC(4) | VERSION(1) | INDEX_LEN(uint32, 大端) | INDEX | BLOCK...
+INDEX 为 msgpack 编码的 {key: [offset, length]}，offset 相对于数据区起点；
+每个 BLOCK 为 zlib 压缩后的 msgpack。读取时只解析头部和偏移表，
+按需 seek 到对应块解压，无需解码 full_text、表格元数据等其他内容。
+"""
+import os
+import json
+import shutil
+import struct
+import tempfile
+import zlib
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+import msgpack
+
+from configs import DATA_DIR
+
+OUTPUT_BASE_DIR = os.path.join(DATA_DIR, "parsed_results")
+PARSED_FILENAME = "parsed.epk"
+
+MAGIC = b"EPAR"
+VERSION = 1
+_HEADER = struct.Struct(">4sBI")
+
+# 顶层字段，各自一个块
+_SCALAR_KEYS = [
+    "title", "authors", "abstract", "references", "reference_pages",
+    "tables", "images", "formulas", "formula_pages", "full_text",
+]
+# 后来新增的顶层字段，旧文件中可能不存在
+_OPTIONAL_KEYS = ["bibliography"]
+# 字符串字段，缺失时默认为 ""；其余字段均为列表，缺失时默认为 []
+_TEXT_KEYS = {"title", "abstract", "full_text"}
+
+
+def parsed_path(paper_id: int) -> str:
+    return os.path.join(OUTPUT_BASE_DIR, f"paper_{paper_id}", PARSED_FILENAME)
+
+
+def _pack_block(value: Any) -> bytes:
+    return zlib.compress(msgpack.packb(value, use_bin_type=True), 6)
+
+
+def _unpack_block(data: bytes) -> Any:
+    return msgpack.unpackb(zlib.decompress(data), raw=False)
+
+
+class ParsedWriter:
+    """
+    增量写入解析结果：块依次追加到临时数据文件，只在内存中保留偏移表，
+    close() 时写出头部和偏移表并拼接数据区。流式解析时章节和全文边解析边写入，
+    全文按约 1MB 分成 full_text/{i} 多个块，读取 full_text 时再拼接
+    """
+
+    FULL_TEXT_BLOCK_CHARS = 1024 * 1024
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 临时文件名唯一，同一论文的两次写入（如重复分析）不会互相覆盖
+        fd, self._data_path = self._mkstemp(".data.tmp")
+        self._data = os.fdopen(fd, "wb")
+        self._tmp_path: Optional[str] = None
+        self._index: Dict[str, List[int]] = {}
+        self._offset = 0
+        self._section_titles: List[str] = []
+        self._text_parts: List[str] = []
+        self._text_chars = 0
+        self._text_blocks = 0
+
+    def _mkstemp(self, suffix: str):
+        return tempfile.mkstemp(dir=os.path.dirname(self.path), prefix=os.path.basename(self.path) + ".",
+                                suffix=suffix)
+
+    def add(self, key: str, value: Any):
+        data = _pack_block(value)
+        self._index[key] = [self._offset, len(data)]
+        self._data.write(data)
+        self._offset += len(data)
+
+    def add_section(self, section: Dict[str, Any]):
+        self.add(f"sections/{len(self._section_titles)}", section)
+        self._section_titles.append(section.get("title", ""))
+
+    def append_text(self, text: str):
+        self._text_parts.append(text)
+        self._text_chars += len(text)
+        if self._text_chars >= self.FULL_TEXT_BLOCK_CHARS:
+            self._flush_text()
+
+    def _flush_text(self):
+        if self._text_parts:
+            self.add(f"full_text/{self._text_blocks}", "\n\n".join(self._text_parts))
+            self._text_blocks += 1
+            self._text_parts, self._text_chars = [], 0
+
+    def close(self) -> str:
+        self._flush_text()
+        if not self._text_blocks and "full_text" not in self._index:
+            self.add("full_text", "")
+        # 章节标题单独成块，用于按标题定位章节
+        self.add("section_titles", self._section_titles)
+        self._data.close()
+
+        index_bytes = msgpack.packb(self._index, use_bin_type=True)
+        fd, self._tmp_path = self._mkstemp(".tmp")
+        with os.fdopen(fd, "wb") as f, open(self._data_path, "rb") as data:
+            f.write(_HEADER.pack(MAGIC, VERSION, len(index_bytes)))
+            f.write(index_bytes)
+            shutil.copyfileobj(data, f, 1024 * 1024)
+        # mkstemp 创建的文件权限为 0600，恢复为普通文件权限
+        os.chmod(self._tmp_path, 0o644)
+        os.replace(self._tmp_path, self.path)
+        os.remove(self._data_path)
+        return self.path
+
+    def abort(self):
+        self._data.close()
+        for path in (self._data_path, self._tmp_path):
+            if path and os.path.exists(path):
+                os.remove(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def write_parsed(result: Dict[str, Any], path: str) -> str:
+    """将 parse_pdf 的结果字典写为紧凑二进制文件"""
+    with ParsedWriter(path) as writer:
+        for key in _SCALAR_KEYS:
+            writer.add(key, result.get(key, "" if key in _TEXT_KEYS else []))
+        for key in _OPTIONAL_KEYS:
+            if key in result:
+                writer.add(key, result[key])
+        for section in result.get("sections", []):
+            writer.add_section(section)
+    return path
+
+
+class ParsedDocument:
+    """
+    按需读取解析结果：
+        with ParsedDocument.open(parsed_path(paper_id)) as doc:
+            doc.title, doc.abstract, doc.section("Method"), doc.references
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        magic, version, index_len = _HEADER.unpack(self._file.read(_HEADER.size))
+        if magic != MAGIC:
+            self._file.close()
+            raise ValueError(f"Not a parsed document: {path}")
+        if version != VERSION:
+            self._file.close()
+            raise ValueError(f"Unsupported parsed document version {version}: {path}")
+        self._index: Dict[str, List[int]] = msgpack.unpackb(self._file.read(index_len), raw=False)
+        self._data_start = _HEADER.size + index_len
+        self._cache: Dict[str, Any] = {}
+
+    @classmethod
+    def open(cls, path: str) -> "ParsedDocument":
+        return cls(path)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def keys(self) -> List[str]:
+        return list(self._index.keys())
+
+    def load(self, key: str) -> Any:
+        """读取单个块"""
+        if key in self._cache:
+            return self._cache[key]
+        if key == "full_text" and key not in self._index and "full_text/0" in self._index:
+            value = "\n\n".join(self.iter_full_text())
+            self._cache[key] = value
+            return value
+        if key not in self._index:
+            raise KeyError(key)
+        offset, length = self._index[key]
+        self._file.seek(self._data_start + offset)
+        value = _unpack_block(self._file.read(length))
+        self._cache[key] = value
+        return value
+
+    @property
+    def title(self) -> str:
+        return self.load("title")
+
+    @property
+    def authors(self) -> str:
+        return self.load("authors")
+
+    @property
+    def abstract(self) -> str:
+        return self.load("abstract")
+
+    @property
+    def references(self) -> List[str]:
+        return self.load("references")
+
+    @property
+    def bibliography(self) -> List[Dict[str, Any]]:
+        """结构化参考文献；旧文件没有该块时现场从 references 解析"""
+        if "bibliography" in self._index:
+            return self.load("bibliography")
+        from services.bibliography import parse_bibliography
+        return self._cache.setdefault("bibliography", parse_bibliography(self.references))
+
+    @property
+    def full_text(self) -> str:
+        return self.load("full_text")
+
+    def iter_full_text(self) -> Iterator[str]:
+        """逐块读取全文（流式写入的文件分为多个块），不在缓存中保留"""
+        if "full_text" in self._index:
+            yield self.load("full_text")
+            return
+        i = 0
+        while f"full_text/{i}" in self._index:
+            offset, length = self._index[f"full_text/{i}"]
+            self._file.seek(self._data_start + offset)
+            yield _unpack_block(self._file.read(length))
+            i += 1
+
+    @property
+    def streamed(self) -> bool:
+        """是否为流式解析写入的大文件（全文分为多个块）"""
+        return "full_text/0" in self._index
+
+    @property
+    def section_titles(self) -> List[str]:
+        return self.load("section_titles")
+
+    def iter_sections(self, indices: Optional[Iterable[int]] = None) -> Iterator[Dict[str, Any]]:
+        """逐个读取章节（默认全部，按顺序），不在缓存中保留，内存中只有当前章节"""
+        if indices is None:
+            indices = range(len(self.section_titles))
+        for i in indices:
+            offset, length = self._index[f"sections/{i}"]
+            self._file.seek(self._data_start + offset)
+            yield _unpack_block(self._file.read(length))
+
+    def section(self, key: Union[int, str]) -> Optional[Dict[str, Any]]:
+        """按序号或标题（不区分大小写，包含匹配）读取单个章节"""
+        if isinstance(key, int):
+            return self.load(f"sections/{key}") if f"sections/{key}" in self._index else None
+        needle = key.lower()
+        for i, title in enumerate(self.section_titles):
+            if needle in title.lower():
+                return self.load(f"sections/{i}")
+        return None
+
+    def sections(self) -> List[Dict[str, Any]]:
+        return [self.load(f"sections/{i}") for i in range(len(self.section_titles))]
+
+    def to_dict(self, include_bulk: bool = True) -> Dict[str, Any]:
+        """
+        完整还原为 parse_pdf 的结果字典
+        include_bulk=False 时不读取 sections / full_text，只带 section_titles 和 streamed 标记，
+        章节和全文由调用方通过 iter_sections / iter_full_text 逐块读取
+        """
+        keys = _SCALAR_KEYS if include_bulk else [key for key in _SCALAR_KEYS if key != "full_text"]
+        result = {key: self.load(key) for key in keys}
+        result["bibliography"] = self.bibliography
+        if include_bulk:
+            result["sections"] = self.sections()
+        else:
+            result["section_titles"] = self.section_titles
+            result["streamed"] = True
+        return result
+
+
+def convert_json_file(json_path: str, output_path: Optional[str] = None) -> str:
+    """将旧版 JSON 解析结果转换为二进制格式（默认写到同目录的 parsed.epk）"""
+    with open(json_path, "r", encoding="utf-8") as f:
+        result = json.load(f)
+    if output_path is None:
+        output_path = os.path.join(os.path.dirname(json_path), PARSED_FILENAME)
+    return write_parsed(result, output_path)
+
+
+def convert_all(base_dir: str = OUTPUT_BASE_DIR, remove_json: bool = False) -> int:
+    """批量转换 parsed_results/paper_*/ 下已有的 JSON 解析结果"""
+    converted = 0
+    for entry in sorted(os.listdir(base_dir)):
+        paper_dir = os.path.join(base_dir, entry)
+        if not entry.startswith("paper_") or not os.path.isdir(paper_dir):
+            continue
+        if os.path.exists(os.path.join(paper_dir, PARSED_FILENAME)):
+            continue
+        json_files = [name for name in os.listdir(paper_dir) if name.endswith(".json")]
+        if not json_files:
+            continue
+        json_path = os.path.join(paper_dir, json_files[0])
+        try:
+            convert_json_file(json_path)
+        except (OSError, ValueError) as e:
+            print(f"[PARSED_STORE] 转换失败 {json_path}: {e}")
+            continue
+        if remove_json:
+            os.remove(json_path)
+        converted += 1
+        print(f"[PARSED_STORE] 已转换 {json_path}")
+    return converted
+
+
+if __name__ == "__main__":
+    # 用法（在 src 目录下）：python -m services.parsed_store [--remove-json]
+    import sys
+    count = convert_all(remove_json="--remove-json" in sys.argv)
+    print(f"[PARSED_STORE] 共转换 {count} 个解析结果")
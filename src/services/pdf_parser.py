@@ -1,12 +1,166 @@
+import gc
 import os
-import json
-from typing import Dict, List, Any
+import re
+import tempfile
+from typing import Callable, Dict, List, Any, Optional
 from unstructured.partition.pdf import partition_pdf
 
-from configs import DATA_DIR
+from configs import DATA_DIR, STREAM_WINDOW_PAGES, PARSE_MEMORY_LIMIT_MB
+from services.bibliography import is_reference_heading, parse_bibliography
+from services.memory_guard import MemoryGuard, ParseMemoryExceeded, current_rss_mb  # noqa: F401  ParseMemoryExceeded 供调用方捕获
+from services.parsed_store import ParsedWriter, write_parsed, parsed_path
 OUTPUT_BASE_DIR = os.path.join(DATA_DIR, "parsed_results")
 os.makedirs(OUTPUT_BASE_DIR, exist_ok=True)
 
+
+def _partition(file_path: str):
+    # 使用unstructured解析PDF
+    return partition_pdf(
+        filename=file_path,
+        strategy="hi_res",  # 高分辨率策略，更好地识别表格和图像
+        infer_table_structure=True,  # 推断表格结构
+        # 不在解析阶段裁剪图像，只记录页码和坐标（metadata.coordinates），
+        # 图表截图由 /papers/{id}/figures 在首次请求时渲染并缓存
+        extract_images_in_pdf=False,
+    )
+
+
+class _ElementCollector:
+    """
+    逐个元素归类到结果字典：章节结束时交给 on_section，全文片段交给 on_text，
+    一次性解析时两者追加到列表，流式解析时直接写入 ParsedWriter
+    """
+
+    def __init__(self, parser: "PDFParser", on_section: Callable[[Dict[str, Any]], None],
+                 on_text: Callable[[str], None]):
+        self.parser = parser
+        self.on_section = on_section
+        self.on_text = on_text
+        # 流式解析时窗口内页码从 1 开始，加上窗口起始页还原为原文档页码
+        self.page_offset = 0
+        self.result = {
+            "title": "",
+            "authors": "",
+            "abstract": "",
+            "tables": [],
+            "images": [],
+            "formulas": [],
+            "references": [],
+            "reference_pages": [],  # 与 references 一一对应的页码
+            "bibliography": [],     # 由 references 解析出的结构化条目
+            "formula_pages": [],    # 与 formulas 一一对应的页码
+        }
+        self.current_section: Optional[Dict[str, Any]] = None
+        self.section_count = 0
+        self.in_references = False  # 进入参考文献区后，段落都归入 references
+        self.element_count = 0
+
+    def _start_section(self, title: str):
+        self._end_section()
+        self.current_section = {
+            "title": title,
+            "content": [],
+            "pages": []  # 与 content 一一对应的页码
+        }
+        self.section_count += 1
+
+    def _end_section(self):
+        if self.current_section is not None:
+            self.on_section(self.current_section)
+            self.current_section = None
+
+    def _metadata(self, element) -> Dict[str, Any]:
+        metadata = element.metadata.to_dict() if hasattr(element, 'metadata') else {}
+        if self.page_offset and metadata.get("page_number") is not None:
+            metadata["page_number"] += self.page_offset
+        return metadata
+
+    def add(self, element):
+        result = self.result
+        self.element_count += 1
+        element_type = str(type(element).__name__)
+        if hasattr(element, 'text'):
+            text = element.text.replace('- ', '')
+        else:
+            text = f"[{type(element).__name__}]"
+        page = getattr(getattr(element, 'metadata', None), 'page_number', None)
+        if page is not None:
+            page += self.page_offset
+
+        # 添加到全文
+        self.on_text(text + '\n')
+
+        # 参考文献区：以“References / 参考文献”标题为界，
+        # 区内的段落、列表项以及被误判为标题的条目都归入 references
+        if is_reference_heading(text):
+            self.in_references = True
+            return
+        if self.in_references and (element_type in ("NarrativeText", "ListItem", "Text")
+                                   or (element_type == "Title" and self.parser._is_reference(text))):
+            result["references"].append(text)
+            result["reference_pages"].append(page)
+            return
+
+        # 根据元素类型进行分类
+        if element_type == "Title":
+            self.in_references = False
+            if not result["title"]:  # 第一个标题作为论文标题
+                result["title"] = text
+            else:
+                # 其他标题作为章节标题
+                self._start_section(text)
+
+        elif element_type == "NarrativeText":
+            # 检查是否是摘要
+            if self.parser._is_abstract(text):
+                result["abstract"] = text
+            # 检查是否是作者信息
+            elif self.parser._is_authors(text):
+                result["authors"] = text
+            else:
+                # 普通段落文本；如果还没有章节，创建一个默认章节
+                if not self.current_section and not self.section_count:
+                    self._start_section("Introduction")
+                if self.current_section:
+                    self.current_section["content"].append(text)
+                    self.current_section["pages"].append(page)
+
+        elif element_type == "Table":
+            result["tables"].append({
+                "content": text,
+                "section": self.current_section["title"] if self.current_section else "",
+                "metadata": self._metadata(element)
+            })
+
+        elif element_type == "Image":
+            result["images"].append({
+                "content": text,
+                "section": self.current_section["title"] if self.current_section else "",
+                "metadata": self._metadata(element)
+            })
+
+        elif element_type == "Formula":
+            result["formulas"].append(text)
+            result["formula_pages"].append(page)
+
+        elif element_type == "ListItem":
+            if self.current_section:
+                self.current_section["content"].append(f"• {text}")
+                self.current_section["pages"].append(page)
+
+    def finish(self, file_path: str) -> Dict[str, Any]:
+        self._end_section()
+        result = self.result
+        result["bibliography"] = parse_bibliography(result["references"])
+        print(f"[PARSER] 参考文献 {len(result['bibliography'])} 条，"
+              f"其中带 DOI/arXiv 号 {sum(1 for e in result['bibliography'] if e['doi'] or e['arxiv_id'])} 条")
+
+        # 后处理：如果没有找到标题，使用文件名
+        if not result["title"]:
+            result["title"] = os.path.basename(file_path).replace('.pdf', '')
+        return result
+
+
 class PDFParser:
     def __init__(self):
         pass
@@ -19,112 +173,22 @@ class PDFParser:
             OUTPUT_DIR = os.path.join(OUTPUT_BASE_DIR, f"paper_{paper_id}")
             os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-            # 使用unstructured解析PDF
-            elements = partition_pdf(
-                filename=file_path,
-                strategy="hi_res",  # 高分辨率策略，更好地识别表格和图像
-                infer_table_structure=True,  # 推断表格结构
-                extract_images_in_pdf=True,  # 提取图像
-                extract_image_block_types=["Image", "Table"],  # 提取图像和表格
-                extract_image_block_output_dir=os.path.join(OUTPUT_DIR, "figures"),
-                extract_image_block_to_payload=False,
-            )
-
-            # 初始化结果字典
-            result = {
-                "title": "",
-                "authors": "",
-                "abstract": "",
-                "sections": [],
-                "tables": [],
-                "images": [],
-                "formulas": [],
-                "references": [],
-                "full_text": ""
-            }
+            elements = _partition(file_path)
 
             # 分析元素
-            current_section = None
-            full_text_parts = []
-
+            sections: List[Dict[str, Any]] = []
+            full_text_parts: List[str] = []
+            collector = _ElementCollector(self, sections.append, full_text_parts.append)
             for element in elements:
-                element_type = str(type(element).__name__)
-                if hasattr(element, 'text'):
-                    text = element.text.replace('- ', '')
-                else:
-                    text = f"[{type(element).__name__}]"
-
-                # 添加到全文
-                full_text_parts.append(text + '\n')
-
-                # 根据元素类型进行分类
-                if element_type == "Title":
-                    if not result["title"]:  # 第一个标题作为论文标题
-                        result["title"] = text
-                    else:
-                        # 其他标题作为章节标题
-                        current_section = {
-                            "title": text,
-                            "content": []
-                        }
-                        result["sections"].append(current_section)
-
-                elif element_type == "NarrativeText":
-                    # 检查是否是摘要
-                    if self._is_abstract(text):
-                        result["abstract"] = text
-                    # 检查是否是作者信息
-                    elif self._is_authors(text):
-                        result["authors"] = text
-                    # 检查是否是参考文献
-                    elif self._is_reference(text):
-                        result["references"].append(text)
-                    else:
-                        # 普通段落文本
-                        if current_section:
-                            current_section["content"].append(text)
-                        else:
-                            # 如果没有当前章节，创建一个默认章节
-                            if not result["sections"]:
-                                result["sections"].append({
-                                    "title": "Introduction",
-                                    "content": []
-                                })
-                                current_section = result["sections"][0]
-                            current_section["content"].append(text)
-
-                elif element_type == "Table":
-                    result["tables"].append({
-                        "content": text,
-                        "metadata": element.metadata.to_dict() if hasattr(element, 'metadata') else {}
-                    })
-
-                elif element_type == "Image":
-                    result["images"].append({
-                        "content": text,
-                        "metadata": element.metadata.to_dict() if hasattr(element, 'metadata') else {}
-                    })
-
-                elif element_type == "Formula":
-                    result["formulas"].append(text)
-
-                elif element_type == "ListItem":
-                    if current_section:
-                        current_section["content"].append(f"• {text}")
+                collector.add(element)
+            result = collector.finish(file_path)
+            result["sections"] = sections
 
             # 设置全文
             result["full_text"] = "\n\n".join(full_text_parts)
 
-            # 后处理：如果没有找到标题，使用文件名
-            if not result["title"]:
-                result["title"] = os.path.basename(file_path).replace('.pdf', '')
-
             print(f"[PARSER] PDF解析完毕: {len(full_text_parts)} 页, {len(result['full_text'])} 字符")
-            safe_title = result["title"].strip().replace(' ', '_').replace('/', '_').replace(':', '_').replace('"', '').replace(
-                '*', '').replace('?', '').replace('<', '').replace('>', '').replace('|', '')
-            save_path = os.path.join(OUTPUT_DIR, f"{safe_title}.json")
-            with open(save_path, "w", encoding="utf-8") as f:
-                json.dump(result, f, ensure_ascii=False, indent=4)
+            save_path = write_parsed(result, parsed_path(paper_id))
             print(f"[PARSER] 解析结果 result 已写入 {save_path}")
 
             return result
@@ -132,6 +196,60 @@ class PDFParser:
         except Exception as e:
             raise Exception(f"PDF parsing failed: {str(e)}")
 
+    def parse_pdf_streaming(self, paper_id: int, file_path: str,
+                            window_pages: int = STREAM_WINDOW_PAGES,
+                            memory_limit_mb: int = PARSE_MEMORY_LIMIT_MB) -> Dict[str, Any]:
+        """
+        大文件流式解析：按页窗口拆出子文档逐个解析，元素处理完即释放，
+        章节和全文边解析边写入 parsed.epk，内存中只保留当前窗口和当前章节。
+        每个窗口结束后检查本任务新增的常驻内存（相对任务开始时的基线，进程池 worker 会被复用，
+        之前任务残留的内存不计入），超过 memory_limit_mb 时窗口减半，单页窗口仍超出则放弃。
+        返回不含 sections / full_text 的轻量结果（完整内容从 parsed_store 按需读取）
+        """
+        import pymupdf
+
+        guard = MemoryGuard(f"paper_id={paper_id} 流式解析", memory_limit_mb)
+        save_path = parsed_path(paper_id)
+        writer = ParsedWriter(save_path)
+        collector = _ElementCollector(self, writer.add_section, writer.append_text)
+        try:
+            with pymupdf.open(file_path) as doc:
+                total_pages = doc.page_count
+            window = max(1, window_pages)
+            start = 0
+            with tempfile.TemporaryDirectory(prefix=f"parse_{paper_id}_") as tmp_dir:
+                while start < total_pages:
+                    end = min(start + window, total_pages)
+                    window_path = os.path.join(tmp_dir, f"pages_{start + 1}_{end}.pdf")
+                    with pymupdf.open(file_path) as src, pymupdf.open() as part:
+                        part.insert_pdf(src, from_page=start, to_page=end - 1)
+                        part.save(window_path)
+
+                    elements = _partition(window_path)
+                    collector.page_offset = start
+                    for element in elements:
+                        collector.add(element)
+                    del elements
+                    os.remove(window_path)
+                    gc.collect()
+
+                    print(f"[PARSER] paper_id={paper_id} 第 {start + 1}-{end}/{total_pages} 页已解析，"
+                          f"常驻内存 {current_rss_mb():.0f}MB（本任务 +{guard.used_mb():.0f}MB）")
+                    window = guard.next_size(window)
+                    start = end
+
+            result = collector.finish(file_path)
+            for key, value in result.items():
+                writer.add(key, value)
+            writer.close()
+            print(f"[PARSER] PDF流式解析完毕: {total_pages} 页, {collector.element_count} 个元素, "
+                  f"{collector.section_count} 个章节，已写入 {save_path}")
+            return {**result, "streamed": True, "pages": total_pages}
+
+        except Exception as e:
+            writer.abort()
+            raise Exception(f"PDF parsing failed: {str(e)}")
+
     def _is_abstract(self, text: str) -> bool:
         """判断是否是摘要"""
         text_lower = text.lower()[:20]
@@ -153,13 +271,9 @@ class PDFParser:
         return any(pattern in text_lower for pattern in author_patterns)
 
     def _is_reference(self, text: str) -> bool:
-        """判断是否是参考文献"""
-        text_lower = text.lower()
-        ref_patterns = [
-            'references', 'bibliography', '参考文献',
-            '[1]', '[2]', '[3]', '(1)', '(2)', '(3)'
-        ]
-        return any(pattern in text_lower for pattern in ref_patterns)
+        """参考文献区内的标题元素是否实为一条参考文献（带编号或年份），否则视为新章节"""
+        return bool(re.match(r"^\s*(\[\d{1,3}\]|\d{1,3}[.)]\s)", text)) \
+            or bool(re.search(r"(?<!\d)(19|20)\d{2}(?!\d)", text))
 
     def extract_key_sections(self, parsed_data: Dict[str, Any]) -> Dict[str, str]:
         """
@@ -0,0 +1,111 @@
+import json
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from sqlalchemy import delete, func, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from configs import PRECOMPUTE_MAX_ATTEMPTS, PRECOMPUTE_RETRY_BASE_SECONDS
+from models.paper import Paper, PaperArtifact, PrecomputeFailure
+from services.executors import embed_executor, llm_executor
+from services.intent_router import PRECOMPUTED_KINDS, precomputed_kind
+from services.warmup import create_ai_service
+
+
+async def delete_artifacts(db: AsyncSession, paper_id: int):
+    """论文重新解析时删除旧的预生成内容和失败记录（由调用方 commit）"""
+    await db.execute(delete(PaperArtifact).where(PaperArtifact.paper_id == paper_id))
+    await db.execute(delete(PrecomputeFailure).where(PrecomputeFailure.paper_id == paper_id))
+
+
+async def _record_failure(db: AsyncSession, paper_id: int, error: Exception):
+    """记录一次失败并计算下次重试时间（指数退避），立即提交，所有 worker 共享"""
+    failure = await db.get(PrecomputeFailure, paper_id)
+    if failure is None:
+        failure = PrecomputeFailure(paper_id=paper_id, attempts=0)
+        db.add(failure)
+    failure.attempts += 1
+    failure.last_error = str(error)[:1000]
+    failure.retry_after = datetime.utcnow() + timedelta(
+        seconds=PRECOMPUTE_RETRY_BASE_SECONDS * 2 ** (failure.attempts - 1))
+    try:
+        await db.commit()
+    except IntegrityError:
+        # 其他 worker 同时记录了该论文的失败
+        await db.rollback()
+        return
+    final = failure.attempts >= PRECOMPUTE_MAX_ATTEMPTS
+    print(f"[PRECOMPUTE] paper_id={paper_id} 第 {failure.attempts} 次失败，"
+          f"{'不再重试' if final else f'{failure.retry_after:%H:%M:%S} 后重试'}")
+
+
+async def get_precomputed(db: AsyncSession, paper: Paper, question: str) -> Optional[Dict[str, Any]]:
+    """问题命中预生成内容类型且已生成时返回 {answer, diagram}，否则返回 None"""
+    if paper.processing_status != 'completed':
+        return None
+    kind = precomputed_kind(question)
+    if kind is None:
+        return None
+    payload = (await db.execute(
+        select(PaperArtifact.payload).where(PaperArtifact.paper_id == paper.id, PaperArtifact.kind == kind)
+    )).scalar()
+    if payload is None:
+        return None
+    print(f"[PRECOMPUTE] paper_id={paper.id} 使用预生成内容 {kind}")
+    return json.loads(payload)
+
+
+async def next_paper(db: AsyncSession) -> Optional[Paper]:
+    """找一篇已完成分析、但预生成内容不全的论文"""
+    generated = (
+        select(PaperArtifact.paper_id)
+        .group_by(PaperArtifact.paper_id)
+        .having(func.count(PaperArtifact.id) >= len(PRECOMPUTED_KINDS))
+    )
+    # 失败过的论文在退避时间到达前、或失败次数达到上限后跳过
+    backing_off = select(PrecomputeFailure.paper_id).where(or_(
+        PrecomputeFailure.retry_after > datetime.utcnow(),
+        PrecomputeFailure.attempts >= PRECOMPUTE_MAX_ATTEMPTS,
+    ))
+    query = select(Paper).where(
+        Paper.processing_status == 'completed', Paper.id.not_in(generated), Paper.id.not_in(backing_off)
+    )
+    return (await db.execute(query.order_by(Paper.id.desc()).limit(1))).scalars().first()
+
+
+async def precompute_paper(db: AsyncSession, paper: Paper, should_yield: Callable[[], Awaitable[bool]]) -> int:
+    """
+    为一篇论文逐个生成缺少的预生成内容，每项生成后立即提交
+    每项开始前调用 should_yield，有正式任务等待时让出，剩余内容下次空闲时继续
+    返回本次生成的数量
+    """
+    existing = set((await db.execute(
+        select(PaperArtifact.kind).where(PaperArtifact.paper_id == paper.id)
+    )).scalars().all())
+    ai_service = None
+    generated = 0
+    for kind, (intent, question, topic) in PRECOMPUTED_KINDS.items():
+        if kind in existing:
+            continue
+        if await should_yield():
+            print(f"[PRECOMPUTE] 有新的分析任务，暂停预生成 paper_id={paper.id}")
+            break
+        if ai_service is None:
+            ai_service = await embed_executor.run(create_ai_service)
+        try:
+            result = await llm_executor.run(ai_service.fast_answer, question, paper, intent, topic)
+        except Exception as e:
+            print(f"[PRECOMPUTE] paper_id={paper.id} {kind} 生成失败: {e}")
+            await _record_failure(db, paper.id, e)
+            break
+        db.add(PaperArtifact(paper_id=paper.id, kind=kind, payload=json.dumps(result, ensure_ascii=False)))
+        try:
+            await db.commit()
+        except IntegrityError:
+            # 其他 worker 已生成同一项
+            await db.rollback()
+            continue
+        generated += 1
+        print(f"[PRECOMPUTE] paper_id={paper.id} 已生成 {kind}")
+    return generated
@@ -0,0 +1,177 @@
+import math
+import re
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional
+
+# 各分析阶段发送给 LLM 的内容 token 预算（不含固定的指令模板）
+STAGE_BUDGETS = {
+    "summary": 800,
+    "key_content": 3000,
+    "translation": 1500,
+    "terminology": 1500,
+    "research_context": 2500,
+}
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?。！？；;])\s+|\n+")
+_WORD = re.compile(r"[A-Za-z][A-Za-z\-]+|[一-鿿]")
+_STOPWORDS = {
+    "the", "a", "an", "of", "and", "or", "to", "in", "on", "for", "with", "by", "is", "are", "was", "were",
+    "be", "this", "that", "these", "those", "we", "our", "it", "its", "as", "at", "from", "which", "can",
+    "has", "have", "not", "but", "also", "such", "than", "into", "their", "they", "been", "more", "using",
+}
+# 提示贡献、方法、结论的句子加权
+_CUE_PHRASES = [
+    "we propose", "we present", "we introduce", "our method", "our approach", "contribution",
+    "we show", "results show", "outperform", "state-of-the-art", "in this paper", "we find",
+    "本文", "提出", "我们的方法", "贡献", "实验表明", "优于",
+]
+
+
+def _load_tokenizer() -> Optional[Callable[[str], int]]:
+    """优先使用通义千问的分词器（dashscope 内置，离线可用）"""
+    try:
+        from dashscope import get_tokenizer
+        tokenizer = get_tokenizer("qwen-turbo")
+        return lambda text: len(tokenizer.encode(text))
+    except Exception:
+        pass
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding("cl100k_base")
+        return lambda text: len(encoding.encode(text))
+    except Exception:
+        return None
+
+
+_tokenizer = _load_tokenizer()
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _tokenizer is not None:
+        return _tokenizer(text)
+    # 无分词器时的估算：中文约 1 字 1 token，英文约 4 字符 1 token
+    cjk = sum(1 for ch in text if "一" <= ch <= "鿿")
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def split_sentences(text: str) -> List[str]:
+    return [sentence.strip() for sentence in _SENTENCE_SPLIT.split(text or "") if sentence.strip()]
+
+
+def truncate_tokens(text: str, budget: int) -> str:
+    """按原文顺序截取到预算内：优先在句子边界处截断，单个句子就超出预算时在句内截断"""
+    if count_tokens(text) <= budget:
+        return text
+    chosen, used = [], 0
+    for sentence in split_sentences(text):
+        tokens = count_tokens(sentence)
+        if used + tokens > budget:
+            if not chosen:
+                # 二分查找预算内最长的前缀
+                low, high = 0, len(sentence)
+                while low < high:
+                    middle = (low + high + 1) // 2
+                    if count_tokens(sentence[:middle]) <= budget:
+                        low = middle
+                    else:
+                        high = middle - 1
+                chosen.append(sentence[:low])
+            break
+        chosen.append(sentence)
+        used += tokens
+    return " ".join(chosen)
+
+
+def _terms(text: str) -> List[str]:
+    return [word for word in (w.lower() for w in _WORD.findall(text)) if word not in _STOPWORDS]
+
+
+def select_salient(text: str, budget: int, focus: str = "") -> str:
+    """
+    在 token 预算内按显著性选取句子，并按原文顺序拼接
+    显著性 = 句子词项在全文中的归一化频率（TF） + 与 focus（如标题）的重合 + 提示短语 + 靠前位置
+    """
+    if count_tokens(text) <= budget:
+        return text
+
+    sentences = split_sentences(text)
+    if not sentences:
+        return ""
+    frequency = Counter(_terms(text))
+    max_frequency = max(frequency.values(), default=1)
+    focus_terms = set(_terms(focus))
+
+    scored, seen = [], set()
+    for position, sentence in enumerate(sentences):
+        terms = set(_terms(sentence))
+        # 跳过无实义词和重复句子（页眉、页脚等）
+        if not terms or sentence in seen:
+            continue
+        seen.add(sentence)
+        score = sum(frequency[term] / max_frequency for term in terms) / len(terms)
+        score += 0.5 * len(focus_terms & terms)
+        lower = sentence.lower()
+        score += 1.0 * sum(1 for cue in _CUE_PHRASES if cue in lower)
+        score += 0.5 / (1 + position)  # 开头的句子通常是概括
+        scored.append((score, position, sentence))
+
+    ranked = sorted(scored, reverse=True)
+    chosen, used = [], 0
+    for score, position, sentence in ranked:
+        tokens = count_tokens(sentence)
+        if used + tokens > budget:
+            continue
+        chosen.append((position, sentence))
+        used += tokens
+    if not chosen and ranked:
+        # 每个句子都超出预算（如未断句的长段落）时，截取最显著的句子，而不是返回空内容
+        return truncate_tokens(ranked[0][2], budget)
+    return " ".join(sentence for _, sentence in sorted(chosen))
+
+
+def select_salient_blocks(blocks: Iterable[str], budget: int, focus: str = "") -> str:
+    """
+    逐块选句（流式解析的大文件全文分为多个块）：每块先在预算内选句，再与已选内容合并后重新选取，
+    内存中只保留当前块和已选内容；词频只在块内和已选内容中统计，结果是整篇 select_salient 的近似
+    """
+    selected = ""
+    for block in blocks:
+        chosen = select_salient(block or "", budget, focus)
+        if chosen:
+            selected = select_salient(f"{selected} {chosen}" if selected else chosen, budget, focus)
+    return selected
+
+
+def fit_sections(sections: Dict[str, str], budget: int, focus: str = "") -> Dict[str, str]:
+    """
+    多个章节共享预算：先均分，短章节用不完的额度再分给长章节，
+    每个章节内部按显著性选句
+    """
+    sizes = {name: count_tokens(text or "") for name, text in sections.items()}
+    remaining = budget
+    allocation: Dict[str, int] = {}
+    pending = sorted(sizes, key=lambda name: sizes[name])
+    while pending:
+        share = remaining // len(pending)
+        name = pending.pop(0)
+        allocation[name] = min(sizes[name], share)
+        remaining -= allocation[name]
+    return {
+        name: select_salient(text or "", allocation[name], focus)
+        for name, text in sections.items()
+    }
+
+
+def fit_list(items: List[str], budget: int, separator: str = "; ") -> str:
+    """按原顺序取列表项直到用完预算（用于参考文献列表）"""
+    chosen, used = [], 0
+    separator_tokens = count_tokens(separator)
+    for item in items:
+        tokens = count_tokens(item) + separator_tokens
+        if used + tokens > budget:
+            break
+        chosen.append(item)
+        used += tokens
+    return separator.join(chosen)
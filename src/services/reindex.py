@@ -0,0 +1,100 @@
+"""
+后台重建过期的单篇论文向量索引
+
+用法（在 src 目录下）：
+    python -m services.reindex [--concurrency N] [--paper-id ID ...] [--force] [--dry-run] [--pause SECONDS]
+
+索引版本（分块器 + 向量模型）与当前配置不一致时，直接从已保存的解析结果（parsed.epk）和
+参考文献增强内容重新分块、向量化，不重新执行 LLM 分析阶段：
+- 新索引写入新目录，完成后原子切换（见 services.vector_index），重建期间问答继续使用旧索引
+- 同时最多重建 N 篇，可用 --pause 在两篇之间休眠，降低对在线服务的影响
+- 结束时清理超过保留时间的旧索引目录
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+from dotenv import load_dotenv, find_dotenv
+
+from models.db import SessionLocal
+from models.paper import Paper
+import models.user  # noqa: F401
+from services import vector_index
+from services.parsed_store import ParsedDocument, parsed_path
+
+
+def _fallback_extra_texts(ai_service, paper_id: int) -> List[str]:
+    """旧索引没有单独保存增强内容时，从旧索引中取回"""
+    store = ai_service._get_paper_store(paper_id)
+    if store is None:
+        return []
+    data = store._collection.get(where={"element_type": "reference_enrichment"}, include=["documents"])
+    return data.get("documents") or []
+
+
+def stale_papers(force: bool, paper_ids: Optional[List[int]]) -> List[Tuple[int, int]]:
+    """返回索引版本与当前分块器、向量模型配置不一致的论文 (paper_id, user_id)"""
+    from services.warmup import create_ai_service
+
+    ai_service = create_ai_service()
+    signature = ai_service.index_signature(ai_service.section_chunker.signature)
+    with SessionLocal() as db:
+        query = db.query(Paper.id, Paper.user_id).filter(Paper.processing_status == 'completed')
+        if paper_ids:
+            query = query.filter(Paper.id.in_(paper_ids))
+        papers = query.order_by(Paper.id).all()
+    # 已归档的索引在下次访问恢复后再重建
+    return [(paper_id, user_id) for paper_id, user_id in papers
+            if not vector_index.is_archived(paper_id) and (force or not vector_index.is_current(paper_id, signature))]
+
+
+def rebuild(paper_id: int, user_id: int, pause: float = 0.0) -> bool:
+    from services.warmup import create_ai_service
+
+    try:
+        doc = ParsedDocument.open(parsed_path(paper_id))
+    except OSError:
+        print(f"[REINDEX] paper_id={paper_id} 没有解析结果，跳过")
+        return False
+
+    with doc:
+        # 章节逐个读取、分块并写入索引，大文件不整体读入内存
+        parsed_data = doc.to_dict(include_bulk=False)
+        ai_service = create_ai_service()
+        extra_texts = vector_index.load_extra_texts(paper_id)
+        if extra_texts is None:
+            extra_texts = _fallback_extra_texts(ai_service, paper_id)
+        start = time.perf_counter()
+        ok = ai_service.setup_rag_from_parsed(parsed_data, extra_texts, paper_id, user_id, doc.iter_sections())
+    print(f"[REINDEX] paper_id={paper_id} {'完成' if ok else '失败'}，用时 {time.perf_counter() - start:.1f}s")
+    if pause:
+        time.sleep(pause)
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild stale vector indexes")
+    parser.add_argument("--concurrency", type=int, default=2)
+    parser.add_argument("--paper-id", type=int, action="append", dest="paper_ids")
+    parser.add_argument("--force", action="store_true", help="忽略版本，全部重建")
+    parser.add_argument("--dry-run", action="store_true", help="只列出需要重建的论文")
+    parser.add_argument("--pause", type=float, default=0.0, help="每篇重建后休眠的秒数")
+    args = parser.parse_args()
+
+    load_dotenv(find_dotenv())
+    papers = stale_papers(args.force, args.paper_ids)
+    print(f"[REINDEX] 需要重建 {len(papers)} 篇: {[paper_id for paper_id, _ in papers]}")
+    if args.dry_run:
+        return
+
+    with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as pool:
+        results = list(pool.map(lambda paper: rebuild(*paper, pause=args.pause), papers))
+    print(f"[REINDEX] 成功 {sum(results)} 篇，失败 {len(results) - sum(results)} 篇")
+
+    removed = vector_index.remove_all_retired()
+    print(f"[REINDEX] 已清理 {removed} 个过期的旧索引目录")
+
+
+if __name__ == "__main__":
+    main()
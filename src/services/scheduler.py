@@ -0,0 +1,194 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import math
+import time
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Deque, Dict, List, Tuple
+
+from configs import (
+    ANALYSIS_MAX_CONCURRENT_JOBS, LLM_MAX_CONCURRENCY,
+    USER_MAX_ACTIVE_JOBS, USER_TOKEN_QUOTA, USER_TOKEN_WINDOW_SECONDS,
+)
+from services.llm_gateway import llm_gateway
+
+# 优先级：数值越小越优先，交互式聊天先于后台分析
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+# 当前请求所属用户，用于把 LLM token 用量记到对应用户名下
+current_user_id: contextvars.ContextVar = contextvars.ContextVar("current_user_id", default=None)
+
+
+class QuotaExceeded(Exception):
+    """超出用户配额，由 main.py 中的异常处理转换为 429 + Retry-After"""
+
+    def __init__(self, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = max(1, int(retry_after))
+
+
+class FairScheduler:
+    """
+    按用户加权公平排队（WFQ）的异步准入控制：
+    - 总并发为 capacity，超出的请求排队
+    - 先按优先级，再按虚拟完成时间出队：同一用户连续提交的请求虚拟时间递增，
+      因此批量提交大量任务的用户不会饿死其他用户
+    """
+
+    def __init__(self, name: str, capacity: int):
+        self.name = name
+        self.capacity = capacity
+        self.active = 0
+        self._virtual_time = 0.0
+        self._last_finish: Dict[int, float] = defaultdict(float)
+        self._weights: Dict[int, float] = {}
+        self._waiters: List[Tuple[int, float, int, asyncio.Future, int]] = []
+        self._counter = itertools.count()
+
+    def set_weight(self, user_id: int, weight: float):
+        self._weights[user_id] = max(weight, 0.01)
+
+    def _tag(self, user_id: int, cost: float) -> float:
+        start = max(self._virtual_time, self._last_finish[user_id])
+        tag = start + cost / self._weights.get(user_id, 1.0)
+        self._last_finish[user_id] = tag
+        return tag
+
+    async def acquire(self, user_id: int, priority: int = PRIORITY_BACKGROUND, cost: float = 1.0):
+        tag = self._tag(user_id, cost)
+        if self.active < self.capacity and not self._waiters:
+            self.active += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, tag, next(self._counter), future, user_id))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # 名额已经分配但调用方被取消时，需要归还
+            if future.done() and not future.cancelled():
+                self.release()
+            else:
+                future.cancel()
+            raise
+
+    def release(self):
+        while self._waiters:
+            priority, tag, _, future, user_id = heapq.heappop(self._waiters)
+            if future.cancelled():
+                continue
+            # 名额直接转交给下一个等待者，active 不变
+            self._virtual_time = max(self._virtual_time, tag)
+            future.set_result(None)
+            return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self, user_id: int, priority: int = PRIORITY_BACKGROUND, cost: float = 1.0):
+        await self.acquire(user_id, priority, cost)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        waiting = [w for w in self._waiters if not w[3].cancelled()]
+        per_user: Dict[int, int] = defaultdict(int)
+        for waiter in waiting:
+            per_user[waiter[4]] += 1
+        return {
+            "name": self.name,
+            "capacity": self.capacity,
+            "active": self.active,
+            "waiting_interactive": sum(1 for w in waiting if w[0] == PRIORITY_INTERACTIVE),
+            "waiting_background": sum(1 for w in waiting if w[0] == PRIORITY_BACKGROUND),
+            "waiting_by_user": dict(per_user),
+        }
+
+
+class QuotaManager:
+    """每个用户的分析任务数配额和滑动窗口 token 配额"""
+
+    def __init__(self, max_active_jobs: int = USER_MAX_ACTIVE_JOBS, token_quota: int = USER_TOKEN_QUOTA,
+                 token_window_seconds: int = USER_TOKEN_WINDOW_SECONDS):
+        self.max_active_jobs = max_active_jobs
+        self.token_quota = token_quota
+        self.token_window_seconds = token_window_seconds
+        self._active_jobs: Dict[int, int] = defaultdict(int)
+        self._token_usage: Dict[int, Deque[Tuple[float, int]]] = defaultdict(deque)
+
+    def _prune(self, user_id: int, now: float) -> Deque[Tuple[float, int]]:
+        usage = self._token_usage[user_id]
+        while usage and usage[0][0] <= now - self.token_window_seconds:
+            usage.popleft()
+        return usage
+
+    def tokens_used(self, user_id: int) -> int:
+        return sum(tokens for _, tokens in self._prune(user_id, time.time()))
+
+    def record_tokens(self, user_id: int, tokens: int):
+        self._token_usage[user_id].append((time.time(), tokens))
+
+    def check_tokens(self, user_id: int):
+        now = time.time()
+        usage = self._prune(user_id, now)
+        used = sum(tokens for _, tokens in usage)
+        if used >= self.token_quota:
+            # 等到窗口内足够多的旧记录过期
+            excess, retry_after = used - self.token_quota, self.token_window_seconds
+            for timestamp, tokens in usage:
+                excess -= tokens
+                if excess < 0:
+                    retry_after = timestamp + self.token_window_seconds - now
+                    break
+            raise QuotaExceeded(
+                f"Token quota exceeded: {used}/{self.token_quota} tokens in the last {self.token_window_seconds}s",
+                math.ceil(retry_after),
+            )
+
+    @contextmanager
+    def job(self, user_id: int, retry_after: int = 30):
+        if self._active_jobs[user_id] >= self.max_active_jobs:
+            raise QuotaExceeded(
+                f"Too many analysis jobs: at most {self.max_active_jobs} queued or running per user",
+                retry_after,
+            )
+        self._active_jobs[user_id] += 1
+        try:
+            yield
+        finally:
+            self._active_jobs[user_id] -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active_jobs": {user_id: count for user_id, count in self._active_jobs.items() if count},
+            "tokens_used": {user_id: self.tokens_used(user_id) for user_id in list(self._token_usage)},
+            "token_quota": self.token_quota,
+        }
+
+
+# 分析任务：整体排队；LLM：交互式聊天与后台分析阶段共享并发名额，聊天优先
+job_scheduler = FairScheduler("analysis_jobs", ANALYSIS_MAX_CONCURRENT_JOBS)
+llm_scheduler = FairScheduler("llm", LLM_MAX_CONCURRENCY)
+quota_manager = QuotaManager()
+
+
+def _record_user_tokens(call_site: str, input_tokens: int, output_tokens: int):
+    user_id = current_user_id.get()
+    if user_id is not None:
+        quota_manager.record_tokens(user_id, input_tokens + output_tokens)
+
+
+llm_gateway.add_usage_listener(_record_user_tokens)
+
+
+def scheduler_stats() -> Dict[str, Any]:
+    return {
+        "analysis_jobs": job_scheduler.stats(),
+        "llm": llm_scheduler.stats(),
+        "quotas": quota_manager.stats(),
+    }
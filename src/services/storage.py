@@ -0,0 +1,338 @@
+"""
+论文产物的存储生命周期管理
+
+每篇论文的磁盘产物：上传的 PDF、解析结果（parsed_results/paper_{id}）、向量索引（chroma_db/paper_{id}）
+及其冷归档（archive/index/paper_{id}.tar.gz）。图表截图和页面图片在容量受限的 LRU 缓存中，只统计总量。
+
+- 用量：按论文记录在 paper_storage 表中，可按用户、按产物类型汇总
+- 配额：上传和分析前检查用户总用量，超出时抛出 StorageQuotaExceeded（main.py 转换为 413）
+- 删除：删除论文或用户时一并删除数据库记录和磁盘产物
+- 孤儿清理：数据库中已不存在的论文（或所属用户已删除）的产物
+- 冷归档：超过 INDEX_ARCHIVE_IDLE_DAYS 未访问的论文压缩归档其向量索引，下次问答时自动恢复
+
+用法（在 src 目录下）：
+    python -m services.storage report | cleanup [--apply] | archive [--idle-days N]
+"""
+import os
+import re
+import shutil
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from configs import DATA_DIR, USER_DISK_QUOTA_BYTES, INDEX_ARCHIVE_IDLE_DAYS, ORPHAN_GRACE_SECONDS
+from models.db import DB_PATH
+from models.job import AnalysisJob
+from models.paper import ChatSession, Paper, PaperArtifact, PaperElement, PrecomputeFailure
+from models.storage import PaperStorage
+from models.user import User
+from services import vector_index
+from services.answer_cache import answer_cache
+from services.executors import storage_executor
+from services.figures import figure_cache
+from services.library_search import remove_paper as remove_paper_from_library
+from services.page_render import page_cache
+from services.parsed_store import OUTPUT_BASE_DIR
+
+UPLOAD_DIR = os.path.join(DATA_DIR, "uploads")
+ARTIFACT_COLUMNS = {
+    "upload": "upload_bytes",
+    "parsed": "parsed_bytes",
+    "index": "index_bytes",
+    "index_archive": "archive_bytes",
+}
+# 访问时间的更新间隔，避免每次问答都写数据库
+TOUCH_INTERVAL = timedelta(hours=1)
+
+_PAPER_DIR_PATTERN = re.compile(r"^paper_(\d+)(\.tar\.gz)?$")
+
+
+class StorageQuotaExceeded(Exception):
+    """超出用户磁盘配额，由 main.py 中的异常处理转换为 413"""
+
+    def __init__(self, detail: str):
+        super().__init__(detail)
+        self.detail = detail
+
+
+# ======================== 磁盘统计（在 storage_executor 中执行） ========================
+def path_bytes(path: Optional[str]) -> int:
+    if not path or not os.path.exists(path):
+        return 0
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for directory, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(directory, name))
+            except OSError:
+                pass
+    return total
+
+
+def paper_paths(paper_id: int, file_path: Optional[str]) -> Dict[str, Optional[str]]:
+    return {
+        "upload": file_path,
+        "parsed": os.path.join(OUTPUT_BASE_DIR, f"paper_{paper_id}"),
+        "index": vector_index.paper_root(paper_id),
+        "index_archive": vector_index.archive_path(paper_id),
+    }
+
+
+def measure_paper(paper_id: int, file_path: Optional[str]) -> Dict[str, int]:
+    return {kind: path_bytes(path) for kind, path in paper_paths(paper_id, file_path).items()}
+
+
+def remove_paper_files(paper_id: int, file_path: Optional[str]):
+    for path in paper_paths(paper_id, file_path).values():
+        if not path or not os.path.exists(path):
+            continue
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
+    _remove_from_vector_library(paper_id)
+
+
+def _remove_from_vector_library(paper_id: int):
+    """从全库向量索引中删除论文分块（直接使用 chromadb 客户端，无需加载向量模型）"""
+    persist_directory = os.path.join(vector_index.CHROMA_DIR, "library")
+    if not os.path.isdir(persist_directory):
+        return
+    import chromadb
+
+    client = chromadb.PersistentClient(path=persist_directory)
+    try:
+        client.get_collection("library").delete(where={"paper_id": paper_id})
+    except Exception as e:
+        print(f"[STORAGE] 从全库向量索引删除 paper_id={paper_id} 失败: {e}")
+
+
+# ======================== 用量记录 ========================
+async def refresh_usage(db: AsyncSession, paper: Paper) -> PaperStorage:
+    """重新统计论文各类产物的大小（由调用方 commit）"""
+    sizes = await storage_executor.run(measure_paper, paper.id, paper.file_path)
+    record = await db.get(PaperStorage, paper.id)
+    if record is None:
+        record = PaperStorage(paper_id=paper.id, user_id=paper.user_id, last_accessed_at=datetime.utcnow())
+        db.add(record)
+    for kind, column in ARTIFACT_COLUMNS.items():
+        setattr(record, column, sizes[kind])
+    if not sizes["index_archive"]:
+        record.archived_at = None
+    return record
+
+
+async def touch(db: AsyncSession, paper_id: int):
+    """记录论文访问时间（最多每 TOUCH_INTERVAL 写一次）"""
+    record = await db.get(PaperStorage, paper_id)
+    now = datetime.utcnow()
+    if record is None or (record.last_accessed_at and now - record.last_accessed_at < TOUCH_INTERVAL):
+        return
+    record.last_accessed_at = now
+    # 问答时索引会从归档自动恢复
+    record.archived_at = None
+    await db.commit()
+
+
+def _total(record_or_row) -> int:
+    return sum(getattr(record_or_row, column) or 0 for column in ARTIFACT_COLUMNS.values())
+
+
+async def user_usage(db: AsyncSession, user_id: int) -> Dict[str, Any]:
+    row = (await db.execute(
+        select(*[func.coalesce(func.sum(getattr(PaperStorage, column)), 0).label(column)
+                 for column in ARTIFACT_COLUMNS.values()])
+        .where(PaperStorage.user_id == user_id)
+    )).one()
+    by_type = {kind: int(getattr(row, column)) for kind, column in ARTIFACT_COLUMNS.items()}
+    return {
+        "user_id": user_id,
+        "by_type": by_type,
+        "total_bytes": sum(by_type.values()),
+        "quota_bytes": USER_DISK_QUOTA_BYTES or None,
+    }
+
+
+async def check_disk_quota(db: AsyncSession, user_id: int, incoming_bytes: int = 0):
+    if not USER_DISK_QUOTA_BYTES:
+        return
+    usage = await user_usage(db, user_id)
+    if usage["total_bytes"] + incoming_bytes > USER_DISK_QUOTA_BYTES:
+        raise StorageQuotaExceeded(
+            f"Storage quota exceeded: {usage['total_bytes'] + incoming_bytes} of {USER_DISK_QUOTA_BYTES} bytes"
+        )
+
+
+async def usage_report(db: AsyncSession, refresh: bool = False) -> Dict[str, Any]:
+    """按产物类型和用户汇总磁盘用量；refresh 为 True 时先重新统计所有论文"""
+    if refresh:
+        for paper in (await db.execute(select(Paper))).scalars().all():
+            await refresh_usage(db, paper)
+        await db.commit()
+
+    records = (await db.execute(select(PaperStorage))).scalars().all()
+    by_type = {kind: sum(getattr(record, column) or 0 for record in records)
+               for kind, column in ARTIFACT_COLUMNS.items()}
+    by_type["figure_cache"] = figure_cache.stats()["bytes"]
+    by_type["page_cache"] = page_cache.stats()["bytes"]
+    by_type["database"] = await storage_executor.run(path_bytes, DB_PATH)
+
+    by_user: Dict[int, int] = {}
+    for record in records:
+        by_user[record.user_id] = by_user.get(record.user_id, 0) + _total(record)
+    return {
+        "by_type": by_type,
+        "by_user": by_user,
+        "total_bytes": sum(by_type.values()),
+        "papers": len(records),
+        "archived_papers": sum(1 for record in records if record.archived_at),
+    }
+
+
+# ======================== 删除 ========================
+async def delete_paper(db: AsyncSession, paper: Paper):
+    """删除论文的全部数据库记录并提交，再删除磁盘产物（失败时留给孤儿清理）"""
+    paper_id, file_path = paper.id, paper.file_path
+    for model in (PaperElement, ChatSession, PaperArtifact, PrecomputeFailure, AnalysisJob, PaperStorage):
+        await db.execute(delete(model).where(model.paper_id == paper_id))
+    await remove_paper_from_library(db, paper_id)
+    await db.delete(paper)
+    await db.commit()
+
+    answer_cache.invalidate(paper_id)
+    await storage_executor.run(remove_paper_files, paper_id, file_path)
+    print(f"[STORAGE] 已删除论文 paper_id={paper_id} 及其产物")
+
+
+async def delete_user_data(db: AsyncSession, user_id: int) -> int:
+    """删除用户的全部论文及其产物，以及该用户在其他论文下的聊天记录，返回删除的论文数"""
+    papers = (await db.execute(select(Paper).where(Paper.user_id == user_id))).scalars().all()
+    for paper in papers:
+        await delete_paper(db, paper)
+    await db.execute(delete(ChatSession).where(ChatSession.user_id == user_id))
+    await db.commit()
+    return len(papers)
+
+
+# ======================== 孤儿清理 ========================
+def _scan_orphan_files(known_ids: set, known_uploads: set) -> Dict[str, List[str]]:
+    cutoff = time.time() - ORPHAN_GRACE_SECONDS
+    orphans: Dict[str, List[str]] = {"upload": [], "parsed": [], "index": [], "index_archive": []}
+
+    def collect(kind: str, directory: str):
+        if not os.path.isdir(directory):
+            return
+        for entry in os.scandir(directory):
+            match = _PAPER_DIR_PATTERN.match(entry.name)
+            if match and int(match.group(1)) not in known_ids and entry.stat().st_mtime < cutoff:
+                orphans[kind].append(entry.path)
+
+    collect("parsed", OUTPUT_BASE_DIR)
+    collect("index", vector_index.CHROMA_DIR)
+    collect("index_archive", vector_index.ARCHIVE_DIR)
+    if os.path.isdir(UPLOAD_DIR):
+        for entry in os.scandir(UPLOAD_DIR):
+            if entry.is_file() and entry.name not in known_uploads and entry.stat().st_mtime < cutoff:
+                orphans["upload"].append(entry.path)
+    return orphans
+
+
+def _remove_paths(paths: List[str]) -> int:
+    freed = 0
+    for path in paths:
+        freed += path_bytes(path)
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.exists(path):
+            os.remove(path)
+    return freed
+
+
+async def cleanup_orphans(db: AsyncSession, dry_run: bool = True) -> Dict[str, Any]:
+    """
+    清理孤儿产物：
+    - 所属用户已不存在的论文（删除记录和产物）
+    - 磁盘上没有对应论文记录的上传文件、解析结果、索引和归档
+    dry_run 为 True 时只返回将被清理的内容
+    """
+    orphan_papers = (await db.execute(
+        select(Paper).where(Paper.user_id.not_in(select(User.id)))
+    )).scalars().all()
+    if not dry_run:
+        for paper in orphan_papers:
+            await delete_paper(db, paper)
+
+    papers = (await db.execute(select(Paper.id, Paper.file_path))).all()
+    known_ids = {paper_id for paper_id, _ in papers}
+    known_uploads = {os.path.basename(file_path) for _, file_path in papers if file_path}
+    orphan_files = await storage_executor.run(_scan_orphan_files, known_ids, known_uploads)
+
+    freed = 0
+    if not dry_run:
+        freed = await storage_executor.run(_remove_paths, [path for paths in orphan_files.values() for path in paths])
+        print(f"[STORAGE] 已清理 {len(orphan_papers)} 篇孤儿论文、"
+              f"{sum(len(paths) for paths in orphan_files.values())} 个孤儿产物，释放 {freed} bytes")
+    return {
+        "dry_run": dry_run,
+        "orphan_papers": [paper.id for paper in orphan_papers],
+        "orphan_files": orphan_files,
+        "freed_bytes": freed,
+    }
+
+
+# ======================== 冷归档 ========================
+async def archive_idle_indexes(db: AsyncSession, idle_days: int = INDEX_ARCHIVE_IDLE_DAYS) -> List[int]:
+    """将超过 idle_days 未访问的论文的向量索引压缩归档，返回归档的论文 id"""
+    cutoff = datetime.utcnow() - timedelta(days=idle_days)
+    records = (await db.execute(
+        select(PaperStorage).where(PaperStorage.last_accessed_at < cutoff, PaperStorage.archived_at.is_(None))
+    )).scalars().all()
+    archived = []
+    for record in records:
+        size = await storage_executor.run(vector_index.archive, record.paper_id)
+        if not size:
+            continue
+        record.index_bytes = 0
+        record.archive_bytes = size
+        record.archived_at = datetime.utcnow()
+        await db.commit()
+        archived.append(record.paper_id)
+    print(f"[STORAGE] 已归档 {len(archived)} 篇论文的向量索引（超过 {idle_days} 天未访问）")
+    return archived
+
+
+async def _main():
+    import argparse
+    import json
+
+    from dotenv import load_dotenv, find_dotenv
+
+    from models.db import AsyncSessionLocal, init_db
+
+    parser = argparse.ArgumentParser(description="Storage lifecycle manager")
+    parser.add_argument("command", choices=["report", "cleanup", "archive"])
+    parser.add_argument("--apply", action="store_true", help="cleanup 时实际删除（默认只列出）")
+    parser.add_argument("--idle-days", type=int, default=INDEX_ARCHIVE_IDLE_DAYS)
+    args = parser.parse_args()
+
+    load_dotenv(find_dotenv())
+    await init_db()
+    async with AsyncSessionLocal() as db:
+        if args.command == "report":
+            result = await usage_report(db, refresh=True)
+        elif args.command == "cleanup":
+            result = await cleanup_orphans(db, dry_run=not args.apply)
+        else:
+            result = await archive_idle_indexes(db, args.idle_days)
+    print(json.dumps(result, ensure_ascii=False, indent=2, default=str))
+    storage_executor.shutdown()
+
+
+if __name__ == "__main__":
+    import asyncio
+    asyncio.run(_main())
@@ -0,0 +1,232 @@
+"""
+单篇论文向量索引的版本管理
+
+每次构建写入新目录 chroma_db/paper_{id}/v{时间戳}-{版本标签}，构建完成后原子替换指针文件
+chroma_db/paper_{id}/CURRENT.json（写临时文件后 os.replace），读取方总是先解析指针：
+- 构建过程中旧索引照常提供检索
+- 指针中记录分块器和向量模型版本，与当前配置不一致即为过期索引，可由 services.reindex 后台重建
+- 被替换的旧目录记入 retired 列表，超过 INDEX_RETIRE_SECONDS 后删除
+旧版本（没有指针文件、直接在 paper_{id} 下的 Chroma 数据）视为未标记版本的过期索引
+
+长期未访问的索引可整体压缩为 archive/index/paper_{id}.tar.gz 并删除目录（见 services.storage），
+下次解析当前索引目录时自动解压恢复
+"""
+import hashlib
+import json
+import os
+import shutil
+import tarfile
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from configs import DATA_DIR, EMBEDDING_BACKEND, EMBEDDING_MODEL, INDEX_RETIRE_SECONDS
+
+CHROMA_DIR = os.path.join(DATA_DIR, "chroma_db")
+POINTER_FILENAME = "CURRENT.json"
+EXTRA_TEXTS_FILENAME = "rag_extra.json"
+# 旧布局的 Chroma 数据文件
+LEGACY_MARKER = "chroma.sqlite3"
+ARCHIVE_DIR = os.path.join(DATA_DIR, "archive", "index")
+
+_archive_locks: Dict[int, threading.Lock] = {}
+_archive_locks_guard = threading.Lock()
+
+
+def paper_root(paper_id: int) -> str:
+    return os.path.join(CHROMA_DIR, f"paper_{paper_id}")
+
+
+def embedding_signature(backend: str = EMBEDDING_BACKEND, model_name: str = EMBEDDING_MODEL) -> str:
+    return f"{backend}:{model_name}"
+
+
+def index_signature(chunker: str, embedding: Optional[str] = None) -> Dict[str, str]:
+    return {"chunker": chunker, "embedding": embedding or embedding_signature()}
+
+
+def signature_tag(signature: Dict[str, str]) -> str:
+    return hashlib.sha1(json.dumps(signature, sort_keys=True).encode("utf-8")).hexdigest()[:10]
+
+
+def read_pointer(paper_id: int) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(paper_root(paper_id), POINTER_FILENAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def _write_pointer(paper_id: int, pointer: Dict[str, Any]):
+    path = os.path.join(paper_root(paper_id), POINTER_FILENAME)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(pointer, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def current_index_dir(paper_id: int) -> Optional[str]:
+    """当前生效的索引目录（已归档时先解压恢复）；没有索引时返回 None"""
+    if not os.path.isdir(paper_root(paper_id)) and os.path.exists(archive_path(paper_id)):
+        rehydrate(paper_id)
+    pointer = read_pointer(paper_id)
+    if pointer is not None:
+        return os.path.join(paper_root(paper_id), pointer["directory"])
+    root = paper_root(paper_id)
+    if os.path.exists(os.path.join(root, LEGACY_MARKER)):
+        return root
+    return None
+
+
+def current_signature(paper_id: int) -> Optional[Dict[str, str]]:
+    pointer = read_pointer(paper_id)
+    return pointer.get("signature") if pointer else None
+
+
+def is_current(paper_id: int, signature: Dict[str, str]) -> bool:
+    return current_signature(paper_id) == signature
+
+
+def new_index_dir(paper_id: int, signature: Dict[str, str]) -> str:
+    """为一次构建分配新的目录（尚未生效）"""
+    name = f"v{int(time.time() * 1000)}-{signature_tag(signature)}-{uuid.uuid4().hex[:6]}"
+    directory = os.path.join(paper_root(paper_id), name)
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def commit_index(paper_id: int, directory: str, signature: Dict[str, str], chunks: int):
+    """原子地将新构建的目录设为当前索引，原索引目录记为待清理"""
+    previous = read_pointer(paper_id)
+    retired: List[Dict[str, Any]] = list(previous.get("retired", [])) if previous else []
+    if previous is not None:
+        retired.append({"directory": previous["directory"], "retired_at": time.time()})
+    _write_pointer(paper_id, {
+        "directory": os.path.basename(directory),
+        "signature": signature,
+        "chunks": chunks,
+        "built_at": time.time(),
+        "retired": retired,
+    })
+    print(f"[INDEX] paper_id={paper_id} 已切换到索引 {os.path.basename(directory)} {signature}")
+    # 重新构建后旧的归档不再有效
+    if os.path.exists(archive_path(paper_id)):
+        os.remove(archive_path(paper_id))
+
+
+def remove_retired(paper_id: int, retire_seconds: int = INDEX_RETIRE_SECONDS) -> int:
+    """删除超过保留时间的旧索引目录（包括旧布局的数据文件），返回删除的目录数"""
+    pointer = read_pointer(paper_id)
+    if pointer is None:
+        return 0
+    root = paper_root(paper_id)
+    now = time.time()
+    keep, removed = [], 0
+    for item in pointer.get("retired", []):
+        if item["directory"] == pointer["directory"]:
+            continue
+        if now - item["retired_at"] < retire_seconds:
+            keep.append(item)
+            continue
+        shutil.rmtree(os.path.join(root, item["directory"]), ignore_errors=True)
+        removed += 1
+    # 旧布局的数据文件在首次切换时一并清理
+    if os.path.exists(os.path.join(root, LEGACY_MARKER)) and now - pointer["built_at"] >= retire_seconds:
+        for entry in os.scandir(root):
+            if entry.name in (POINTER_FILENAME, EXTRA_TEXTS_FILENAME) or entry.name.startswith("v"):
+                continue
+            if entry.is_dir():
+                shutil.rmtree(entry.path, ignore_errors=True)
+            else:
+                os.remove(entry.path)
+        removed += 1
+    if removed:
+        _write_pointer(paper_id, {**pointer, "retired": keep})
+    return removed
+
+
+def remove_all_retired(retire_seconds: int = INDEX_RETIRE_SECONDS) -> int:
+    removed = 0
+    if os.path.isdir(CHROMA_DIR):
+        for entry in os.scandir(CHROMA_DIR):
+            if entry.is_dir() and entry.name.startswith("paper_") and entry.name[len("paper_"):].isdigit():
+                removed += remove_retired(int(entry.name[len("paper_"):]), retire_seconds)
+    return removed
+
+
+def save_extra_texts(paper_id: int, texts: List[str]):
+    """保存参考文献增强内容，重建索引时无需再调用 LLM / 外部接口"""
+    root = paper_root(paper_id)
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, EXTRA_TEXTS_FILENAME), "w", encoding="utf-8") as f:
+        json.dump(texts, f, ensure_ascii=False)
+
+
+def load_extra_texts(paper_id: int) -> Optional[List[str]]:
+    try:
+        with open(os.path.join(paper_root(paper_id), EXTRA_TEXTS_FILENAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+# ======================== 冷归档 ========================
+def archive_path(paper_id: int) -> str:
+    return os.path.join(ARCHIVE_DIR, f"paper_{paper_id}.tar.gz")
+
+
+def is_archived(paper_id: int) -> bool:
+    return os.path.exists(archive_path(paper_id)) and not os.path.isdir(paper_root(paper_id))
+
+
+def _paper_lock(paper_id: int) -> threading.Lock:
+    with _archive_locks_guard:
+        return _archive_locks.setdefault(paper_id, threading.Lock())
+
+
+def archive(paper_id: int) -> int:
+    """将论文的索引目录压缩归档并删除原目录（先清理全部旧版本目录），返回归档文件大小"""
+    root = paper_root(paper_id)
+    with _paper_lock(paper_id):
+        if not os.path.isdir(root):
+            return 0
+        remove_retired(paper_id, retire_seconds=0)
+        os.makedirs(ARCHIVE_DIR, exist_ok=True)
+        tmp_path = f"{archive_path(paper_id)}.{os.getpid()}.tmp"
+        with tarfile.open(tmp_path, "w:gz") as tar:
+            tar.add(root, arcname=os.path.basename(root))
+        os.replace(tmp_path, archive_path(paper_id))
+        shutil.rmtree(root, ignore_errors=True)
+        size = os.path.getsize(archive_path(paper_id))
+    print(f"[INDEX] paper_id={paper_id} 索引已归档（{size} bytes）")
+    return size
+
+
+def rehydrate(paper_id: int) -> bool:
+    """从归档恢复索引目录：先解压到临时目录再改名，其他进程并发恢复时只有一个生效"""
+    root = paper_root(paper_id)
+    with _paper_lock(paper_id):
+        if os.path.isdir(root):
+            return True
+        if not os.path.exists(archive_path(paper_id)):
+            return False
+        start = time.perf_counter()
+        tmp_dir = os.path.join(CHROMA_DIR, f".restore_{paper_id}_{uuid.uuid4().hex[:8]}")
+        try:
+            with tarfile.open(archive_path(paper_id), "r:gz") as tar:
+                tar.extractall(tmp_dir, filter="data")
+            try:
+                os.rename(os.path.join(tmp_dir, os.path.basename(root)), root)
+            except OSError:
+                # 其他进程已经恢复
+                if not os.path.isdir(root):
+                    raise
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        if os.path.exists(archive_path(paper_id)):
+            os.remove(archive_path(paper_id))
+    print(f"[INDEX] paper_id={paper_id} 已从归档恢复索引，用时 {time.perf_counter() - start:.2f}s")
+    return True
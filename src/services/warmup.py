@@ -0,0 +1,34 @@
+import importlib
+import time
+from typing import Dict, Iterable
+
+# 导入耗时较长的模块（LangChain / LangGraph / Chroma / sentence-transformers / unstructured / PyMuPDF），
+# 服务启动时不直接导入，首次使用时或由后台预热任务加载
+HEAVY_MODULES = (
+    "services.ai_service",
+    "services.embeddings",
+    "services.tools",
+    "services.pdf_parser",
+    "pymupdf",
+)
+
+
+def create_ai_service():
+    """在执行器线程中导入并构造 AIService，避免导入和模型加载阻塞事件循环"""
+    from services.ai_service import AIService
+    return AIService()
+
+
+def warm_up(modules: Iterable[str] = HEAVY_MODULES) -> Dict[str, float]:
+    """依次导入重量级模块，返回每个模块的导入耗时（秒）；导入失败只记录日志"""
+    timings: Dict[str, float] = {}
+    for name in modules:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            print(f"[WARMUP] {name} 导入失败: {e}")
+            continue
+        timings[name] = round(time.perf_counter() - start, 3)
+        print(f"[WARMUP] {name} 导入完成，用时 {timings[name]}s")
+    return timings
@@ -0,0 +1,222 @@
+"""
+独立的论文分析 worker，从数据库任务队列领取分析任务
+
+用法（在 src 目录下）：
+    python -m services.worker [--worker-id ID] [--concurrency N] [--recover-orphans]
+
+多个 worker 进程（可在多台共享 data 目录的机器上）可并行消费同一队列：
+- 领取：条件 UPDATE（仅当任务仍为 queued 或租约已过期）保证同一时刻只有一个 worker 持有任务
+- 心跳：定期延长租约；租约丢失时立即停止该任务
+- 阶段提交：每个阶段的结果与“阶段完成”标记在同一事务中写入，并校验 lease_owner，
+  因此某个阶段至多被提交一次；崩溃后其他 worker 在租约过期后接手，从下一个阶段继续
+- 回收：空闲时定期将用完重试次数的过期任务标记失败，并将没有活动任务的 processing 论文重新入队
+"""
+import argparse
+import asyncio
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+from dotenv import load_dotenv, find_dotenv
+from sqlalchemy import select, update
+
+from configs import JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS, JOB_POLL_SECONDS, PRECOMPUTE_ENABLED
+from models.db import AsyncSessionLocal, init_db
+from models.job import AnalysisJob
+from models.paper import Paper
+import models.user  # noqa: F401  确保建表时包含 users
+from services.analysis_pipeline import run_analysis_pipeline
+from services.job_queue import claim_order, claimable, fenced_update, reap_jobs
+from services.executors import shutdown_executors
+from services.precompute import next_paper, precompute_paper
+
+
+class LeaseLost(Exception):
+    pass
+
+
+class Worker:
+    def __init__(self, worker_id: str, concurrency: int = 1, lease_seconds: int = JOB_LEASE_SECONDS,
+                 poll_seconds: float = JOB_POLL_SECONDS):
+        self.worker_id = worker_id
+        self.concurrency = concurrency
+        self.lease = timedelta(seconds=lease_seconds)
+        self.poll_seconds = poll_seconds
+        self._stopping = False
+        # 同一时刻只有一个循环做空闲预生成
+        self._precompute_lock = asyncio.Lock()
+        self._last_reap = 0.0
+
+    async def claim(self) -> Optional[int]:
+        """领取一个任务，返回任务 id；没有可领取的任务时返回 None"""
+        async with AsyncSessionLocal() as db:
+            while True:
+                now = datetime.utcnow()
+                job_id = (await db.execute(
+                    select(AnalysisJob.id).where(claimable(now)).order_by(*claim_order(now)).limit(1)
+                )).scalar()
+                if job_id is None:
+                    return None
+                result = await db.execute(
+                    update(AnalysisJob)
+                    .where(AnalysisJob.id == job_id, claimable(now))
+                    .values(
+                        status='running',
+                        lease_owner=self.worker_id,
+                        lease_expires_at=now + self.lease,
+                        heartbeat_at=now,
+                        attempts=AnalysisJob.attempts + 1,
+                    )
+                )
+                await db.commit()
+                if result.rowcount == 1:
+                    return job_id
+                # 被其他 worker 抢先领取，继续找下一个
+
+    async def _fenced_update(self, db, job_id: int, **values) -> bool:
+        """仅当租约仍属于本 worker 时更新任务（并顺带续约）"""
+        return await fenced_update(db, job_id, self.worker_id, self.lease, **values)
+
+    async def reap(self, force: bool = False):
+        """每个租约周期至多执行一次中断任务回收"""
+        if not force and time.monotonic() - self._last_reap < self.lease.total_seconds():
+            return
+        self._last_reap = time.monotonic()
+        await reap_jobs()
+
+    async def _heartbeat(self, job_id: int, task: asyncio.Task):
+        while not task.done():
+            await asyncio.sleep(self.lease.total_seconds() / 3)
+            async with AsyncSessionLocal() as db:
+                alive = await self._fenced_update(db, job_id)
+                await db.commit()
+            if not alive:
+                print(f"[WORKER] job={job_id} 租约已丢失，停止执行")
+                task.cancel()
+                return
+
+    async def run_job(self, job_id: int):
+        async with AsyncSessionLocal() as db:
+            job = await db.get(AnalysisJob, job_id)
+            # rollback 后 ORM 对象会过期，异步会话中不能再隐式加载，先取出需要的字段
+            paper_id, attempts, completed_stage = job.paper_id, job.attempts, job.stage
+            paper = await db.get(Paper, paper_id)
+            print(f"[WORKER] {self.worker_id} 开始 job={job_id} paper_id={paper_id} "
+                  f"attempt={attempts} resume_after={completed_stage}")
+
+            if paper is None:
+                await self._fenced_update(db, job_id, status='failed', error="Paper not found")
+                await db.commit()
+                return
+
+            async def on_stage_done(stage: str):
+                # 阶段结果与阶段标记同一事务提交；租约已不属于本 worker 时回滚
+                if not await self._fenced_update(db, job_id, stage=stage):
+                    await db.rollback()
+                    raise LeaseLost(stage)
+                await db.commit()
+
+            try:
+                paper.processing_status = 'processing'
+                if not await self._fenced_update(db, job_id):
+                    await db.rollback()
+                    raise LeaseLost("start")
+                await db.commit()
+
+                await run_analysis_pipeline(paper, db, completed_stage=completed_stage, on_stage_done=on_stage_done)
+
+                if await self._fenced_update(db, job_id, status='completed', error=None):
+                    await db.commit()
+                    print(f"[WORKER] job={job_id} paper_id={paper_id} 分析完成")
+
+            except (LeaseLost, asyncio.CancelledError):
+                await db.rollback()
+                print(f"[WORKER] job={job_id} 放弃执行（租约丢失或 worker 退出）")
+                raise
+
+            except Exception as e:
+                await db.rollback()
+                final = attempts >= JOB_MAX_ATTEMPTS
+                if final:
+                    paper.processing_status = 'failed'
+                # 未达到最大次数则重新入队，由任意 worker 从已完成阶段之后继续
+                await self._fenced_update(db, job_id, status='failed' if final else 'queued',
+                                          error=str(e), lease_owner=None)
+                await db.commit()
+                print(f"[WORKER] job={job_id} 失败（{'不再重试' if final else '已重新入队'}）: {e}")
+
+    async def _run_with_heartbeat(self, job_id: int):
+        task = asyncio.create_task(self.run_job(job_id))
+        heartbeat = asyncio.create_task(self._heartbeat(job_id, task))
+        try:
+            await task
+        except (LeaseLost, asyncio.CancelledError):
+            pass
+        finally:
+            heartbeat.cancel()
+
+    async def _job_waiting(self) -> bool:
+        async with AsyncSessionLocal() as db:
+            job_id = (await db.execute(
+                select(AnalysisJob.id).where(claimable(datetime.utcnow())).limit(1)
+            )).scalar()
+        return job_id is not None
+
+    async def precompute_idle(self) -> bool:
+        """
+        空闲时为一篇论文预生成常用图表和回答（低优先级）；有任务等待时随时让出
+        返回是否处理了论文（没有需要预生成的论文时返回 False，由调用方休眠）
+        """
+        if self._precompute_lock.locked():
+            return False
+        async with self._precompute_lock:
+            async with AsyncSessionLocal() as db:
+                paper = await next_paper(db)
+                if paper is None:
+                    return False
+                await precompute_paper(db, paper, self._job_waiting)
+                return True
+
+    async def _loop(self):
+        while not self._stopping:
+            job_id = await self.claim()
+            if job_id is None:
+                await self.reap()
+                if PRECOMPUTE_ENABLED and await self.precompute_idle():
+                    continue
+                await asyncio.sleep(self.poll_seconds)
+                continue
+            await self._run_with_heartbeat(job_id)
+
+    async def run(self):
+        print(f"[WORKER] {self.worker_id} 启动，并发 {self.concurrency}，租约 {self.lease.total_seconds():.0f}s")
+        await asyncio.gather(*[self._loop() for _ in range(self.concurrency)])
+
+    def stop(self):
+        self._stopping = True
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Essay analysis worker")
+    parser.add_argument("--worker-id", default=f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--recover-orphans", action="store_true",
+                        help="启动时立即回收中断的任务（之后空闲时也会定期自动回收）")
+    args = parser.parse_args()
+
+    load_dotenv(find_dotenv())
+    await init_db()
+    worker = Worker(args.worker_id, concurrency=args.concurrency)
+    if args.recover_orphans:
+        await worker.reap(force=True)
+    try:
+        await worker.run()
+    finally:
+        shutdown_executors()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())